@@ -1,32 +1,61 @@
 """
 Обработчики админ-панели ParkingBot
 """
+import asyncio
+import html
+import json
 import logging
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 import database as db
+import occupancy
+from admin_sessions import IsAdmin, get_session, start_session
 from keyboards import (
     get_main_menu_keyboard, get_admin_menu_keyboard,
     get_users_pagination_keyboard, get_user_admin_actions_keyboard,
-    get_admin_spots_keyboard, get_cancel_keyboard
+    get_admin_spots_keyboard, get_cancel_keyboard, get_admin_logs_keyboard,
+    get_analytics_keyboard, LOG_ACTION_LABELS
 )
-from utils import mask_card, format_datetime
-from config import ADMIN_PASSWORD
+from utils import mask_card, format_datetime, format_slot_cursor, parse_slot_cursor
+from config import ADMIN_PASSWORD, BANKS, EXPORT_MAX_BYTES, IMPORT_MAX_BYTES, IMPORT_MAX_ERRORS_SHOWN, OCCUPANCY_DAYS
+from exports import EXPORT_KINDS, build_export
+from imports import IMPORT_COLUMNS, ImportFileError, import_csv
+from throttling import get_throttle_stats
+from search_cache import get_search_cache_stats
+from slow_queries import get_top_slow_queries
 
 logger = logging.getLogger(__name__)
-router = Router()
+router = Router(name="admin")
+# Панель - только с ролью admin и действующей сессией; фильтр передаёт хендлерам admin
+panel_router = Router(name="admin_panel")
+panel_router.message.filter(IsAdmin())
+panel_router.callback_query.filter(IsAdmin())
+# Не прошедшие фильтр получают объяснение вместо тишины
+denied_router = Router(name="admin_denied")
+router.include_router(panel_router)
+router.include_router(denied_router)
 
 USERS_PER_PAGE = 10
+LOGS_PER_PAGE = 10
+
+# Ключи текстового фильтра журнала -> параметры db.get_admin_logs
+LOG_FILTER_KEYS = {'user': 'user_id', 'spot': 'spot_id', 'booking': 'booking_id',
+                   'с': 'date_from', 'from': 'date_from', 'по': 'date_to', 'to': 'date_to'}
 
 
 class AdminStates(StatesGroup):
     waiting_password = State()
     waiting_broadcast_message = State()
+    viewing_logs = State()
+    waiting_log_filters = State()
+    waiting_import_file = State()
 
 
 @router.message(Command("admin"))
@@ -36,10 +65,7 @@ async def cmd_admin(message: Message, state: FSMContext):
         await message.answer("❌ Сначала зарегистрируйтесь: /start")
         return
     
-    session = db.get_admin_session(message.from_user.id)
-    
-    if session or user['role'] == 'admin':
-        db.update_admin_session_activity(message.from_user.id)
+    if user['role'] == 'admin' and await get_session(message.from_user.id):
         await message.answer("⚙️ <b>Админ-панель</b>", reply_markup=get_admin_menu_keyboard(), parse_mode="HTML")
     else:
         await message.answer("🔐 <b>Вход в админ-панель</b>\n\nВведите пароль:", reply_markup=get_cancel_keyboard(), parse_mode="HTML")
@@ -58,31 +84,22 @@ async def process_admin_password(message: Message, state: FSMContext):
     if message.text == ADMIN_PASSWORD:
         user = db.get_user_by_telegram_id(message.from_user.id)
         if user['role'] != 'admin':
-            db.set_user_role(user['id'], 'admin')
-        db.create_admin_session(user['id'], message.from_user.id)
+            await db.write(db.set_user_role, user['id'], 'admin')
+        await start_session(user['id'], message.from_user.id)
         await state.clear()
         await message.answer("✅ <b>Вход выполнен!</b>\n\n⚙️ <b>Админ-панель</b>", reply_markup=get_admin_menu_keyboard(), parse_mode="HTML")
-        db.log_admin_action('admin_login', user_id=user['id'])
+        await db.write(db.log_admin_action, 'admin_login', user_id=user['id'])
     else:
         await message.answer("❌ Неверный пароль. Попробуйте снова:")
 
 
-@router.message(F.text == "⚙️ Админ-панель")
+@panel_router.message(F.text == "⚙️ Админ-панель")
 async def admin_panel(message: Message, state: FSMContext):
-    user = db.get_user_by_telegram_id(message.from_user.id)
-    if not user or user['role'] != 'admin':
-        await message.answer("❌ У вас нет прав администратора.")
-        return
-    db.update_admin_session_activity(message.from_user.id)
     await message.answer("⚙️ <b>Админ-панель</b>", reply_markup=get_admin_menu_keyboard(), parse_mode="HTML")
 
 
-@router.message(F.text == "👥 Пользователи")
+@panel_router.message(F.text == "👥 Пользователи")
 async def show_users_list(message: Message, state: FSMContext):
-    user = db.get_user_by_telegram_id(message.from_user.id)
-    if not user or user['role'] != 'admin':
-        await message.answer("❌ У вас нет прав администратора.")
-        return
     await show_users_page(message, 0)
 
 
@@ -98,22 +115,17 @@ async def show_users_page(message_or_callback, page: int):
         await message_or_callback.message.edit_text(text, reply_markup=get_users_pagination_keyboard(users, page, total_pages), parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith("users_page_"))
+@panel_router.callback_query(F.data.startswith("users_page_"))
 async def users_pagination(callback: CallbackQuery, state: FSMContext):
     page = int(callback.data.replace("users_page_", ""))
     await show_users_page(callback, page)
 
 
-@router.callback_query(F.data.startswith("admin_user_"))
+@panel_router.callback_query(F.data.startswith("admin_user_"))
 async def show_user_details(callback: CallbackQuery, state: FSMContext):
     user_id = int(callback.data.replace("admin_user_", ""))
     
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        user = dict(row) if row else None
-    
+    user = db.get_user_by_id(user_id)
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
@@ -121,6 +133,8 @@ async def show_user_details(callback: CallbackQuery, state: FSMContext):
     stats = db.get_user_statistics(user_id)
     role_text = {'user': '👤 Пользователь', 'supplier': '🏠 Поставщик', 'admin': '👑 Администратор'}.get(user['role'], '👤')
     status_text = "✅ Активен" if user['is_active'] else "🚫 Заблокирован"
+    if user['telegram_id'] is None:
+        status_text += " · 📥 импортирован, в бот ещё не заходил"
     created = datetime.fromisoformat(user['created_at']) if user['created_at'] else datetime.now()
     
     await callback.message.edit_text(
@@ -143,75 +157,61 @@ async def show_user_details(callback: CallbackQuery, state: FSMContext):
     )
 
 
-@router.callback_query(F.data.startswith("make_admin_"))
+@panel_router.callback_query(F.data.startswith("make_admin_"))
 async def make_admin(callback: CallbackQuery, state: FSMContext):
     user_id = int(callback.data.replace("make_admin_", ""))
-    db.set_user_role(user_id, 'admin')
+    user = await db.write(db.set_user_role, user_id, 'admin')
+    if not user:
+        await callback.answer("❌ Пользователь не найден", show_alert=True)
+        return
     await callback.answer("✅ Пользователь стал администратором")
-    
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = dict(cursor.fetchone())
-    
     await callback.message.edit_reply_markup(reply_markup=get_user_admin_actions_keyboard(user_id, user))
 
 
-@router.callback_query(F.data.startswith("remove_admin_"))
-async def remove_admin(callback: CallbackQuery, state: FSMContext):
+@panel_router.callback_query(F.data.startswith("remove_admin_"))
+async def remove_admin(callback: CallbackQuery, state: FSMContext, admin: Dict[str, Any]):
     user_id = int(callback.data.replace("remove_admin_", ""))
-    current_user = db.get_user_by_telegram_id(callback.from_user.id)
     
-    if current_user['id'] == user_id:
+    if admin['id'] == user_id:
         await callback.answer("❌ Нельзя снять права у себя", show_alert=True)
         return
     
-    db.set_user_role(user_id, 'user')
+    user = await db.write(db.set_user_role, user_id, 'user')
+    if not user:
+        await callback.answer("❌ Пользователь не найден", show_alert=True)
+        return
     await callback.answer("✅ Права администратора сняты")
-    
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = dict(cursor.fetchone())
-    
     await callback.message.edit_reply_markup(reply_markup=get_user_admin_actions_keyboard(user_id, user))
 
 
-@router.callback_query(F.data.startswith("block_user_"))
-async def block_user(callback: CallbackQuery, state: FSMContext):
+@panel_router.callback_query(F.data.startswith("block_user_"))
+async def block_user(callback: CallbackQuery, state: FSMContext, admin: Dict[str, Any]):
     user_id = int(callback.data.replace("block_user_", ""))
-    current_user = db.get_user_by_telegram_id(callback.from_user.id)
     
-    if current_user['id'] == user_id:
+    if admin['id'] == user_id:
         await callback.answer("❌ Нельзя заблокировать себя", show_alert=True)
         return
     
-    db.block_user(user_id)
+    user = await db.write(db.block_user, user_id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден", show_alert=True)
+        return
     await callback.answer("✅ Пользователь заблокирован")
-    
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = dict(cursor.fetchone())
-    
     await callback.message.edit_reply_markup(reply_markup=get_user_admin_actions_keyboard(user_id, user))
 
 
-@router.callback_query(F.data.startswith("unblock_user_"))
+@panel_router.callback_query(F.data.startswith("unblock_user_"))
 async def unblock_user(callback: CallbackQuery, state: FSMContext):
     user_id = int(callback.data.replace("unblock_user_", ""))
-    db.unblock_user(user_id)
+    user = await db.write(db.unblock_user, user_id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден", show_alert=True)
+        return
     await callback.answer("✅ Пользователь разблокирован")
-    
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = dict(cursor.fetchone())
-    
     await callback.message.edit_reply_markup(reply_markup=get_user_admin_actions_keyboard(user_id, user))
 
 
-@router.callback_query(F.data.startswith("user_stats_"))
+@panel_router.callback_query(F.data.startswith("user_stats_"))
 async def show_user_stats(callback: CallbackQuery, state: FSMContext):
     user_id = int(callback.data.replace("user_stats_", ""))
     stats = db.get_user_statistics(user_id)
@@ -224,13 +224,8 @@ async def show_user_stats(callback: CallbackQuery, state: FSMContext):
     )
 
 
-@router.message(F.text == "🏠 Все места")
+@panel_router.message(F.text == "🏠 Все места")
 async def show_all_spots(message: Message, state: FSMContext):
-    user = db.get_user_by_telegram_id(message.from_user.id)
-    if not user or user['role'] != 'admin':
-        await message.answer("❌ У вас нет прав администратора.")
-        return
-    
     spots = db.get_all_spots()
     
     if not spots:
@@ -239,7 +234,7 @@ async def show_all_spots(message: Message, state: FSMContext):
         await message.answer(f"🏠 <b>Все места</b>\n\nВсего: {len(spots)}", reply_markup=get_admin_spots_keyboard(spots), parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith("admin_spot_"))
+@panel_router.callback_query(F.data.startswith("admin_spot_"))
 async def show_admin_spot_details(callback: CallbackQuery, state: FSMContext):
     spot_id = int(callback.data.replace("admin_spot_", ""))
     spot = db.get_spot_by_id(spot_id)
@@ -248,11 +243,7 @@ async def show_admin_spot_details(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Место не найдено", show_alert=True)
         return
     
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT full_name, phone FROM users WHERE id = ?', (spot['supplier_id'],))
-        supplier = dict(cursor.fetchone())
-    
+    supplier = db.get_user_by_id(spot['supplier_id'])
     availabilities = db.get_spot_availabilities(spot_id)
     avail_text = ""
     if availabilities:
@@ -276,17 +267,30 @@ async def show_admin_spot_details(callback: CallbackQuery, state: FSMContext):
     )
 
 
-@router.message(F.text == "📊 Статистика")
+def _tenants_summary(by_tenant: Dict[str, Dict[str, Any]]) -> str:
+    """Блок статистики по всем ЖК: строка на ЖК и итог"""
+    lines = ["<b>🏘 Все ЖК:</b>"]
+    for code, stats in by_tenant.items():
+        lines.append(f"• {html.escape(db.tenant_name(code))}: 👥 {stats['total_users']}, "
+                     f"🏠 {stats['total_spots']}, 📋 {stats['total_bookings']}, 💰 {stats['total_revenue']}₽")
+    totals = {key: sum(stats[key] for stats in by_tenant.values())
+              for key in ('total_users', 'total_spots', 'total_bookings', 'total_revenue')}
+    lines.append(f"• <b>Итого</b>: 👥 {totals['total_users']}, 🏠 {totals['total_spots']}, "
+                 f"📋 {totals['total_bookings']}, 💰 {totals['total_revenue']}₽")
+    return "\n".join(lines) + "\n\n"
+
+
+@panel_router.message(F.text == "📊 Статистика")
 async def show_statistics(message: Message, state: FSMContext):
-    user = db.get_user_by_telegram_id(message.from_user.id)
-    if not user or user['role'] != 'admin':
-        await message.answer("❌ У вас нет прав администратора.")
-        return
-    
-    stats = db.get_statistics()
+    # Базы всех ЖК опрашиваются параллельно; своя - та же выборка
+    by_tenant = await asyncio.to_thread(db.fan_out, db.get_statistics)
+    stats = by_tenant[db.get_tenant()]
+    throttle = get_throttle_stats()
+    search = get_search_cache_stats()
+    title = f"Статистика: {html.escape(db.tenant_name())}" if len(by_tenant) > 1 else "Статистика системы"
     
     await message.answer(
-        f"📊 <b>Статистика системы</b>\n\n"
+        f"📊 <b>{title}</b>\n\n"
         f"<b>👥 Пользователи:</b>\n"
         f"• Всего: {stats['total_users']}\n"
         f"• Админов: {stats['total_admins']}\n"
@@ -298,18 +302,427 @@ async def show_statistics(message: Message, state: FSMContext):
         f"• Ожидают: {stats['pending_bookings']}\n"
         f"• Подтверждено: {stats['confirmed_bookings']}\n"
         f"• Сегодня: {stats['today_bookings']}\n\n"
-        f"<b>💰 Оборот:</b> {stats['total_revenue']}₽",
+        f"<b>💰 Оборот:</b> {stats['total_revenue']}₽\n\n"
+        f"{_tenants_summary(by_tenant) if len(by_tenant) > 1 else ''}"
+        f"<b>🛡 Антифлуд:</b>\n"
+        f"• Пропущено: {throttle['passed']}\n"
+        f"• Отброшено (пользователь): {throttle['dropped_user']}\n"
+        f"• Отброшено (общий лимит): {throttle['dropped_global']}\n\n"
+        f"<b>🔍 Кэш поиска:</b>\n"
+        f"• Попаданий: {search['hits']} ({search['hit_rate']}%)\n"
+        f"• Промахов: {search['misses']}, устарело: {search['stale']}\n"
+        f"• Записей: {search['size']}",
+        reply_markup=get_analytics_keyboard(),
         parse_mode="HTML"
     )
 
 
-@router.message(F.text == "📢 Рассылка")
-async def start_broadcast(message: Message, state: FSMContext):
-    user = db.get_user_by_telegram_id(message.from_user.id)
-    if not user or user['role'] != 'admin':
-        await message.answer("❌ У вас нет прав администратора.")
+# ==================== АНАЛИТИКА ====================
+
+def _percent(part: float, whole: float) -> str:
+    return f"{part / whole * 100:.0f}%" if whole else "—"
+
+
+def format_analytics(date_from: str, date_to: str) -> str:
+    """Отчёт за дни 'YYYY-MM-DD' включительно - только по сводкам, без пересчёта броней"""
+    days = db.get_daily_stats(date_from, date_to)
+    spots = db.get_spot_stats(date_from, date_to, limit=5)
+    totals = {key: sum(day[key] for day in days) for key in
+              ('bookings', 'cancellations', 'revenue', 'booked_hours', 'offered_hours', 'empty_searches')}
+    updated_at = db.get_rollups_updated_at()
+    
+    period = "–".join(datetime.strptime(value, "%Y-%m-%d").strftime("%d.%m.%Y") for value in (date_from, date_to))
+    text = (
+        f"📈 <b>Аналитика {period}</b>\n"
+        f"<i>По дню использования места, данные на {updated_at or '—'} UTC</i>\n\n"
+        f"📋 Броней: {totals['bookings']}, отмен: {totals['cancellations']}\n"
+        f"💰 Оборот: {totals['revenue']:.0f}₽\n"
+        f"🅿️ Занято: {totals['booked_hours']:.0f} ч из {totals['offered_hours']:.0f} ч "
+        f"({_percent(totals['booked_hours'], totals['offered_hours'])})\n"
+        f"🔍 Поисков без мест: {totals['empty_searches']}\n"
+    )
+    
+    if days:
+        lines = [f"{'Дата':5} {'Брони':>5} {'Отм':>4} {'Оборот':>7} {'Загр':>4} {'Пусто':>5}"]
+        for day in days:
+            lines.append(
+                f"{datetime.strptime(day['day'], '%Y-%m-%d').strftime('%d.%m')} {day['bookings']:>5} "
+                f"{day['cancellations']:>4} {day['revenue']:>7.0f} "
+                f"{_percent(day['booked_hours'], day['offered_hours']):>4} {day['empty_searches']:>5}"
+            )
+        text += "\n<pre>" + "\n".join(lines) + "</pre>\n"
+    
+    if spots:
+        text += "\n🏆 <b>Места по обороту:</b>\n"
+        for i, spot in enumerate(spots, 1):
+            text += (f"{i}. {html.escape(spot['spot_number'])} — {spot['revenue']:.0f}₽, "
+                     f"броней {spot['bookings']}, загрузка {_percent(spot['booked_hours'], spot['offered_hours'])}\n")
+    
+    # Лимит Telegram - 4096 символов
+    return text[:4000]
+
+
+@panel_router.message(Command("analytics"))
+async def show_analytics(message: Message, state: FSMContext):
+    parts = message.text.split()
+    dates = [_parse_export_date(value) for value in parts[1:3]]
+    if len(parts) > 3 or None in dates:
+        await message.answer(
+            "📈 <b>Аналитика</b>\n\n<code>/analytics [с ДД.ММ.ГГГГ] [по ДД.ММ.ГГГГ]</code>\n\n"
+            "Без дат - последние 7 дней.",
+            parse_mode="HTML"
+        )
+        return
+    
+    today = datetime.now().strftime("%Y-%m-%d")
+    date_from = dates[0] if dates else (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
+    date_to = dates[1] if len(dates) > 1 else max(today, date_from)
+    await message.answer(format_analytics(date_from, date_to), parse_mode="HTML")
+
+
+async def _heatmap_text(days: int) -> str:
+    # Год истории - это секунды чтения из БД, считаем в потоке
+    # to_thread, а не run_in_executor: поток получает контекст с ЖК апдейта
+    return await asyncio.to_thread(
+        occupancy.heatmap_report, "Загрузка ЖК по часам недели", *occupancy.recent_period(days)
+    )
+
+
+@panel_router.message(Command("heatmap"))
+async def show_heatmap(message: Message, state: FSMContext):
+    parts = message.text.split()
+    days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else OCCUPANCY_DAYS
+    await message.answer(await _heatmap_text(min(max(days, 7), 366)), parse_mode="HTML")
+
+
+@panel_router.callback_query(F.data == "heatmap")
+async def heatmap_callback(callback: CallbackQuery, state: FSMContext):
+    await callback.message.answer(await _heatmap_text(OCCUPANCY_DAYS), parse_mode="HTML")
+    await callback.answer()
+
+
+@panel_router.callback_query(F.data.startswith("analytics_"))
+async def analytics_period(callback: CallbackQuery, state: FSMContext):
+    _, direction, days = callback.data.split("_")
+    today = datetime.now()
+    if direction == "past":
+        start, end = today - timedelta(days=int(days) - 1), today
+    else:
+        start, end = today + timedelta(days=1), today + timedelta(days=int(days))
+    await callback.message.answer(
+        format_analytics(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")), parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@panel_router.message(Command("slow"))
+async def show_slow_queries(message: Message, state: FSMContext):
+    parts = message.text.split()
+    limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 5
+    queries = get_top_slow_queries(min(limit, 20))
+    
+    if not queries:
+        await message.answer("🐢 Медленных запросов не было.")
+        return
+    
+    text = f"🐢 <b>Медленные запросы (топ {len(queries)})</b>\n"
+    for i, q in enumerate(queries, 1):
+        scan = " ⚠️ полный проход" if q['full_scan'] else ""
+        text += (
+            f"\n<b>{i}. {q['function']}</b>{scan}\n"
+            f"• {q['count']} раз, среднее {q['avg_ms']:.1f} мс, макс {q['max_ms']:.1f} мс, строк {q['rows']}\n"
+            f"• Параметры: {html.escape(q['params'])}\n"
+            f"<code>{html.escape(q['sql'][:300])}</code>\n"
+        )
+        if q['plan']:
+            plan = "\n".join(q['plan'][:6])
+            text += f"<pre>{html.escape(plan)}</pre>\n"
+    
+    # Лимит Telegram - 4096 символов
+    if len(text) > 4000:
+        text = text[:4000].rsplit("\n\n", 1)[0]
+    await message.answer(text, parse_mode="HTML")
+
+
+def _parse_export_date(value: str):
+    """ДД.ММ.ГГГГ -> YYYY-MM-DD (прошлые даты допустимы, в отличие от validate_date)"""
+    try:
+        return datetime.strptime(value, "%d.%m.%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+@panel_router.message(Command("export"))
+async def export_data(message: Message, state: FSMContext, admin: Dict[str, Any]):
+    parts = message.text.split()
+    dates = [_parse_export_date(value) for value in parts[2:4]]
+    if len(parts) < 2 or parts[1] not in EXPORT_KINDS or len(parts) > 4 or None in dates:
+        await message.answer(
+            "📤 <b>Выгрузка CSV</b>\n\n"
+            "<code>/export bookings|spots|users [с ДД.ММ.ГГГГ] [по ДД.ММ.ГГГГ]</code>\n\n"
+            "Бронирования фильтруются по началу, места и пользователи - по дате создания.",
+            parse_mode="HTML"
+        )
+        return
+    
+    kind = parts[1]
+    date_from, date_to = dates + [None] * (2 - len(dates))
+    
+    status_message = await message.answer("⏳ Готовлю выгрузку...")
+    try:
+        # Файл собирается в потоке - бот тем временем обрабатывает другие апдейты
+        path, filename, rows = await asyncio.to_thread(build_export, kind, date_from, date_to)
+    except Exception as e:
+        logger.error(f"Export {kind} failed: {e}")
+        await status_message.edit_text("❌ Не удалось подготовить выгрузку.")
+        return
+    
+    try:
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await status_message.edit_text("❌ Выгрузка больше 50 МБ. Укажите период короче.")
+            return
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📤 {EXPORT_KINDS[kind]}: {rows} строк"
+        )
+        await status_message.delete()
+    finally:
+        os.remove(path)
+    
+    await db.write(db.log_admin_action, 'data_exported', user_id=admin['id'],
+                   details=json.dumps({'kind': kind, 'from': date_from, 'to': date_to, 'rows': rows}))
+
+
+# ==================== ИМПОРТ ЖИЛЬЦОВ ====================
+
+@panel_router.message(Command("import"))
+async def start_import(message: Message, state: FSMContext):
+    await message.answer(
+        "📥 <b>Импорт жильцов</b>\n\n"
+        "Пришлите CSV-файл с заголовком:\n"
+        f"<code>{','.join(IMPORT_COLUMNS)}</code>\n\n"
+        f"Банк - один из: {', '.join(BANKS)}.\n"
+        "Место и цена необязательны; несколько мест жильца - несколько строк с его телефоном.\n"
+        "Строки с ошибками пропускаются, остальные записываются.\n"
+        "Жилец подключится к боту при первом /start, поделившись номером из файла.",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML"
+    )
+    await state.set_state(AdminStates.waiting_import_file)
+
+
+@panel_router.message(AdminStates.waiting_import_file)
+async def process_import_file(message: Message, state: FSMContext, admin: Dict[str, Any]):
+    if message.text == "❌ Отмена":
+        await state.clear()
+        await message.answer("Импорт отменён.", reply_markup=get_admin_menu_keyboard())
+        return
+    if not message.document:
+        await message.answer("📎 Пришлите CSV-файл документом или нажмите «❌ Отмена».")
+        return
+    if message.document.file_size and message.document.file_size > IMPORT_MAX_BYTES:
+        await message.answer(f"❌ Файл больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ. Разделите его на части.")
+        return
+    
+    status_message = await message.answer("⏳ Проверяю и записываю жильцов...")
+    try:
+        data = (await message.bot.download(message.document)).getvalue()
+        # Проверка и запись тысяч строк - в потоке, как выгрузка
+        result = await asyncio.to_thread(import_csv, data, admin['id'])
+    except ImportFileError as e:
+        await status_message.edit_text(f"❌ {html.escape(str(e))}")
+        return
+    except Exception as e:
+        logger.error(f"Import failed: {e}")
+        await status_message.edit_text("❌ Не удалось импортировать файл.")
+        return
+    
+    await state.clear()
+    errors = result['errors']
+    text = (
+        f"📥 <b>Импорт завершён</b>\n\n"
+        f"📄 Строк: {result['rows']}\n"
+        f"👤 Жильцов добавлено: {result['users']}\n"
+        f"🏠 Мест добавлено: {result['spots']}\n"
+        f"❌ Строк с ошибками: {len(errors)}"
+    )
+    if result['skipped']:
+        text += f"\n⏭ Пропущено (зарегистрировались во время импорта): {result['skipped']}"
+    if errors:
+        text += "\n\n" + "\n".join(f"Строка {line}: {html.escape(error)}"
+                                    for line, error in errors[:IMPORT_MAX_ERRORS_SHOWN])
+        if len(errors) > IMPORT_MAX_ERRORS_SHOWN:
+            text += f"\n... и ещё {len(errors) - IMPORT_MAX_ERRORS_SHOWN}"
+    await status_message.edit_text(text, parse_mode="HTML")
+    await message.answer("Выберите действие:", reply_markup=get_admin_menu_keyboard())
+    logger.info(f"Admin {admin['id']} imported {result['users']} residents, {result['spots']} spots, "
+                f"{len(errors)} rows rejected")
+
+
+# ==================== ЖУРНАЛ ДЕЙСТВИЙ ====================
+
+def _parse_log_filters(text: str) -> Optional[Dict[str, Any]]:
+    """'user 12 spot 5 с 01.10.2026 по 19.10.2026' -> фильтры журнала (None - ошибка формата)"""
+    parts = text.split()
+    if len(parts) % 2:
+        return None
+    filters = {}
+    for key, value in zip(parts[::2], parts[1::2]):
+        field = LOG_FILTER_KEYS.get(key.lower())
+        if field is None:
+            return None
+        if field.startswith('date_'):
+            value = _parse_export_date(value)
+        elif value.isdigit():
+            value = int(value)
+        else:
+            value = None
+        if value is None:
+            return None
+        filters[field] = value
+    return filters
+
+
+def _format_log_entry(entry: Dict[str, Any]) -> str:
+    created = datetime.fromisoformat(entry['created_at'])
+    label = LOG_ACTION_LABELS.get(entry['action_type'], entry['action_type'])
+    text = f"\n<b>{format_datetime(created)}</b> {html.escape(label)} <i>#{entry['id']}</i>\n"
+    refs = [f"{icon} #{entry[column]}" for icon, column in
+            (("👤", 'user_id'), ("🏠", 'spot_id'), ("📋", 'booking_id')) if entry[column] is not None]
+    if refs:
+        text += " ".join(refs) + "\n"
+    if entry['details']:
+        try:
+            details = ", ".join(f"{key}: {value}" for key, value in json.loads(entry['details']).items())
+        except (ValueError, AttributeError):
+            details = entry['details']
+        text += f"{html.escape(details[:200])}\n"
+    return text
+
+
+def build_logs_page(filters: Dict[str, Any], after: tuple = None, before: tuple = None):
+    """Текст и клавиатура страницы журнала по фильтрам из FSM"""
+    # Лишняя запись сверх страницы показывает, есть ли что листать дальше
+    logs = db.get_admin_logs(LOGS_PER_PAGE + 1, after=after, before=before, **filters)
+    has_more = len(logs) > LOGS_PER_PAGE
+    if before:
+        logs = logs[-LOGS_PER_PAGE:]
+        has_prev, has_next = has_more, True
+    else:
+        logs = logs[:LOGS_PER_PAGE]
+        has_prev, has_next = after is not None, has_more
+    
+    if not logs and (after or before):
+        return build_logs_page(filters)
+    
+    conditions = []
+    for icon, field in (("👤", 'user_id'), ("🏠", 'spot_id'), ("📋", 'booking_id')):
+        if filters.get(field) is not None:
+            conditions.append(f"{icon} #{filters[field]}")
+    if filters.get('date_from') or filters.get('date_to'):
+        period = [datetime.strptime(filters[field], "%Y-%m-%d").strftime("%d.%m.%Y") if filters.get(field) else "…"
+                  for field in ('date_from', 'date_to')]
+        conditions.append(f"📅 {period[0]}–{period[1]}")
+    
+    text = "📜 <b>Журнал действий</b> (время UTC)\n"
+    if conditions:
+        text += "Фильтр: " + ", ".join(conditions) + "\n"
+    text += "".join(_format_log_entry(entry) for entry in logs) if logs else "\nЗаписей нет."
+    
+    return text, get_admin_logs_keyboard(
+        filters.get('action_type'),
+        prev_cursor=format_slot_cursor((logs[0]['created_at'], logs[0]['id'])) if logs and has_prev else None,
+        next_cursor=format_slot_cursor((logs[-1]['created_at'], logs[-1]['id'])) if logs and has_next else None,
+        filtered=bool(conditions)
+    )
+
+
+@panel_router.message(F.text == "📜 Журнал")
+async def show_admin_logs(message: Message, state: FSMContext):
+    await state.set_state(AdminStates.viewing_logs)
+    await state.update_data(log_filters={})
+    text, markup = build_logs_page({})
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+
+async def _edit_logs_page(callback: CallbackQuery, filters: Dict[str, Any], **cursor):
+    text, markup = build_logs_page(filters, **cursor)
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
+
+
+@panel_router.callback_query(AdminStates.viewing_logs, F.data.startswith("logs_next_") | F.data.startswith("logs_prev_"))
+async def admin_logs_pagination(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    cursor = parse_slot_cursor(callback.data[len("logs_next_"):])
+    if cursor is None:
+        await callback.answer()
+        return
+    direction = 'after' if callback.data.startswith("logs_next_") else 'before'
+    await _edit_logs_page(callback, data.get('log_filters', {}), **{direction: cursor})
+
+
+@panel_router.callback_query(AdminStates.viewing_logs, F.data.startswith("logs_type_"))
+async def admin_logs_type(callback: CallbackQuery, state: FSMContext):
+    action_type = callback.data.replace("logs_type_", "")
+    data = await state.get_data()
+    filters = dict(data.get('log_filters', {}))
+    filters.pop('action_type', None)
+    if action_type in LOG_ACTION_LABELS:
+        filters['action_type'] = action_type
+    await state.update_data(log_filters=filters)
+    await _edit_logs_page(callback, filters)
+
+
+@panel_router.callback_query(AdminStates.viewing_logs, F.data == "logs_filters_reset")
+async def admin_logs_filters_reset(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    # Тип действия выбран кнопками и остаётся, сбрасываются введённые фильтры
+    filters = {key: value for key, value in data.get('log_filters', {}).items() if key == 'action_type'}
+    await state.update_data(log_filters=filters)
+    await _edit_logs_page(callback, filters)
+
+
+@panel_router.callback_query(AdminStates.viewing_logs, F.data == "logs_filters")
+async def admin_logs_filters_start(callback: CallbackQuery, state: FSMContext):
+    await callback.message.answer(
+        "🎛 <b>Фильтры журнала</b>\n\n"
+        "Введите нужные условия, например:\n"
+        "<code>user 12 spot 5 booking 7 с 01.10.2026 по 19.10.2026</code>\n\n"
+        "user, spot, booking - номера из админки (#id), даты включительно.",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML"
+    )
+    await state.set_state(AdminStates.waiting_log_filters)
+    await callback.answer()
+
+
+@panel_router.message(AdminStates.waiting_log_filters)
+async def process_log_filters(message: Message, state: FSMContext):
+    if message.text == "❌ Отмена":
+        await state.set_state(AdminStates.viewing_logs)
+        await message.answer("Выберите действие:", reply_markup=get_admin_menu_keyboard())
+        return
+    
+    filters = _parse_log_filters(message.text or "")
+    if not filters:
+        await message.answer("❌ Неверный формат. Пример: user 12 с 01.10.2026 по 19.10.2026")
         return
     
+    data = await state.get_data()
+    action_type = data.get('log_filters', {}).get('action_type')
+    if action_type:
+        filters['action_type'] = action_type
+    await state.update_data(log_filters=filters)
+    await state.set_state(AdminStates.viewing_logs)
+    
+    await message.answer("✅ Фильтр применён.", reply_markup=get_admin_menu_keyboard())
+    text, markup = build_logs_page(filters)
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+
+@panel_router.message(F.text == "📢 Рассылка")
+async def start_broadcast(message: Message, state: FSMContext):
     await message.answer(
         "📢 <b>Рассылка</b>\n\nВведите текст сообщения:\n(Поддерживается HTML)",
         reply_markup=get_cancel_keyboard(),
@@ -318,7 +731,7 @@ async def start_broadcast(message: Message, state: FSMContext):
     await state.set_state(AdminStates.waiting_broadcast_message)
 
 
-@router.message(AdminStates.waiting_broadcast_message)
+@panel_router.message(AdminStates.waiting_broadcast_message)
 async def process_broadcast(message: Message, state: FSMContext):
     if message.text == "❌ Отмена":
         await state.clear()
@@ -334,6 +747,9 @@ async def process_broadcast(message: Message, state: FSMContext):
     status_message = await message.answer("📤 Отправка...")
     
     for user in users:
+        if user['telegram_id'] is None:
+            # Импортированный жилец ещё не заходил в бот
+            continue
         try:
             await message.bot.send_message(user['telegram_id'], f"📢 <b>Объявление</b>\n\n{broadcast_text}", parse_mode="HTML")
             success_count += 1
@@ -346,7 +762,7 @@ async def process_broadcast(message: Message, state: FSMContext):
     await message.answer("Выберите действие:", reply_markup=get_admin_menu_keyboard())
 
 
-@router.callback_query(F.data == "admin_back")
+@panel_router.callback_query(F.data == "admin_back")
 async def admin_back(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("⚙️ <b>Админ-панель</b>", parse_mode="HTML")
     await callback.message.answer("Выберите действие:", reply_markup=get_admin_menu_keyboard())
@@ -355,3 +771,32 @@ async def admin_back(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "noop")
 async def noop(callback: CallbackQuery):
     await callback.answer()
+
+
+# ==================== ACCESS DENIED ====================
+
+ADMIN_MENU_TEXTS = ("⚙️ Админ-панель", "👥 Пользователи", "🏠 Все места", "📊 Статистика", "📜 Журнал", "📢 Рассылка")
+SESSION_EXPIRED_TEXT = "🔐 Сессия администратора истекла. Войдите снова: /admin"
+
+
+def _is_admin_role(telegram_id: int) -> bool:
+    user = db.get_user_by_telegram_id(telegram_id)
+    return bool(user) and user['role'] == 'admin'
+
+
+@denied_router.message(F.text.in_(ADMIN_MENU_TEXTS))
+@denied_router.message(Command("analytics", "heatmap", "slow", "export", "import"))
+async def admin_denied(message: Message, state: FSMContext):
+    if _is_admin_role(message.from_user.id):
+        await message.answer(SESSION_EXPIRED_TEXT)
+    else:
+        await message.answer("❌ У вас нет прав администратора.")
+
+
+@denied_router.callback_query()
+async def admin_callback_denied(callback: CallbackQuery, state: FSMContext):
+    # Сюда доходят все кнопки, которые не обработал ни один роутер, - не только админские
+    if _is_admin_role(callback.from_user.id):
+        await callback.answer(SESSION_EXPIRED_TEXT, show_alert=True)
+    else:
+        await callback.answer()
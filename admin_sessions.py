@@ -0,0 +1,147 @@
+"""
+Сессии администраторов ParkingBot в памяти процесса
+
+Сессия живёт ADMIN_SESSION_HOURS с последнего действия. Действие только
+отмечается в памяти, а last_activity пишется в базу одной пачкой не чаще
+раза в ADMIN_ACTIVITY_FLUSH_SECONDS - клик по админ-панели не открывает
+транзакцию записи. В многопроцессном режиме админ всегда попадает в один
+воркер, поэтому его сессия кэшируется только там; промах читает её из базы.
+Сессия помнит ЖК админа: id сессий у каждой базы ЖК свои.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple, Union
+
+from aiogram.filters import BaseFilter
+from aiogram.types import CallbackQuery, Message
+
+import database as db
+from config import ADMIN_SESSION_HOURS, ADMIN_ACTIVITY_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Время сессий - UTC, как CURRENT_TIMESTAMP в таблице admin_sessions
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+class AdminSessionCache:
+    """Сессии по telegram_id с истечением по простою и отложенной записью активности"""
+
+    def __init__(self, hours: float = ADMIN_SESSION_HOURS,
+                 flush_seconds: float = ADMIN_ACTIVITY_FLUSH_SECONDS):
+        self.ttl = timedelta(hours=hours)
+        self.flush_seconds = flush_seconds
+        # telegram_id -> {'id', 'user_id', 'tenant', 'last_activity': datetime}
+        self._sessions: Dict[int, Dict[str, Any]] = {}
+        # (ЖК, id сессии) -> последняя активность, ещё не записанная в базу
+        self._dirty: Dict[Tuple[str, int], datetime] = {}
+        self._flushed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, telegram_id: int, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Действующая сессия; истёкшая забывается"""
+        if now is None:
+            now = _utcnow()
+        session = self._sessions.get(telegram_id)
+        if session is None:
+            row = db.get_admin_session(telegram_id)
+            if row is None:
+                return None
+            session = {'id': row['id'], 'user_id': row['user_id'], 'tenant': db.get_tenant(),
+                       'last_activity': datetime.strptime(row['last_activity'], TIME_FORMAT)}
+            self._sessions[telegram_id] = session
+        if now - session['last_activity'] > self.ttl:
+            self.drop(telegram_id)
+            return None
+        return session
+
+    def put(self, telegram_id: int, session_id: int, user_id: int):
+        """Запомнить только что созданную сессию"""
+        self.drop(telegram_id)
+        self._sessions[telegram_id] = {'id': session_id, 'user_id': user_id, 'tenant': db.get_tenant(),
+                                       'last_activity': _utcnow()}
+
+    def drop(self, telegram_id: int):
+        session = self._sessions.pop(telegram_id, None)
+        if session is not None:
+            self._dirty.pop((session['tenant'], session['id']), None)
+
+    def touch(self, session: Dict[str, Any], now: Optional[datetime] = None):
+        """Отметить действие; в базу попадёт при следующем flush"""
+        session['last_activity'] = now or _utcnow()
+        self._dirty[(session['tenant'], session['id'])] = session['last_activity']
+
+    async def flush(self) -> int:
+        """Записать накопленную активность - одна операция записи на ЖК; вернуть число сессий"""
+        self._flushed_at = time.monotonic()
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        by_tenant: Dict[str, Dict[int, str]] = {}
+        for (tenant, session_id), moment in dirty.items():
+            by_tenant.setdefault(tenant, {})[session_id] = moment.strftime(TIME_FORMAT)
+
+        flushed = 0
+        for tenant, activity in by_tenant.items():
+            try:
+                with db.use_tenant(tenant):
+                    await db.write(db.update_admin_sessions_activity, activity)
+                flushed += len(activity)
+            except Exception as e:
+                # Не записанное вернётся в следующую пачку, если новых отметок не было
+                for session_id in activity:
+                    self._dirty.setdefault((tenant, session_id), dirty[(tenant, session_id)])
+                logger.error(f"Admin activity flush error ({tenant}): {e}")
+        return flushed
+
+    async def flush_if_due(self) -> int:
+        if time.monotonic() - self._flushed_at < self.flush_seconds:
+            return 0
+        return await self.flush()
+
+
+_cache = AdminSessionCache()
+
+
+async def start_session(user_id: int, telegram_id: int) -> int:
+    """Открыть сессию после входа по паролю"""
+    session_id = await db.write(db.create_admin_session, user_id, telegram_id)
+    _cache.put(telegram_id, session_id, user_id)
+    return session_id
+
+
+async def get_session(telegram_id: int) -> Optional[Dict[str, Any]]:
+    """Действующая сессия админа с отметкой активности"""
+    session = _cache.get(telegram_id)
+    if session is not None:
+        _cache.touch(session)
+        await _cache.flush_if_due()
+    return session
+
+
+async def flush_activity() -> int:
+    """Записать накопленную активность админов (фоновые задачи, остановка)"""
+    return await _cache.flush()
+
+
+class IsAdmin(BaseFilter):
+    """Роль admin и действующая сессия; передаёт хендлеру пользователя как admin"""
+
+    async def __call__(self, event: Union[Message, CallbackQuery]) -> Union[bool, Dict[str, Any]]:
+        if event.from_user is None:
+            return False
+        user = db.get_user_by_telegram_id(event.from_user.id)
+        if not user or user['role'] != 'admin':
+            # Снятые права закрывают и сессию, закэшированную до этого
+            _cache.drop(event.from_user.id)
+            return False
+        if await get_session(event.from_user.id) is None:
+            return False
+        return {'admin': user}
@@ -0,0 +1,1036 @@
+"""
+Бенчмарки ParkingBot
+
+    python benchmarks.py shards [--workers 1 2 4 8] [--updates 20000] [--users 2000]
+    python benchmarks.py keyboards [--iterations 20000]
+    python benchmarks.py search [--searches 20000] [--write-ratio 0.02]
+    python benchmarks.py db [--scales 1000 100000 1000000] [--iterations 200]
+    python benchmarks.py load [--residents 2000] [--processes 1] [--latency 0.02]
+    python benchmarks.py replay updates.log --snapshot parking.db [--speed 1|10|max]
+    python benchmarks.py heatmap [--spots 5000] [--days 365]
+    python benchmarks.py records [--scale 100000]
+    python benchmarks.py writes [--clients 1 10 50] [--writes 2000]
+    python benchmarks.py tenants [--tenants 1 2 4] [--seconds 3] [--hold-ms 5]
+    python benchmarks.py waitlist [--subscribers 5000] [--slots 500] [--declines 200]
+
+База для бенчмарков создаётся заново во временном файле (--db), рабочая
+parking.db не трогается. Результаты печатаются таблицей или JSON (--json).
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _prepare_database(path: str):
+    """Направить config.DATABASE_PATH на файл бенчмарка (до импорта database)"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.environ["DATABASE_PATH"] = path
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..100) по отсортированной копии"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _seed_users(db, count: int, first_telegram_id: int = 1_000_000) -> List[int]:
+    """Зарегистрировать count пользователей, вернуть их telegram_id"""
+    telegram_ids = []
+    for i in range(count):
+        telegram_id = first_telegram_id + i
+        db.create_user(telegram_id, f"resident{i}", f"Житель {i}",
+                       f"8999{i:07d}", "4111111111111111", "Сбербанк")
+        telegram_ids.append(telegram_id)
+    return telegram_ids
+
+
+# ==================== SHARDS ====================
+
+async def _bench_shards(args, telegram_ids: List[int]) -> List[Dict[str, Any]]:
+    from fake_bot import make_message_update
+    from sharding import ShardRouter
+
+    texts = ["👤 Профиль", "/start", "🏠 Мои места", "📋 Мои бронирования"]
+    updates = [
+        make_message_update(telegram_ids[i % len(telegram_ids)], texts[i % len(texts)])
+        for i in range(args.updates)
+    ]
+
+    rows = []
+    for workers in args.workers:
+        shards = ShardRouter(workers, fake_latency=args.latency)
+        shards.start()
+        await shards.wait_ready()
+
+        started = time.perf_counter()
+        for update in updates:
+            await shards.dispatch(update)
+        processed = await shards.stop()
+        elapsed = time.perf_counter() - started
+
+        total = sum(processed.values())
+        rows.append({
+            "bench": "shards",
+            "workers": workers,
+            "updates": total,
+            "seconds": round(elapsed, 3),
+            "updates_per_sec": round(total / elapsed, 1),
+        })
+    return rows
+
+
+def bench_shards(args) -> List[Dict[str, Any]]:
+    """Пропускная способность фронт + N воркеров на фейковом Bot API"""
+    _prepare_database(args.db)
+    import database as db
+
+    # Набор - до цикла событий: синхронная запись из него запрещена
+    db.init_database()
+    telegram_ids = _seed_users(db, args.users)
+    return asyncio.run(_bench_shards(args, telegram_ids))
+
+
+# ==================== KEYBOARDS ====================
+
+def bench_keyboards(args) -> List[Dict[str, Any]]:
+    """Сборка клавиатуры и её сериализация в запрос: заново (до) и из кэша (после)"""
+    import keyboards as kb
+    from aiogram.methods import SendMessage
+    from fake_bot import create_fake_bot
+
+    bot = create_fake_bot()
+    cases = [
+        ("main_menu", lambda: kb._build_main_menu_keyboard(True), lambda: kb.get_main_menu_keyboard(True)),
+        ("banks", kb._build_banks_keyboard, kb.get_banks_keyboard),
+        ("dates", lambda: kb._build_dates_keyboard("search_date"), lambda: kb.get_dates_keyboard("search_date")),
+        ("time_slots", lambda: kb._build_time_slots_keyboard("start_time"), lambda: kb.get_time_slots_keyboard("start_time")),
+        ("yes_no", lambda: kb._build_yes_no_keyboard("partial"), lambda: kb.get_yes_no_keyboard("partial")),
+        ("confirm", lambda: kb._build_confirm_keyboard("booking_confirm"), lambda: kb.get_confirm_keyboard("booking_confirm")),
+        ("notify_options", kb._build_notify_options_keyboard, kb.get_notify_options_keyboard),
+    ]
+
+    def handler_path(build):
+        # То, что делает хендлер: собрать клавиатуру и отдать aiogram на сериализацию
+        method = SendMessage(chat_id=1, text="Выберите действие:", reply_markup=build())
+        return bot.session.prepare_value(method.model_dump(warnings=False), bot=bot, files={})
+
+    def measure(func) -> float:
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            func()
+        return (time.perf_counter() - started) / args.iterations * 1e6
+
+    rows = []
+    for name, before, after in cases:
+        build_before, build_after = measure(before), measure(after)
+        path_before = measure(lambda: handler_path(before))
+        path_after = measure(lambda: handler_path(after))
+        rows.append({
+            "bench": "keyboards",
+            "keyboard": name,
+            "build_before_us": round(build_before, 2),
+            "build_after_us": round(build_after, 2),
+            "path_before_us": round(path_before, 2),
+            "path_after_us": round(path_after, 2),
+            "path_speedup": round(path_before / path_after, 2),
+        })
+    return rows
+
+
+# ==================== SEARCH ====================
+
+def _seed_slots(db, supplier_ids: List[int], spots: int, days: int, slots_per_day: int,
+                rng: random.Random) -> List[int]:
+    """Места и слоты на days дней вперёд, вернуть id слотов"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = []
+    for i in range(spots):
+        spot_id = db.create_parking_spot(supplier_ids[i % len(supplier_ids)], f"A{i}",
+                                         rng.choice([50, 80, 100, 150, 200]))
+        for day in range(days):
+            for _ in range(slots_per_day):
+                start = today + timedelta(days=day, hours=rng.randint(0, 20), minutes=rng.choice([0, 30]))
+                end = start + timedelta(hours=rng.randint(1, 12))
+                rows.append((spot_id, start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")))
+    # Пачкой в одной транзакции - create_spot_availability по одному здесь слишком долго
+    with db._direct_connection() as conn:
+        conn.executemany('''
+            INSERT OR IGNORE INTO spot_availability (spot_id, start_time, end_time) VALUES (?, ?, ?)
+        ''', rows)
+        return [row[0] for row in conn.execute('SELECT id FROM spot_availability')]
+
+
+def bench_search(args) -> List[Dict[str, Any]]:
+    """Повторные поиски по ближайшим датам вперемешку с бронированиями: без кэша и с кэшем"""
+    _prepare_database(args.db)
+    import database as db
+    import search_cache
+
+    rng = random.Random(args.seed)
+    db.init_database()
+    user_ids = [db.get_user_by_telegram_id(t)['id'] for t in _seed_users(db, args.users)]
+    slot_ids = _seed_slots(db, user_ids, args.spots, args.days, args.slots_per_day, rng)
+
+    today = datetime.now()
+    # Большинство ищет сегодня и завтра
+    dates = [(today + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(args.days)]
+    weights = [40, 40] + [20 / (args.days - 2)] * (args.days - 2)
+
+    rows = []
+    for label, size in (("off", 0), ("on", search_cache.SEARCH_CACHE_SIZE)):
+        search_cache._cache = search_cache.SearchCache(size)
+        search_cache.stats.clear()
+        rng.seed(args.seed)
+        booked = []
+        timings = []
+        for _ in range(args.searches):
+            if rng.random() < args.write_ratio:
+                # Запись между поисками: бронь или отмена поднимает версию даты
+                if booked and rng.random() < 0.5:
+                    db.cancel_booking(booked.pop())
+                else:
+                    slot = db.get_availability_by_id(rng.choice(slot_ids))
+                    if slot and not slot['is_booked']:
+                        booked.append(db.create_booking(
+                            rng.choice(user_ids), slot['spot_id'], slot['id'],
+                            datetime.fromisoformat(slot['start_time']),
+                            datetime.fromisoformat(slot['end_time']), 100
+                        ))
+
+            date_str = rng.choices(dates, weights)[0]
+            sort = rng.choice(["time", "price"])
+            started = time.perf_counter()
+            search_cache.get_available_slots(date_str, limit=11, sort=sort)
+            search_cache.count_available_slots(date_str)
+            timings.append((time.perf_counter() - started) * 1e6)
+
+        cache_stats = search_cache.get_search_cache_stats()
+        rows.append({
+            "bench": "search",
+            "cache": label,
+            "searches": args.searches,
+            "writes": round(args.write_ratio * args.searches),
+            "mean_us": round(sum(timings) / len(timings), 1),
+            "p50_us": round(_percentile(timings, 50), 1),
+            "p95_us": round(_percentile(timings, 95), 1),
+            "hit_rate": cache_stats['hit_rate'] if size else "-",
+        })
+    return rows
+
+
+# ==================== DB ====================
+
+# Публичные функции database.py, которые не меряются: служебные или без обращения к БД
+DB_BENCH_EXCLUDED = {'get_connection', 'bump_slot_versions', 'slot_sort_key', 'writes', 'write', 'submit_write',
+                     'stop_writers', 'close_connections', 'ensure_rule_slots'}
+
+
+def _db_cases(db, counts: Dict[str, int], rng: random.Random) -> List[Tuple[str, Callable[[int], Any]]]:
+    """(функция, вызов по номеру итерации) - сначала чтения, потом записи"""
+    from dataset import ADMINS, FIRST_TELEGRAM_ID
+
+    users, spots = counts['users'], counts['parking_spots']
+    slots, bookings = counts['spot_availability'], counts['bookings']
+    notifications = max(1, counts['spot_notifications'])
+    rules = max(1, counts['availability_rules'])
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def user_id() -> int:
+        return rng.randint(1, users)
+
+    def date_str() -> str:
+        return (today + timedelta(days=rng.randint(0, 6))).strftime("%Y-%m-%d")
+
+    def past_day() -> Tuple[str, str]:
+        day = today - timedelta(days=rng.randint(1, 10))
+        return day.strftime("%Y-%m-%d %H:%M:%S"), (day + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def slot_window() -> Tuple[int, datetime, datetime]:
+        start = today + timedelta(days=rng.randint(0, 14), hours=rng.randint(6, 18))
+        return rng.randint(1, spots), start, start + timedelta(hours=rng.randint(2, 8))
+
+    # Объекты, созданные бенчмарками записи, для парных операций (бронь -> отмена и т.п.)
+    created = {'spots': [], 'slots': [], 'bookings': [], 'notifications': [], 'sessions': [], 'rules': [],
+               'imported': [], 'offers': []}
+    new_ids = {'telegram': FIRST_TELEGRAM_ID + users + 1_000_000}
+
+    def next_telegram_id() -> int:
+        new_ids['telegram'] += 1
+        return new_ids['telegram']
+
+    def create_slot(i: int) -> int:
+        # Уникальные слоты далеко за горизонтом набора данных
+        start = today + timedelta(days=60, minutes=30 * i)
+        slot_id = db.create_spot_availability(rng.randint(1, spots), start, start + timedelta(hours=2))
+        created['slots'].append((slot_id, start))
+        return slot_id
+
+    def month_of_slots(i: int) -> List[Tuple[datetime, datetime]]:
+        # Месяц ежедневных слотов за горизонтом набора; сдвиг по i - без повторов
+        start = today + timedelta(days=90, hours=8, minutes=i % 600)
+        return [(start + timedelta(days=day), start + timedelta(days=day, hours=10)) for day in range(30)]
+
+    def create_booking(i: int) -> int:
+        if not created['slots']:
+            create_slot(i)
+        slot_id, start = created['slots'].pop()
+        slot = db.get_availability_by_id(slot_id)
+        booking_id = db.create_booking(user_id(), slot['spot_id'], slot_id, start,
+                                       start + timedelta(hours=2), 200)
+        if booking_id is not None:
+            created['bookings'].append(booking_id)
+        return booking_id
+
+    def offer_slots(i: int) -> List[Any]:
+        # Десять слотов набора: свободные уходят первым подходящим подписчикам
+        offers = db.offer_slots([rng.randint(1, slots) for _ in range(10)])
+        created['offers'].extend(offers)
+        return offers
+
+    def decline_offer(i: int) -> Optional[List[Any]]:
+        if not created['offers']:
+            offer_slots(i)
+        offer = pop_or('offers', lambda: {'id': 0, 'user_id': 0})
+        return db.decline_offer(offer['id'], offer['user_id'])
+
+    def pop_or(key: str, fallback: Callable[[], Any]):
+        return created[key].pop() if created[key] else fallback()
+
+    def create_notification(i: int) -> int:
+        spot_id, start, end = slot_window()
+        notification_id = db.create_spot_notification(
+            user_id(), start.strftime("%Y-%m-%d"), start.strftime("%H:%M:%S"), end.strftime("%H:%M:%S"))
+        created['notifications'].append(notification_id)
+        return notification_id
+
+    def import_batch(i: int) -> List[str]:
+        # Десять жильцов с местом: телефоны, которых нет ни в наборе, ни в create_user
+        residents = [{'full_name': "Жилец Импорта", 'phone': f"8955{i:05d}{n:02d}", 'card_number': "4111111111111111",
+                      'bank': "Сбербанк", 'spots': [(f"I{i}-{n}", 100.0)]} for n in range(10)]
+        db.import_residents(residents)
+        phones = [resident['phone'] for resident in residents]
+        created['imported'].extend(phones)
+        return phones
+
+    def create_session(i: int) -> int:
+        telegram_id = next_telegram_id()
+        created['sessions'].append(telegram_id)
+        return db.create_admin_session(rng.randint(1, ADMINS), telegram_id)
+
+    def create_rule(i: int) -> int:
+        # Расписание с завтрашнего дня: materialize_rules создаёт по нему слоты на горизонт
+        valid_from = (today + timedelta(days=1)).strftime("%Y-%m-%d")
+        rule_id = db.create_availability_rule(rng.randint(1, spots), 0b0011111, f"{rng.randint(6, 10):02d}:00",
+                                              "19:00", valid_from)
+        created['rules'].append(rule_id)
+        return rule_id
+
+    def create_spot(i: int) -> int:
+        spot_id = db.create_parking_spot(user_id(), f"B{i}", rng.choice([80, 100, 150]))
+        created['spots'].append(spot_id)
+        return spot_id
+
+    return [
+        ("get_user_by_telegram_id", lambda i: db.get_user_by_telegram_id(FIRST_TELEGRAM_ID + user_id() - 1)),
+        ("get_user_by_id", lambda i: db.get_user_by_id(user_id())),
+        # Админ листает список с начала - первые 50 страниц
+        ("get_all_users", lambda i: db.get_all_users(10, rng.randrange(0, min(users, 500), 10))),
+        ("get_users_count", lambda i: db.get_users_count()),
+        ("get_admins", lambda i: db.get_admins()),
+        ("get_user_spots", lambda i: db.get_user_spots(user_id())),
+        ("get_user_spots_count", lambda i: db.get_user_spots_count(user_id())),
+        ("get_spot_by_id", lambda i: db.get_spot_by_id(rng.randint(1, spots))),
+        ("get_all_spots", lambda i: db.get_all_spots()),
+        ("get_slot_version", lambda i: db.get_slot_version(date_str())),
+        ("get_available_slots", lambda i: db.get_available_slots(
+            date_str(), limit=11, sort=rng.choice(db.SLOT_SORTS), wait_from=datetime.now().strftime("%H:%M:00"))),
+        ("count_available_slots", lambda i: db.count_available_slots(date_str())),
+        ("get_availability_by_id", lambda i: db.get_availability_by_id(rng.randint(1, slots))),
+        ("get_spot_availabilities", lambda i: db.get_spot_availabilities(rng.randint(1, spots))),
+        ("get_booking_by_id", lambda i: db.get_booking_by_id(rng.randint(1, bookings))),
+        ("get_user_bookings", lambda i: db.get_user_bookings(user_id())),
+        ("get_supplier_bookings", lambda i: db.get_supplier_bookings(user_id())),
+        ("get_spot_active_bookings", lambda i: db.get_spot_active_bookings(rng.randint(1, spots))),
+        ("get_active_bookings_count", lambda i: db.get_active_bookings_count(user_id())),
+        ("get_upcoming_bookings", lambda i: db.get_upcoming_bookings(*past_day())),
+        ("get_active_notifications", lambda i: db.get_active_notifications()),
+        ("get_user_notifications", lambda i: db.get_user_notifications(user_id())),
+        ("get_spot_rules", lambda i: db.get_spot_rules(rng.randint(1, spots))),
+        ("get_availability_rule", lambda i: db.get_availability_rule(rng.randint(1, rules))),
+        # Правила набора уже созданы на 20 дней вперёд - обычный поиск ничего не досоздаёт
+        ("get_pending_rules_until", lambda i: db.get_pending_rules_until(date_str())),
+        ("get_admin_session", lambda i: db.get_admin_session(FIRST_TELEGRAM_ID + rng.randint(0, ADMINS - 1))),
+        ("get_active_admin_sessions", lambda i: db.get_active_admin_sessions()),
+        # Страница журнала: через раз - с фильтром по жителю
+        ("get_admin_logs", lambda i: db.get_admin_logs(11, user_id=user_id() if i % 2 else None)),
+        ("get_statistics", lambda i: db.get_statistics()),
+        ("get_daily_stats", lambda i: db.get_daily_stats(*sorted([date_str(), date_str()]))),
+        ("get_spot_stats", lambda i: db.get_spot_stats(*sorted([date_str(), date_str()]))),
+        ("get_rollups_updated_at", lambda i: db.get_rollups_updated_at()),
+        # Интервалы за одни сутки; через раз - только места одного поставщика
+        ("get_occupancy_intervals", lambda i: db.get_occupancy_intervals(
+            *past_day(), user_id() if i % 2 else None)),
+        ("get_user_statistics", lambda i: db.get_user_statistics(user_id())),
+        ("init_database", lambda i: db.init_database()),
+        ("create_user", lambda i: db.create_user(next_telegram_id(), f"bench{i}", "Житель Бенчмарка",
+                                                 f"8977{i:07d}", "4111111111111111", "Сбербанк")),
+        ("get_taken_phones", lambda i: db.get_taken_phones([f"8977{n:07d}" for n in range(i, i + 100)])),
+        ("import_residents", import_batch),
+        ("has_unlinked_residents", lambda i: db.has_unlinked_residents()),
+        ("link_imported_resident", lambda i: db.link_imported_resident(
+            next_telegram_id(), f"bench{i}", pop_or('imported', lambda: import_batch(i + 50000) and created['imported'].pop()))),
+        ("update_user", lambda i: db.update_user(user_id(), phone=f"8966{i:07d}")),
+        ("set_user_role", lambda i: db.set_user_role(rng.randint(ADMINS + 1, max(users, ADMINS + 1)), 'user')),
+        ("block_user", lambda i: db.block_user(user_id())),
+        ("unblock_user", lambda i: db.unblock_user(user_id())),
+        ("create_parking_spot", create_spot),
+        ("create_spot_availability", create_slot),
+        ("create_spot_availabilities", lambda i: db.create_spot_availabilities(rng.randint(1, spots),
+                                                                               month_of_slots(i))),
+        ("create_booking", create_booking),
+        ("cancel_booking", lambda i: db.cancel_booking(pop_or('bookings', lambda: create_booking(i)))),
+        ("create_availability_rule", create_rule),
+        # Первый вызов создаёт слоты всех новых правил, дальше - ничего
+        ("materialize_rules", lambda i: db.materialize_rules((today + timedelta(days=14)).strftime("%Y-%m-%d"))),
+        ("add_rule_exception", lambda i: db.add_rule_exception(
+            pop_or('rules', lambda: create_rule(i)), (today + timedelta(days=rng.randint(1, 14))).strftime("%Y-%m-%d"))),
+        ("delete_availability_rule", lambda i: db.delete_availability_rule(pop_or('rules', lambda: create_rule(i)))),
+        ("create_spot_notification", create_notification),
+        ("deactivate_notifications", lambda i: db.deactivate_notifications(
+            [rng.randint(1, notifications) for _ in range(5)])),
+        ("deactivate_notification", lambda i: db.deactivate_notification(
+            pop_or('notifications', lambda: rng.randint(1, notifications)))),
+        ("create_admin_session", create_session),
+        ("update_admin_sessions_activity", lambda i: db.update_admin_sessions_activity(
+            {rng.randint(1, ADMINS): datetime.now().strftime("%Y-%m-%d %H:%M:%S") for _ in range(5)})),
+        ("delete_admin_session", lambda i: db.delete_admin_session(
+            pop_or('sessions', next_telegram_id))),
+        ("log_admin_action", lambda i: db.log_admin_action('bench', user_id=user_id())),
+        ("delete_spot", lambda i: db.delete_spot(pop_or('spots', lambda: create_spot(i)))),
+        ("offer_slots", offer_slots),
+        ("get_slot_offer", lambda i: db.get_slot_offer(rng.choice(created['offers'])['id'] if created['offers'] else i)),
+        # Отказ передаёт слот следующему в очереди
+        ("decline_offer", decline_offer),
+        ("expire_offers", lambda i: db.expire_offers()),
+        ("record_empty_search", lambda i: db.record_empty_search(date_str())),
+        # Фоновые задачи: первый вызов разбирает весь набор, дальше - почти ничего
+        ("expire_pending_bookings", lambda i: db.expire_pending_bookings(past_day()[0])),
+        ("cleanup_old_data", lambda i: db.cleanup_old_data(
+            (today - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S"))),
+        # Первый вызов складывает весь набор, дальше - только записи предыдущих бенчмарков
+        ("run_rollups", lambda i: db.run_rollups()),
+    ]
+
+
+def bench_db(args) -> List[Dict[str, Any]]:
+    """Каждая публичная функция database.py на синтетической базе нескольких размеров"""
+    _prepare_database(args.db)
+    import database as db
+    import dataset
+
+    rng = random.Random(args.seed)
+    rows = []
+    for scale in args.scales:
+        # Старые соединения чтения и записи смотрят в удалённый файл прошлого размера
+        db.close_connections()
+        started = time.perf_counter()
+        counts = dataset.generate(args.db, scale, args.seed)
+        print(f"# scale {scale}: generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        cases = _db_cases(db, counts, rng)
+        uncovered = {name for name, func in inspect.getmembers(db, inspect.isfunction)
+                     if func.__module__ == db.__name__ and not name.startswith('_')}
+        uncovered -= {name for name, _ in cases} | DB_BENCH_EXCLUDED
+        if uncovered:
+            print(f"# not benchmarked: {', '.join(sorted(uncovered))}", file=sys.stderr)
+
+        for name, call in cases:
+            timings = []
+            deadline = time.perf_counter() + args.max_seconds
+            for i in range(args.iterations):
+                started = time.perf_counter()
+                call(i)
+                timings.append((time.perf_counter() - started) * 1e6)
+                if started > deadline:
+                    break
+            rows.append({
+                "bench": "db",
+                "scale": scale,
+                "function": name,
+                "calls": len(timings),
+                "p50_us": round(_percentile(timings, 50), 1),
+                "p99_us": round(_percentile(timings, 99), 1),
+                "qps": round(len(timings) / (sum(timings) / 1e6), 1),
+            })
+    return rows
+
+
+# ==================== LOAD ====================
+
+def bench_load(args) -> List[Dict[str, Any]]:
+    """Сквозная нагрузка: виртуальные жители проходят сценарии через диспетчер"""
+    _prepare_database(args.db)
+    import dataset
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    import loadtest
+
+    dataset.generate(args.db, args.residents, args.seed)
+    # Первые жители набора данных - администраторы, следом обычные жители
+    admins = [dataset.FIRST_TELEGRAM_ID + i for i in range(min(args.admins, dataset.ADMINS))]
+    residents = list(range(dataset.FIRST_TELEGRAM_ID + dataset.ADMINS,
+                           dataset.FIRST_TELEGRAM_ID + args.residents))
+    first_new = dataset.FIRST_TELEGRAM_ID + args.residents * 10
+    new_residents = list(range(first_new, first_new + args.new_residents))
+
+    jobs = [{
+        "residents": residents[i::args.processes],
+        "new_residents": new_residents[i::args.processes],
+        "admins": admins[i::args.processes],
+        "rounds": args.rounds,
+        "broadcasts": args.broadcasts,
+        "latency": args.latency,
+        "think": args.think,
+        "seed": args.seed + i,
+    } for i in range(args.processes)]
+
+    # Каждый процесс - свой диспетчер и свои соединения с общей базой, как воркеры sharding.py
+    with ProcessPoolExecutor(args.processes, mp_context=get_context("spawn")) as pool:
+        results = list(pool.map(loadtest.run_process, jobs))
+
+    seconds = max(r["finished_at"] for r in results) - min(r["started_at"] for r in results)
+    update_timings = [t for r in results for t in r["update_timings"]]
+    errors = sum(sum(r["errors"].values()) for r in results)
+    scenarios = {}
+    for r in results:
+        for (name, outcome), count in r["scenarios"].items():
+            scenarios[f"{name}_{outcome}"] = scenarios.get(f"{name}_{outcome}", 0) + count
+
+    def latency_row(scope: str, timings: List[float]) -> Dict[str, Any]:
+        return {
+            "bench": "load",
+            "scope": scope,
+            "calls": len(timings),
+            "p50_ms": round(_percentile(timings, 50) * 1000, 2),
+            "p95_ms": round(_percentile(timings, 95) * 1000, 2),
+            "p99_ms": round(_percentile(timings, 99) * 1000, 2),
+        }
+
+    total = latency_row("updates", update_timings)
+    total.update({
+        "processes": args.processes,
+        "seconds": round(seconds, 2),
+        "updates_per_sec": round(len(update_timings) / seconds, 1),
+        "errors": errors,
+        "db_lock_errors": sum(r["lock_errors"] for r in results),
+    })
+    print("# scenarios: " + ", ".join(f"{k}={v}" for k, v in sorted(scenarios.items())), file=sys.stderr)
+
+    handlers: Dict[str, List[float]] = {}
+    for r in results:
+        for name, timings in r["handler_timings"].items():
+            handlers.setdefault(name, []).extend(timings)
+    rows = [total]
+    for name in sorted(handlers, key=lambda n: -_percentile(handlers[n], 99)):
+        rows.append(latency_row(name, handlers[name]))
+    return rows
+
+
+# ==================== REPLAY ====================
+
+def _speed(value: str) -> Optional[float]:
+    return None if value == "max" else float(value)
+
+
+def bench_replay(args) -> List[Dict[str, Any]]:
+    """Записанный поток апдейтов на копии снимка базы: задержки хендлеров и время БД"""
+    os.environ["DATABASE_PATH"] = args.db
+    # Время запросов к БД берём из метрик процесса
+    os.environ["METRICS_ENABLED"] = "1"
+    import replay
+    from config import UPDATE_LOG_SALT
+
+    replay.prepare_snapshot(args.snapshot, args.db, args.salt or UPDATE_LOG_SALT)
+    result = asyncio.run(replay.replay_updates(args.log, args.speed, args.max_gap, args.latency))
+
+    def latency_row(scope: str, timings: List[float]) -> Dict[str, Any]:
+        return {
+            "bench": "replay",
+            "scope": scope,
+            "calls": len(timings),
+            "p50_ms": round(_percentile(timings, 50) * 1000, 2),
+            "p95_ms": round(_percentile(timings, 95) * 1000, 2),
+            "p99_ms": round(_percentile(timings, 99) * 1000, 2),
+        }
+
+    queries = result["query_totals"]
+    total = latency_row("updates", result["update_timings"])
+    total.update({
+        "speed": args.speed or "max",
+        "seconds": round(result["seconds"], 2),
+        "log_seconds": round(result["log_seconds"], 2),
+        "updates_per_sec": round(len(result["update_timings"]) / result["seconds"], 1),
+        "db_ms": round(sum(t for _, t in queries.values()) * 1000, 1),
+        "db_queries": sum(n for n, _ in queries.values()),
+        "errors": sum(result["errors"].values()),
+        "db_lock_errors": result["lock_errors"],
+    })
+    rows = [total]
+    handlers = result["handler_timings"]
+    for name in sorted(handlers, key=lambda n: -sum(handlers[n])):
+        rows.append(latency_row(name, handlers[name]))
+    for label, (count, seconds) in sorted(queries.items(), key=lambda item: -item[1][1]):
+        rows.append({
+            "bench": "replay",
+            "scope": f"db:{label}",
+            "calls": count,
+            "db_ms": round(seconds * 1000, 1),
+            "mean_us": round(seconds / count * 1e6, 1),
+        })
+    return rows
+
+
+# ==================== CLI ====================
+
+def _print_rows(rows: List[Dict[str, Any]], as_json: bool):
+    if as_json:
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+        return
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+# ==================== HEATMAP ====================
+
+def bench_heatmap(args) -> List[Dict[str, Any]]:
+    """Тепловая карта загрузки за длинную историю: чтение интервалов из БД и расчёт в NumPy"""
+    _prepare_database(args.db)
+    import database as db
+    import occupancy
+
+    db.init_database()
+    rng = random.Random(args.seed)
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    date_from = end - timedelta(days=args.days)
+    slots, bookings = [], []
+    for spot_id in range(1, args.spots + 1):
+        for day in range(args.days):
+            for _ in range(args.slots_per_day):
+                start = date_from + timedelta(days=day, hours=rng.randint(0, 20), minutes=rng.choice([0, 15, 30, 45]))
+                finish = start + timedelta(minutes=15 * rng.randint(4, 48))
+                row = (spot_id, start.strftime("%Y-%m-%d %H:%M:%S"), finish.strftime("%Y-%m-%d %H:%M:%S"))
+                slots.append(row)
+                if rng.random() < args.booked:
+                    bookings.append(row)
+    with db._direct_connection() as conn:
+        conn.executemany('INSERT INTO spot_availability (spot_id, start_time, end_time) VALUES (?, ?, ?)', slots)
+        conn.executemany('''
+            INSERT INTO bookings (customer_id, spot_id, availability_id, start_time, end_time, total_price, status)
+            VALUES (1, ?, 0, ?, ?, 100, 'confirmed')
+        ''', bookings)
+
+    rows = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        db.get_occupancy_intervals(date_from.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S"))
+        read = time.perf_counter() - started
+        started = time.perf_counter()
+        heatmap = occupancy.compute_heatmap(date_from, end)
+        total = time.perf_counter() - started
+        rows.append({
+            "bench": "heatmap",
+            "spots": len(heatmap['spot_ids']),
+            "days": args.days,
+            "intervals": len(slots) + len(bookings),
+            "read_ms": round(read * 1000, 1),
+            "compute_ms": round((total - read) * 1000, 1),
+            "total_ms": round(total * 1000, 1),
+        })
+    return rows
+
+
+# ==================== WRITES ====================
+
+def _write_slot_directly(db, spot_id: int, start: datetime, hold: float = 0):
+    """Слот своей транзакцией в своём соединении, в обход потока записи (как до него)"""
+    with db._direct_connection() as conn:
+        cursor = conn.cursor()
+        # Как create_spot_availability, но блокировка держится ещё hold секунд
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('INSERT INTO spot_availability (spot_id, start_time, end_time) VALUES (?, ?, ?)',
+                       (spot_id, start.strftime("%Y-%m-%d %H:%M:%S"),
+                        (start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")))
+        db.bump_slot_versions(cursor, 'id = ?', (cursor.lastrowid,))
+        if hold:
+            time.sleep(hold)
+
+
+async def _run_writers(db, mode: str, clients: int, writes: int, spot_id: int,
+                       first: datetime) -> Tuple[List[float], int, float]:
+    """clients задач пишут writes слотов на всех -> (задержки, мс; ошибки; секунды)"""
+    latencies, errors = [], 0
+    counter = iter(range(writes))
+
+    async def client():
+        nonlocal errors
+        for n in counter:
+            start = first + timedelta(minutes=30 * n)
+            started = time.perf_counter()
+            try:
+                if mode == "direct":
+                    await asyncio.to_thread(_write_slot_directly, db, spot_id, start)
+                else:
+                    await db.write(db.create_spot_availability, spot_id, start, start + timedelta(hours=1))
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def bench_writes(args) -> List[Dict[str, Any]]:
+    """Запись слотов из N одновременных хендлеров: соединение и COMMIT на запись (direct)
+    и поток записи с group commit (writer) - пропускная способность и p99 ожидания"""
+    _prepare_database(args.db)
+    import database as db
+
+    db.init_database()
+    telegram_id = _seed_users(db, 1)[0]
+    spot_id = db.create_parking_spot(db.get_user_by_telegram_id(telegram_id)['id'], "W1", 100)
+    rows = []
+    for run, clients in enumerate(args.clients):
+        for mode in ("direct", "writer"):
+            group = db._writer()
+            batches, ops = group.batches, group.ops
+            # Свои слоты у каждого прогона - без конфликтов уникальности
+            first = datetime(2030, 1, 1) + timedelta(days=365 * (2 * run + (mode == "writer")))
+            latencies, errors, seconds = asyncio.run(_run_writers(db, mode, clients, args.writes, spot_id, first))
+            rows.append({
+                "bench": "writes",
+                "mode": mode,
+                "clients": clients,
+                "writes": len(latencies),
+                "errors": errors,
+                "writes_per_sec": round(len(latencies) / seconds, 1),
+                "p50_ms": round(_percentile(latencies, 50), 2),
+                "p99_ms": round(_percentile(latencies, 99), 2),
+                "avg_batch": round((group.ops - ops) / max(1, group.batches - batches), 1) if mode == "writer" else 1,
+            })
+    return rows
+
+
+# ==================== TENANTS ====================
+
+def _tenant_writer(spec: str, code: str, index: int, seconds: float, hold: float,
+                   init_lock, barrier, results):
+    """Процесс-писатель ЖК: транзакции записи слота в его базу, пока не выйдет время"""
+    # TENANTS читается при импорте config - процесс стартует через spawn
+    os.environ["TENANTS"] = spec
+    import database as db
+
+    with db.use_tenant(code):
+        with init_lock:
+            db._init_tenant_database()
+            db.create_user(1_000_000 + index, f"writer{index}", f"Писатель {index}",
+                           f"8999{index:07d}", "4111111111111111", "Сбербанк")
+            spot_id = db.create_parking_spot(db.get_user_by_telegram_id(1_000_000 + index)['id'],
+                                             f"W{index}", 100)
+        barrier.wait()
+
+        first = datetime(2030, 1, 1)
+        writes = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            _write_slot_directly(db, spot_id, first + timedelta(minutes=30 * writes), hold)
+            writes += 1
+    results.put(writes)
+
+
+def bench_tenants(args) -> List[Dict[str, Any]]:
+    """Пропускная способность записи N ЖК: общая база (shared) и база на ЖК (per_tenant)
+
+    На каждый ЖК - процесс-писатель. --hold-ms - сколько транзакция держит
+    блокировку записи сверх самой записи (fsync, медленный диск): в общей базе
+    писатели ждут друг друга, в своих - нет.
+    """
+    import multiprocessing
+    context = multiprocessing.get_context("spawn")
+    base = os.path.splitext(args.db)[0]
+    rows = []
+    single: Dict[str, float] = {}
+    for count in args.tenants:
+        for layout in ("shared", "per_tenant"):
+            paths = [f"{base}_{i}.db" for i in range(count)] if layout == "per_tenant" else [args.db] * count
+            for path in set(paths):
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            spec = ";".join(f"t{i}:ЖК {i}:{path}" for i, path in enumerate(paths))
+
+            init_lock, barrier, results = context.Lock(), context.Barrier(count + 1), context.Queue()
+            writers = [context.Process(target=_tenant_writer,
+                                       args=(spec, f"t{i}", i, args.seconds, args.hold_ms / 1000,
+                                             init_lock, barrier, results))
+                       for i in range(count)]
+            for writer in writers:
+                writer.start()
+            barrier.wait()
+            writes = [results.get() for _ in writers]
+            for writer in writers:
+                writer.join()
+
+            rate = sum(writes) / args.seconds
+            single.setdefault(layout, rate)
+            rows.append({
+                "bench": "tenants",
+                "layout": layout,
+                "tenants": count,
+                "writes": sum(writes),
+                "writes_per_sec": round(rate, 1),
+                "per_tenant_per_sec": round(rate / count, 1),
+                "scaling": round(rate / single[layout], 2),
+            })
+    return rows
+
+
+# ==================== WAITLIST ====================
+
+def bench_waitlist(args) -> List[Dict[str, Any]]:
+    """Очередь подписчиков: предложение новых слотов и передача слота по отказам
+
+    Все --subscribers подписаны на одну дату. Каждый новый слот достаётся
+    первому без действующего предложения, каждый отказ - следующему, кому
+    этот слот ещё не предлагали: поиск кандидата растёт с длиной очереди.
+    """
+    _prepare_database(args.db)
+    import database as db
+
+    db.init_database()
+    day = (datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    supplier_id = db.get_user_by_telegram_id(_seed_users(db, 1, first_telegram_id=900_000)[0])['id']
+    spot_id = db.create_parking_spot(supplier_id, "Q1", 100)
+    subscriber_ids = [db.get_user_by_telegram_id(t)['id'] for t in _seed_users(db, args.subscribers)]
+    with db._direct_connection() as conn:
+        conn.executemany('''
+            INSERT INTO spot_notifications (user_id, desired_date, notify_any) VALUES (?, ?, 0)
+        ''', [(user_id, day.strftime("%Y-%m-%d")) for user_id in subscriber_ids])
+    # Слоты по минуте через минуту - все в одной дате
+    slot_ids = [db.create_spot_availability(spot_id, day + timedelta(minutes=2 * n),
+                                            day + timedelta(minutes=2 * n + 1))
+                for n in range(args.slots + 1)]
+
+    def row(operation: str, timings: List[float], offered: int) -> Dict[str, Any]:
+        return {"bench": "waitlist", "operation": operation, "subscribers": args.subscribers,
+                "calls": len(timings), "offered": offered,
+                "p50_us": round(_percentile(timings, 50), 1), "p99_us": round(_percentile(timings, 99), 1)}
+
+    timings, offered = [], 0
+    for slot_id in slot_ids[:-1]:
+        started = time.perf_counter()
+        offered += len(db.offer_slots([slot_id]))
+        timings.append((time.perf_counter() - started) * 1e6)
+    rows = [row("offer_slots", timings, offered)]
+
+    # Отказы по цепочке на последнем слоте: каждый раз он уходит следующему
+    timings = []
+    offers = db.offer_slots([slot_ids[-1]])
+    while offers and len(timings) < args.declines:
+        started = time.perf_counter()
+        offers = db.decline_offer(offers[0]['id'], offers[0]['user_id'])
+        timings.append((time.perf_counter() - started) * 1e6)
+    rows.append(row("decline_offer", timings, len(timings)))
+    return rows
+
+
+# ==================== RECORDS ====================
+
+def bench_records(args) -> List[Dict[str, Any]]:
+    """Строки выборок: dict(sqlite3.Row) (до) и records.Record (после) - время сборки и память списка"""
+    import sqlite3
+    import tracemalloc
+    import dataset
+    import records
+
+    dataset.generate(args.db, args.scale, args.seed)
+    conn = sqlite3.connect(args.db)
+    queries = [
+        ("users", records.User, "SELECT * FROM users"),
+        ("slots", records.Availability, '''
+            SELECT sa.*, ps.spot_number, ps.price_per_hour, u.full_name as supplier_name
+            FROM spot_availability sa
+            JOIN parking_spots ps ON sa.spot_id = ps.id
+            JOIN users u ON ps.supplier_id = u.id
+        '''),
+        ("bookings", records.Booking, "SELECT * FROM bookings"),
+        ("notifications", records.Notification, "SELECT * FROM spot_notifications WHERE is_active = 1"),
+    ]
+
+    def as_dicts(sql: str) -> list:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        return [dict(row) for row in cursor.execute(sql).fetchall()]
+
+    def as_records(sql: str, record) -> list:
+        cursor = conn.cursor()
+        cursor.row_factory = record.factory
+        return cursor.execute(sql).fetchall()
+
+    def measure(build) -> Tuple[float, int, int]:
+        """Лучшее время сборки из --repeat и память готового списка"""
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = build()
+            best = min(best, time.perf_counter() - started)
+            del result
+        tracemalloc.start()
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return best, size, len(result)
+
+    rows = []
+    for name, record, sql in queries:
+        dict_time, dict_size, count = measure(lambda: as_dicts(sql))
+        record_time, record_size, _ = measure(lambda: as_records(sql, record))
+        rows.append({
+            "bench": "records",
+            "query": name,
+            "rows": count,
+            "dict_ms": round(dict_time * 1000, 1),
+            "record_ms": round(record_time * 1000, 1),
+            "dict_mb": round(dict_size / 2 ** 20, 1),
+            "record_mb": round(record_size / 2 ** 20, 1),
+            "bytes_per_row_saved": round((dict_size - record_size) / max(count, 1)),
+        })
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки ParkingBot")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "parking_bench.db"),
+                        help="файл базы для бенчмарка (будет пересоздан)")
+    parser.add_argument("--json", action="store_true", help="вывод в JSON Lines")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    shards = subparsers.add_parser("shards", help="масштабирование по процессам-воркерам")
+    shards.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    shards.add_argument("--updates", type=int, default=20000)
+    shards.add_argument("--users", type=int, default=2000)
+    shards.add_argument("--latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    shards.set_defaults(func=bench_shards)
+
+    keyboards = subparsers.add_parser("keyboards", help="сборка клавиатур: заново и из кэша")
+    keyboards.add_argument("--iterations", type=int, default=20000)
+    keyboards.set_defaults(func=bench_keyboards)
+
+    search = subparsers.add_parser("search", help="повторные поиски: без кэша и с кэшем")
+    search.add_argument("--searches", type=int, default=20000)
+    search.add_argument("--write-ratio", type=float, default=0.02, help="доля бронирований/отмен между поисками")
+    search.add_argument("--users", type=int, default=200)
+    search.add_argument("--spots", type=int, default=300)
+    search.add_argument("--days", type=int, default=7)
+    search.add_argument("--slots-per-day", type=int, default=4)
+    search.add_argument("--seed", type=int, default=1)
+    search.set_defaults(func=bench_search)
+
+    database = subparsers.add_parser("db", help="функции database.py на синтетических данных (dataset.py)")
+    database.add_argument("--scales", type=int, nargs="+", default=[1000, 100000, 1000000],
+                          help="число жителей; места, слоты и брони пропорциональны")
+    database.add_argument("--iterations", type=int, default=200, help="вызовов на функцию")
+    database.add_argument("--max-seconds", type=float, default=2.0, help="лимит времени на функцию")
+    database.add_argument("--seed", type=int, default=1)
+    database.set_defaults(func=bench_db)
+
+    load = subparsers.add_parser("load", help="сквозная нагрузка виртуальными жителями (loadtest.py)")
+    load.add_argument("--residents", type=int, default=2000, help="зарегистрированных жителей")
+    load.add_argument("--new-residents", type=int, default=200, help="жителей, проходящих регистрацию")
+    load.add_argument("--admins", type=int, default=1, help="администраторов с рассылками")
+    load.add_argument("--rounds", type=int, default=3, help="сценариев на жителя")
+    load.add_argument("--broadcasts", type=int, default=1, help="рассылок на администратора")
+    load.add_argument("--processes", type=int, default=1, help="процессов с общей базой")
+    load.add_argument("--latency", type=float, default=0.02, help="задержка фейкового Bot API, с")
+    load.add_argument("--think", type=float, default=0.5, help="пауза жителя между действиями до, с")
+    load.add_argument("--seed", type=int, default=1)
+    load.set_defaults(func=bench_load)
+
+    replay = subparsers.add_parser("replay", help="записанный поток апдейтов (UPDATE_LOG) на снимке базы")
+    replay.add_argument("log", help="лог апдейтов")
+    replay.add_argument("--snapshot", required=True, help="снимок базы (не изменяется, прогон идёт на копии в --db)")
+    replay.add_argument("--speed", type=_speed, default=1.0, help="1, 10, ... или max - без пауз")
+    replay.add_argument("--max-gap", type=float, default=60.0, help="паузы длиннее сжимаются до стольких секунд")
+    replay.add_argument("--latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    replay.add_argument("--salt", default="", help="ключ анонимизации (по умолчанию UPDATE_LOG_SALT)")
+    replay.set_defaults(func=bench_replay)
+
+    heatmap = subparsers.add_parser("heatmap", help="тепловая карта загрузки за длинную историю (occupancy.py)")
+    heatmap.add_argument("--spots", type=int, default=5000)
+    heatmap.add_argument("--days", type=int, default=365)
+    heatmap.add_argument("--slots-per-day", type=int, default=1)
+    heatmap.add_argument("--booked", type=float, default=0.3, help="доля слотов с бронью")
+    heatmap.add_argument("--repeat", type=int, default=3)
+    heatmap.add_argument("--seed", type=int, default=1)
+    heatmap.set_defaults(func=bench_heatmap)
+
+    records = subparsers.add_parser("records", help="строки выборок: dict и records.Record (время и память)")
+    records.add_argument("--scale", type=int, default=100000, help="число жителей (dataset.py)")
+    records.add_argument("--repeat", type=int, default=3)
+    records.add_argument("--seed", type=int, default=1)
+    records.set_defaults(func=bench_records)
+
+    writes = subparsers.add_parser("writes", help="запись из одновременных хендлеров: без потока записи и с ним")
+    writes.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50], help="одновременных писателей")
+    writes.add_argument("--writes", type=int, default=2000, help="записей на прогон")
+    writes.set_defaults(func=bench_writes)
+
+    tenants = subparsers.add_parser("tenants", help="запись нескольких ЖК: общая база и база на ЖК")
+    tenants.add_argument("--tenants", type=int, nargs="+", default=[1, 2, 4], help="число ЖК (первое - база сравнения)")
+    tenants.add_argument("--seconds", type=float, default=3.0, help="время записи")
+    tenants.add_argument("--hold-ms", type=float, default=5.0,
+                         help="блокировка записи сверх самой записи на транзакцию, мс (0 - только CPU)")
+    tenants.set_defaults(func=bench_tenants)
+
+    waitlist = subparsers.add_parser("waitlist", help="очередь подписчиков: предложения слотов и отказы")
+    waitlist.add_argument("--subscribers", type=int, default=5000, help="подписчиков на одну дату")
+    waitlist.add_argument("--slots", type=int, default=500, help="новых слотов на эту дату")
+    waitlist.add_argument("--declines", type=int, default=200, help="отказов подряд от одного слота")
+    waitlist.set_defaults(func=bench_waitlist)
+
+    args = parser.parse_args()
+    # Воркеры читают уровень логов из окружения - не пишем строку лога на каждый апдейт
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Синтетическая нагрузка заведомо быстрее живых пользователей - антифлуд её бы отбросил
+    os.environ.setdefault("THROTTLE_ENABLED", "0")
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+
+    _print_rows(args.func(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,16 +11,97 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 
 # Database
 DATABASE_PATH = os.getenv("DATABASE_PATH", "parking.db")
+DB_BUSY_TIMEOUT = 10  # секунды ожидания блокировки записи
+WRITE_BATCH_MAX = 200  # операций записи в одной транзакции потока записи (group commit)
+
+
+def _parse_tenants(spec: str) -> dict:
+    """"код:Название:файл;..." -> {код: (название, файл)}"""
+    tenants = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        code, name, path = (field.strip() for field in item.split(":", 2))
+        tenants[code] = (name, path)
+    return tenants
+
+
+# Несколько ЖК в одном боте: у каждого своя база, жилец выбирает ЖК при регистрации.
+# Пусто - один ЖК в DATABASE_PATH. Справочник telegram_id -> ЖК - отдельный файл
+TENANTS = _parse_tenants(os.getenv("TENANTS", "")) or {"main": ("ParkingBot", DATABASE_PATH)}
+TENANT_DIRECTORY_PATH = os.getenv("TENANT_DIRECTORY_PATH", "tenants.db")
+TENANT_CACHE_USERS = 50000  # соответствий жилец -> ЖК в памяти процесса
+
+# Workers (шардирование апдейтов по процессам, 1 - без шардирования)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_QUEUE_SIZE = 1000  # апдейтов в очереди одного воркера
+WORKER_CONCURRENCY = 100  # одновременно обрабатываемых апдейтов в воркере
+WORKER_BACKLOG = 1000  # принятых, но не обработанных апдейтов в воркере (ждут своей очереди)
 
 # Admin settings
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "qwerty123")
-ADMIN_SESSION_HOURS = 24
+ADMIN_SESSION_HOURS = 24  # сессия истекает после стольких часов без действий
+ADMIN_ACTIVITY_FLUSH_SECONDS = 60  # как часто писать активность админов в базу
 
 # Limits
 MAX_SPOTS_PER_USER = 10
 MAX_ACTIVE_BOOKINGS = 5
+SLOTS_PER_PAGE = 10  # слотов на странице результатов поиска
+MAX_BULK_SLOTS = 100  # интервалов в одном списке "несколько слотов"
 MIN_ACTION_INTERVAL = 1  # секунды между действиями
 
+# Throttling (антифлуд)
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1") == "1"
+THROTTLE_USER_BURST = 5  # действий подряд без паузы
+THROTTLE_GLOBAL_RATE = 200  # апдейтов в секунду на процесс
+THROTTLE_GLOBAL_BURST = 400
+THROTTLE_MAX_USERS = 50000  # пользователей в памяти, дальше вытесняются давно неактивные
+
+# Метрики Prometheus (/metrics; воркеры - на METRICS_PORT + 1 + номер)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Лог медленных запросов (0 - выключен)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# Лог входящих апдейтов для replay.py ("" - не писать) и ключ анонимизации id в нём
+UPDATE_LOG = os.getenv("UPDATE_LOG", "")
+UPDATE_LOG_SALT = os.getenv("UPDATE_LOG_SALT", "")
+
+# Доменные события (events.py): очередь одного подписчика и лог для replay ("" - не писать)
+EVENT_QUEUE_SIZE = 1000
+EVENT_LOG = os.getenv("EVENT_LOG", "")
+
+# Кэш результатов поиска (0 - выключен)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+
+# Выгрузки CSV для админов (/export)
+EXPORT_CHUNK_ROWS = 1000  # строк за один запрос к БД
+EXPORT_GZIP_BYTES = 1024 * 1024  # файлы больше сжимаются в .csv.gz
+EXPORT_MAX_BYTES = 50 * 1024 * 1024  # лимит Telegram на отправку документа ботом
+
+# Импорт жильцов из CSV (/import)
+IMPORT_CHUNK_ROWS = 500  # жильцов в одной транзакции записи
+IMPORT_MAX_BYTES = 2 * 1024 * 1024  # около 20 000 строк; больший файл не скачивается
+IMPORT_MAX_ERRORS_SHOWN = 20  # ошибок в ответе админу, остальные - числом
+
+# Расписания мест: слоты создаются фоновой задачей на RULE_HORIZON_DAYS вперёд,
+# поиск на более позднюю дату досоздаёт их, но не дальше RULE_MAX_DAYS_AHEAD
+MAX_RULES_PER_SPOT = 5
+RULE_HORIZON_DAYS = 14
+RULE_MAX_DAYS_AHEAD = 92
+
+# Очередь подписчиков: новый или освободившийся слот предлагается первому
+# подходящему и придержан за ним, потом переходит следующему
+OFFER_HOLD_MINUTES = 10
+OFFER_CHECK_SECONDS = 30  # как часто просроченные предложения передаются дальше
+
+# Тепловая карта загрузки (/heatmap, подсказка цены)
+OCCUPANCY_DAYS = 28  # целые недели; свободные слоты старше 30 дней удаляет очистка
+OCCUPANCY_CACHE_SECONDS = 600  # карта по всему ЖК для подсказки цены
+
 # Pricing limits
 MIN_PRICE_PER_HOUR = 1
 MAX_PRICE_PER_HOUR = 10000
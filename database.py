@@ -4,20 +4,214 @@
 import sqlite3
 import json
 import logging
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import threading
+import asyncio
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar, Token
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple, Type
 from contextlib import contextmanager
 
-from config import DATABASE_PATH
+from config import (
+    DB_BUSY_TIMEOUT, METRICS_ENABLED, SLOW_QUERY_MS, RULE_MAX_DAYS_AHEAD, ADMIN_SESSION_HOURS,
+    IMPORT_CHUNK_ROWS, TENANTS, TENANT_DIRECTORY_PATH, OFFER_HOLD_MINUTES
+)
+import writer
+from metrics import TimedConnection
+from records import Record, User, Spot, Availability, Booking, Notification, Offer
 
 logger = logging.getLogger(__name__)
 
 
+# ==================== TENANTS ====================
+
+# ЖК текущего апдейта или задачи: все функции модуля работают с его базой.
+# Ставит TenantMiddleware по автору апдейта, фоновые задачи - use_tenant
+_tenant: ContextVar[Optional[str]] = ContextVar('tenant', default=None)
+_fan_out_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_tenant() -> str:
+    """Код текущего ЖК (без выбора - первый из TENANTS)"""
+    return _tenant.get() or next(iter(TENANTS))
+
+
+def set_tenant(code: str) -> Token:
+    """Сделать ЖК текущим до reset_tenant(token)"""
+    if code not in TENANTS:
+        raise KeyError(f"unknown tenant {code!r}")
+    return _tenant.set(code)
+
+
+def reset_tenant(token: Token):
+    _tenant.reset(token)
+
+
+@contextmanager
+def use_tenant(code: str):
+    """Контекст с текущим ЖК code"""
+    token = set_tenant(code)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def tenant_codes() -> List[str]:
+    return list(TENANTS)
+
+
+def tenant_name(code: str = None) -> str:
+    return TENANTS[code or get_tenant()][0]
+
+
+def fan_out(func: Callable[..., Any], *args, **kwargs) -> Dict[str, Any]:
+    """Вызвать функцию модуля в каждом ЖК параллельно -> {код ЖК: результат}
+
+    Базы ЖК - разные файлы, запросы к ним не ждут друг друга; sqlite3 отпускает
+    GIL на время запроса, поэтому хватает потоков.
+    """
+    global _fan_out_pool
+    if len(TENANTS) == 1:
+        return {get_tenant(): func(*args, **kwargs)}
+    if _fan_out_pool is None:
+        _fan_out_pool = ThreadPoolExecutor(max_workers=len(TENANTS), thread_name_prefix="tenant")
+
+    def run(code: str):
+        with use_tenant(code):
+            return func(*args, **kwargs)
+
+    futures = {code: _fan_out_pool.submit(run, code) for code in TENANTS}
+    return {code: future.result() for code, future in futures.items()}
+
+
+def get_user_tenant(telegram_id: int) -> Optional[str]:
+    """ЖК жильца из справочника (None - ещё не выбирал)"""
+    with _directory() as conn:
+        row = conn.execute('SELECT tenant FROM user_tenants WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    return row[0] if row and row[0] in TENANTS else None
+
+
+def set_user_tenant(telegram_id: int, code: str):
+    """Записать ЖК жильца в справочник"""
+    if code not in TENANTS:
+        raise KeyError(f"unknown tenant {code!r}")
+    with _directory() as conn:
+        conn.execute('INSERT OR REPLACE INTO user_tenants (telegram_id, tenant) VALUES (?, ?)',
+                     (telegram_id, code))
+
+
+@contextmanager
+def _directory():
+    """Соединение со справочником жилец -> ЖК (общий на все ЖК файл)"""
+    conn = sqlite3.connect(TENANT_DIRECTORY_PATH, timeout=DB_BUSY_TIMEOUT)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _init_directory():
+    with _directory() as conn:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_tenants (
+                telegram_id INTEGER PRIMARY KEY,
+                tenant TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+# ==================== CONNECTIONS ====================
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    """Открыть соединение с БД с общими настройками (по умолчанию - с базой текущего ЖК)"""
+    # timeout - сколько ждать блокировку записи, пока пишет другой процесс
+    # С метриками или логом медленных запросов каждый запрос меряется TimedCursor
+    factory = TimedConnection if METRICS_ENABLED or SLOW_QUERY_MS > 0 else sqlite3.Connection
+    conn = sqlite3.connect(path or TENANTS[get_tenant()][1], timeout=DB_BUSY_TIMEOUT, factory=factory)
+    # Строки - Record: кортеж значений и общая на выборку раскладка колонок
+    conn.row_factory = Record.factory
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def _cursor(conn: sqlite3.Connection, record: Type[Record]) -> sqlite3.Cursor:
+    """Курсор, строки которого - записи типа record"""
+    cursor = conn.cursor()
+    cursor.row_factory = record.factory
+    return cursor
+
+
+_readers = threading.local()
+
+# Версия данных для разовых миграций (PRAGMA user_version)
+SCHEMA_VERSION = 4
+
+# telegram_id NULL - жилец из импорта (/import), ещё не заходивший в бот
+USERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER UNIQUE,
+        username TEXT,
+        full_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        card_number TEXT NOT NULL,
+        bank TEXT NOT NULL,
+        role TEXT DEFAULT 'user',
+        is_active INTEGER DEFAULT 1,
+        balance REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# UPDATE ... RETURNING (SQLite 3.35+) возвращает изменённую строку тем же запросом
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Фильтры журнала - колонки admin_logs с индексом (колонка, created_at, id)
+ADMIN_LOG_FILTERS = ('action_type', 'user_id', 'spot_id', 'booking_id')
+
+
+def _reader() -> sqlite3.Connection:
+    """Долгоживущее соединение потока с базой текущего ЖК только для чтения
+
+    В WAL чтения не ждут писателя: у каждого потока (цикл событий, потоки
+    fan_out и asyncio.to_thread) своё соединение, запись через него запрещена.
+    """
+    conns = getattr(_readers, 'conns', None)
+    if conns is None:
+        conns = _readers.conns = {}
+    tenant = get_tenant()
+    conn = conns.get(tenant)
+    if conn is None:
+        conn = conns[tenant] = _connect()
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
 @contextmanager
 def get_connection():
-    """Контекстный менеджер для соединения с БД"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    """Соединение для запросов функций модуля
+
+    Внутри операции записи - соединение потока записи в транзакции его пачки,
+    иначе - читающее соединение потока (_reader).
+    """
+    conn = writer.current_connection()
+    try:
+        yield conn if conn is not None else _reader()
+    except Exception as e:
+        if conn is None:
+            logger.error(f"Database error: {e}")
+        raise
+
+
+@contextmanager
+def _direct_connection():
+    """Своё соединение с транзакцией в обход потока записи - схема и миграции при старте"""
+    conn = _connect()
     try:
         yield conn
         conn.commit()
@@ -29,27 +223,99 @@ def get_connection():
         conn.close()
 
 
+# ==================== WRITER ====================
+
+# Файл базы -> его поток записи (несколько ЖК могут делить файл)
+_writers: Dict[str, writer.GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def _writer() -> writer.GroupCommitWriter:
+    """Поток записи базы текущего ЖК (запускается при первой записи)"""
+    path = TENANTS[get_tenant()][1]
+    group = _writers.get(path)
+    if group is None:
+        with _writers_lock:
+            group = _writers.get(path)
+            if group is None:
+                group = _writers[path] = writer.GroupCommitWriter(lambda: _connect(path), name=path)
+    return group
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def writes(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Функция записи: выполняется потоком записи базы текущего ЖК в пачке с другими
+
+    Синхронный вызов ждёт COMMIT своей пачки, поэтому из потока с циклом событий
+    запрещён - там только await write(func, ...). Вызов из другой операции записи
+    выполняется сразу, в её транзакции.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if writer.current_connection() is not None:
+            return func(*args, **kwargs)
+        if _in_event_loop():
+            raise RuntimeError(f"{func.__name__} would block the event loop: use await db.write()")
+        return _writer().submit(func, *args, **kwargs).result()
+    wrapper.is_write = True
+    return wrapper
+
+
+def submit_write(func: Callable[..., Any], *args, **kwargs) -> Future:
+    """Поставить функцию записи модуля в очередь потока записи -> Future результата"""
+    if not getattr(func, 'is_write', False):
+        raise TypeError(f"{func.__name__} is not a write operation")
+    return _writer().submit(func.__wrapped__, *args, **kwargs)
+
+
+async def write(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Выполнить функцию записи, не блокируя цикл событий: результат - после COMMIT пачки"""
+    return await asyncio.wrap_future(submit_write(func, *args, **kwargs))
+
+
+def stop_writers():
+    """Дописать очереди и остановить потоки записи (остановка бота)"""
+    with _writers_lock:
+        groups = list(_writers.values())
+        _writers.clear()
+    for group in groups:
+        group.stop()
+
+
+def close_connections():
+    """Закрыть читающие соединения потока и потоки записи - перед пересозданием файла базы"""
+    for conn in getattr(_readers, 'conns', {}).values():
+        conn.close()
+    _readers.conns = {}
+    stop_writers()
+
+
 def init_database():
-    """Инициализация базы данных"""
-    with get_connection() as conn:
+    """Инициализация баз всех ЖК и справочника жильцов"""
+    for code in TENANTS:
+        with use_tenant(code):
+            _init_tenant_database()
+    if len(TENANTS) > 1:
+        _init_directory()
+
+
+def _init_tenant_database():
+    """Схема и миграции базы текущего ЖК"""
+    with _direct_connection() as conn:
         cursor = conn.cursor()
         
+        # WAL: читатели не блокируют писателя - нужно для нескольких процессов-воркеров
+        cursor.execute('PRAGMA journal_mode = WAL')
+        
         # Таблица пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE NOT NULL,
-                username TEXT,
-                full_name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                card_number TEXT NOT NULL,
-                bank TEXT NOT NULL,
-                role TEXT DEFAULT 'user',
-                is_active INTEGER DEFAULT 1,
-                balance REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        cursor.execute(USERS_TABLE.format(name='users'))
         
         # Таблица парковочных мест
         cursor.execute('''
@@ -77,6 +343,8 @@ def init_database():
                 is_booked INTEGER DEFAULT 0,
                 booked_by INTEGER,
                 booking_id INTEGER,
+                rule_id INTEGER,
+                held_by INTEGER,
                 FOREIGN KEY (spot_id) REFERENCES parking_spots (id),
                 FOREIGN KEY (booked_by) REFERENCES users (id),
                 FOREIGN KEY (booking_id) REFERENCES bookings (id),
@@ -84,6 +352,33 @@ def init_database():
             )
         ''')
         
+        # Расписания мест: дни недели (бит 0 - понедельник) и время; слоты по ним
+        # создаются заранее только до materialized_until (включительно)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS availability_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spot_id INTEGER NOT NULL,
+                weekdays INTEGER NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                valid_from DATE NOT NULL,
+                valid_until DATE,
+                materialized_until DATE NOT NULL,
+                is_active INTEGER DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (spot_id) REFERENCES parking_spots (id)
+            )
+        ''')
+        # Дни, в которые слот по расписанию не нужен
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS availability_rule_exceptions (
+                rule_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                PRIMARY KEY (rule_id, date),
+                FOREIGN KEY (rule_id) REFERENCES availability_rules (id)
+            )
+        ''')
+        
         # Таблица бронирований
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS bookings (
@@ -121,6 +416,23 @@ def init_database():
             )
         ''')
         
+        # Предложения слотов подписчикам: слот придержан за жильцом до expires_at
+        # (spot_availability.held_by), потом переходит следующему в очереди
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS slot_offers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                availability_id INTEGER NOT NULL,
+                notification_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'offered',
+                expires_at TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (availability_id) REFERENCES spot_availability (id),
+                FOREIGN KEY (notification_id) REFERENCES spot_notifications (id),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
         # Таблица сессий админов
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS admin_sessions (
@@ -149,37 +461,197 @@ def init_database():
             )
         ''')
         
+        # Версии дат для кэша поиска: растут в той же транзакции, что и запись
+        # слотов, поэтому устаревший результат не отдаст ни один процесс
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS slot_versions (
+                date TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Аналитика: сводки по дню использования места (date(start_time))
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                day TEXT PRIMARY KEY,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                cancellations INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                booked_hours REAL NOT NULL DEFAULT 0,
+                offered_hours REAL NOT NULL DEFAULT 0,
+                empty_searches INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_spot_stats (
+                day TEXT NOT NULL,
+                spot_id INTEGER NOT NULL,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                cancellations INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                booked_hours REAL NOT NULL DEFAULT 0,
+                offered_hours REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, spot_id)
+            )
+        ''')
+        # Водяные знаки сводок: до какого id источника данные уже сложены
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_watermarks (
+                source TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP
+            )
+        ''')
+        # Поиски без результатов копятся до следующего прохода сводок
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS empty_searches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                search_date TEXT NOT NULL
+            )
+        ''')
+        
         # Создаём индексы
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_spots_supplier_id ON parking_spots(supplier_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_spots_available ON parking_spots(is_available)')
+        # Булевы индексы сбивают планировщик без ANALYZE: он выбирает их вместо
+        # индексов поиска и читает все свободные слоты/места подряд
+        cursor.execute('DROP INDEX IF EXISTS idx_spots_available')
+        # Поиск по цене: места по возрастанию цены, по каждому - слоты дня
+        # через UNIQUE(spot_id, start_time, end_time)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_spots_price ON parking_spots(price_per_hour, id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_availability_spot_id ON spot_availability(spot_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_availability_time ON spot_availability(start_time, end_time)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_availability_booked ON spot_availability(is_booked)')
+        # Период + spot_id: тепловая карта загрузки читает слоты только из индекса
+        cursor.execute('DROP INDEX IF EXISTS idx_availability_time')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_availability_period ON spot_availability(start_time, end_time, spot_id)')
+        # Индекс по одному флагу is_booked планировщик выбирал вместо диапазона по времени
+        cursor.execute('DROP INDEX IF EXISTS idx_availability_booked')
+        cursor.execute('DROP INDEX IF EXISTS idx_availability_free')
+        # Поиск свободных слотов: диапазон по дню + сортировка/курсор (start_time, id);
+        # end_time и spot_id проверяются по индексу, без чтения строки
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_availability_search
+            ON spot_availability(start_time, id, end_time, spot_id) WHERE is_booked = 0
+        ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_customer ON bookings(customer_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_spot ON bookings(spot_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_bookings_period
+            ON bookings(start_time, end_time, spot_id) WHERE status != 'cancelled'
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rules_spot ON availability_rules(spot_id)')
+        # Досоздание слотов: правила, отстающие от нужной даты
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rules_pending
+            ON availability_rules(materialized_until) WHERE is_active = 1
+        ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON spot_notifications(user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_active ON spot_notifications(is_active)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_admin_logs_type ON admin_logs(action_type)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_admin_logs_created ON admin_logs(created_at)')
+        # Очередь подписчиков на дату (и NULL - на любую) в порядке подписки:
+        # подбор идёт по индексу и останавливается на первом подходящем
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notifications_waitlist
+            ON spot_notifications(desired_date, id) WHERE is_active = 1
+        ''')
+        # Кому слот уже предлагался; действующие предложения - по жильцу и по сроку
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_offers_slot ON slot_offers(availability_id, user_id)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_offers_user ON slot_offers(user_id) WHERE status = 'offered'
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_offers_expires ON slot_offers(expires_at) WHERE status = 'offered'
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_admin_sessions_telegram ON admin_sessions(telegram_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_admin_sessions_activity ON admin_sessions(last_activity)')
         
-        logger.info("Database initialized successfully")
+        # Журнал: каждый фильтр + порядок/курсор (created_at, id) - одним диапазоном индекса
+        cursor.execute('DROP INDEX IF EXISTS idx_admin_logs_type')
+        cursor.execute('DROP INDEX IF EXISTS idx_admin_logs_created')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_admin_logs_time ON admin_logs(created_at, id)')
+        for column in ADMIN_LOG_FILTERS:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_admin_logs_{column} ON admin_logs({column}, created_at, id)')
+        
+        _migrate(cursor)
+        # Слоты расписания - после миграции, которая добавляет rule_id в старые базы
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_availability_rule
+            ON spot_availability(rule_id, start_time) WHERE rule_id IS NOT NULL
+        ''')
+        
+        logger.info(f"Database initialized successfully ({get_tenant()})")
+
+
+def _migrate(cursor: sqlite3.Cursor):
+    """Разовые преобразования данных, версия схемы - в PRAGMA user_version"""
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    
+    if version < 1:
+        # Отмена писалась в журнал только с booking_id - жильца и место берём из брони,
+        # чтобы фильтры журнала по ним находили и отмены
+        cursor.execute('''
+            UPDATE admin_logs
+            SET user_id = (SELECT customer_id FROM bookings WHERE bookings.id = admin_logs.booking_id),
+                spot_id = (SELECT spot_id FROM bookings WHERE bookings.id = admin_logs.booking_id)
+            WHERE action_type = 'booking_cancelled' AND booking_id IS NOT NULL AND user_id IS NULL
+        ''')
+        if cursor.rowcount:
+            logger.info(f"Backfilled {cursor.rowcount} booking_cancelled log entries")
+    
+    if version < 2:
+        # Слоты, созданные по расписанию, ссылаются на своё правило
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(spot_availability)')}
+        if 'rule_id' not in columns:
+            cursor.execute('ALTER TABLE spot_availability ADD COLUMN rule_id INTEGER')
+    
+    if version < 3:
+        # telegram_id без NOT NULL для импортированных жильцов. SQLite не снимает
+        # ограничение с колонки - таблица пересоздаётся с теми же id и индексами
+        columns = {row[1]: row[3] for row in cursor.execute('PRAGMA table_info(users)')}
+        if columns['telegram_id']:
+            indexes = [row[0] for row in cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'users' AND sql IS NOT NULL"
+            )]
+            cursor.execute(USERS_TABLE.format(name='users_new'))
+            cursor.execute('INSERT INTO users_new SELECT * FROM users')
+            cursor.execute('DROP TABLE users')
+            cursor.execute('ALTER TABLE users_new RENAME TO users')
+            for sql in indexes:
+                cursor.execute(sql)
+            logger.info("Rebuilt users table with nullable telegram_id")
+    
+    if version < 4:
+        # Слот, предложенный подписчику, придержан за ним до конца предложения
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(spot_availability)')}
+        if 'held_by' not in columns:
+            cursor.execute('ALTER TABLE spot_availability ADD COLUMN held_by INTEGER')
+    
+    if version < SCHEMA_VERSION:
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
 
 
 # ==================== USER OPERATIONS ====================
 
-def get_user_by_telegram_id(telegram_id: int) -> Optional[Dict[str, Any]]:
+def get_user_by_telegram_id(telegram_id: int) -> Optional[User]:
     """Получить пользователя по telegram_id"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, User)
         cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        return row
+
+
+def get_user_by_id(user_id: int) -> Optional[User]:
+    """Получить пользователя по ID"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, User)
+        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        row = cursor.fetchone()
+        return row
 
 
+@writes
 def create_user(telegram_id: int, username: str, full_name: str, 
                 phone: str, card_number: str, bank: str) -> int:
     """Создать нового пользователя"""
@@ -193,36 +665,59 @@ def create_user(telegram_id: int, username: str, full_name: str,
         
         # Логируем действие
         log_admin_action('user_registered', user_id=user_id, 
-                        details=json.dumps({'full_name': full_name, 'phone': phone}))
+                        details=json.dumps({'full_name': full_name, 'phone': phone}),
+                        cursor=cursor)
         
         return user_id
 
 
-def update_user(user_id: int, **kwargs) -> bool:
-    """Обновить данные пользователя"""
+def _update_returning(cursor: sqlite3.Cursor, table: str, set_clause: str,
+                      row_id: int, params: list, where: str = '') -> Optional[Record]:
+    """UPDATE строки по id (и условию where); вернуть её новое состояние (None - строки нет
+    или условие не выполнено)
+
+    На SQLite без RETURNING строка дочитывается отдельным SELECT в той же транзакции.
+    """
+    condition = f'id = ? AND {where}' if where else 'id = ?'
+    if HAS_RETURNING:
+        cursor.execute(f'UPDATE {table} SET {set_clause} WHERE {condition} RETURNING *', params + [row_id])
+        rows = cursor.fetchall()
+        return rows[0] if rows else None
+    cursor.execute(f'UPDATE {table} SET {set_clause} WHERE {condition}', params + [row_id])
+    if not cursor.rowcount:
+        return None
+    cursor.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,))
+    return cursor.fetchone()
+
+
+@writes
+def update_user(user_id: int, **kwargs) -> Optional[User]:
+    """Обновить данные пользователя; вернуть обновлённого (None - не найден или нечего обновлять)"""
     allowed_fields = ['full_name', 'phone', 'card_number', 'bank', 'role', 'is_active', 'balance']
     updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
     
     if not updates:
-        return False
+        return None
     
     set_clause = ', '.join([f"{k} = ?" for k in updates.keys()])
-    values = list(updates.values()) + [user_id]
     
     with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(f'UPDATE users SET {set_clause} WHERE id = ?', values)
-        return cursor.rowcount > 0
+        cursor = _cursor(conn, User)
+        row = _update_returning(cursor, 'users', set_clause, user_id, list(updates.values()))
+        if row and updates.keys() & {'full_name', 'card_number', 'bank'}:
+            # Имя и реквизиты поставщика есть в каждой выдаче поиска
+            bump_slot_versions(cursor)
+        return row
 
 
-def get_all_users(limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+def get_all_users(limit: int = 10, offset: int = 0) -> List[User]:
     """Получить всех пользователей с пагинацией"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, User)
         cursor.execute('''
             SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?
         ''', (limit, offset))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
 def get_users_count() -> int:
@@ -233,31 +728,35 @@ def get_users_count() -> int:
         return cursor.fetchone()[0]
 
 
-def get_admins() -> List[Dict[str, Any]]:
+def get_admins() -> List[User]:
     """Получить всех администраторов"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, User)
         cursor.execute('SELECT * FROM users WHERE role = ?', ('admin',))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
-def set_user_role(user_id: int, role: str) -> bool:
-    """Установить роль пользователя"""
+@writes
+def set_user_role(user_id: int, role: str) -> Optional[User]:
+    """Установить роль пользователя; вернуть обновлённого"""
     return update_user(user_id, role=role)
 
 
-def block_user(user_id: int) -> bool:
-    """Заблокировать пользователя"""
+@writes
+def block_user(user_id: int) -> Optional[User]:
+    """Заблокировать пользователя; вернуть обновлённого"""
     return update_user(user_id, is_active=0)
 
 
-def unblock_user(user_id: int) -> bool:
-    """Разблокировать пользователя"""
+@writes
+def unblock_user(user_id: int) -> Optional[User]:
+    """Разблокировать пользователя; вернуть обновлённого"""
     return update_user(user_id, is_active=1)
 
 
 # ==================== PARKING SPOTS OPERATIONS ====================
 
+@writes
 def create_parking_spot(supplier_id: int, spot_number: str, price_per_hour: float,
                         is_partial_allowed: bool = True, address: str = None,
                         description: str = None) -> int:
@@ -273,11 +772,13 @@ def create_parking_spot(supplier_id: int, spot_number: str, price_per_hour: floa
         
         # Логируем действие
         log_admin_action('spot_added', spot_id=spot_id, user_id=supplier_id,
-                        details=json.dumps({'spot_number': spot_number, 'price': price_per_hour}))
+                        details=json.dumps({'spot_number': spot_number, 'price': price_per_hour}),
+                        cursor=cursor)
         
         return spot_id
 
 
+@writes
 def create_spot_availability(spot_id: int, start_time: datetime, end_time: datetime) -> int:
     """Создать слот доступности для места"""
     with get_connection() as conn:
@@ -287,18 +788,61 @@ def create_spot_availability(spot_id: int, start_time: datetime, end_time: datet
             VALUES (?, ?, ?)
         ''', (spot_id, start_time.strftime("%Y-%m-%d %H:%M:%S"), 
               end_time.strftime("%Y-%m-%d %H:%M:%S")))
-        return cursor.lastrowid
+        availability_id = cursor.lastrowid
+        bump_slot_versions(cursor, 'id = ?', (availability_id,))
+        return availability_id
+
+
+def _merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """Объединить пересекающиеся и смыкающиеся интервалы, по возрастанию начала"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
 
 
-def get_user_spots(user_id: int) -> List[Dict[str, Any]]:
+@writes
+def create_spot_availabilities(spot_id: int, intervals: List[Tuple[datetime, datetime]]) -> Dict[str, Any]:
+    """Создать слоты места из списка интервалов одной транзакцией
+    
+    Пересечения внутри списка объединяются, уже существующие слоты пропускаются.
+    Возвращает {'slots': созданные слоты, 'merged': сколько интервалов поглощено
+    соседними, 'existing': сколько уже было}.
+    """
+    if any(end <= start for start, end in intervals):
+        raise ValueError("slot end must be after its start")
+    merged = _merge_intervals(intervals)
+    rows = [(spot_id, start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S"))
+            for start, end in merged]
+    with get_connection() as conn:
+        cursor = _cursor(conn, Availability)
+        # Пачка потока записи начата с BEGIN IMMEDIATE: новые строки - все id после текущего максимума
+        last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM spot_availability').fetchone()[0]
+        cursor.executemany('''
+            INSERT OR IGNORE INTO spot_availability (spot_id, start_time, end_time)
+            VALUES (?, ?, ?)
+        ''', rows)
+        bump_slot_versions(cursor, 'id > ? AND spot_id = ?', (last_id, spot_id))
+        cursor.execute('''
+            SELECT id, spot_id, start_time, end_time FROM spot_availability
+            WHERE id > ? AND spot_id = ? ORDER BY start_time
+        ''', (last_id, spot_id))
+        slots = cursor.fetchall()
+    return {'slots': slots, 'merged': len(intervals) - len(merged), 'existing': len(merged) - len(slots)}
+
+
+def get_user_spots(user_id: int) -> List[Spot]:
     """Получить места пользователя"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Spot)
         cursor.execute('''
             SELECT * FROM parking_spots WHERE supplier_id = ? AND is_available = 1
             ORDER BY created_at DESC
         ''', (user_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
 def get_user_spots_count(user_id: int) -> int:
@@ -311,19 +855,19 @@ def get_user_spots_count(user_id: int) -> int:
         return cursor.fetchone()[0]
 
 
-def get_spot_by_id(spot_id: int) -> Optional[Dict[str, Any]]:
+def get_spot_by_id(spot_id: int) -> Optional[Spot]:
     """Получить место по ID"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Spot)
         cursor.execute('SELECT * FROM parking_spots WHERE id = ?', (spot_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        return row
 
 
-def get_all_spots() -> List[Dict[str, Any]]:
+def get_all_spots() -> List[Spot]:
     """Получить все места"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Spot)
         cursor.execute('''
             SELECT ps.*, u.full_name as supplier_name 
             FROM parking_spots ps
@@ -331,51 +875,240 @@ def get_all_spots() -> List[Dict[str, Any]]:
             WHERE ps.is_available = 1
             ORDER BY ps.created_at DESC
         ''')
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
+@writes
 def delete_spot(spot_id: int) -> bool:
     """Удалить (скрыть) место"""
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE parking_spots SET is_available = 0 WHERE id = ?', (spot_id,))
-        return cursor.rowcount > 0
+        hidden = cursor.rowcount > 0
+        bump_slot_versions(cursor, 'spot_id = ? AND end_time > datetime("now")', (spot_id,))
+        # Расписания скрытого места больше не создают слотов
+        cursor.execute('UPDATE availability_rules SET is_active = 0 WHERE spot_id = ?', (spot_id,))
+        return hidden
 
 
 # ==================== AVAILABILITY & SEARCH ====================
 
-def get_available_slots(date_str: str = None, start_time: str = None, 
-                        end_time: str = None) -> List[Dict[str, Any]]:
-    """Найти свободные слоты"""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        
+def _day_bounds(date_str: str) -> Tuple[str, str]:
+    """Границы суток 'YYYY-MM-DD' для поиска по индексу start_time"""
+    day = datetime.strptime(date_str, "%Y-%m-%d")
+    return day.strftime("%Y-%m-%d %H:%M:%S"), (day + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def bump_slot_versions(cursor: sqlite3.Cursor, where: str = None, params: tuple = ()):
+    """Поднять версии дат слотов, подходящих под where (без where - версию всех дат)
+    
+    Вызывается курсором транзакции, которая меняет слоты, до её коммита.
+    """
+    if where is None:
+        cursor.execute('''
+            INSERT INTO slot_versions (date, version) VALUES ('*', 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1
+        ''')
+        return
+    cursor.execute(f'''
+        INSERT INTO slot_versions (date, version)
+        SELECT DISTINCT date(start_time), 1 FROM spot_availability WHERE {where}
+        ON CONFLICT(date) DO UPDATE SET version = version + 1
+    ''', params)
+
+
+def get_slot_version(date_str: str) -> int:
+    """Версия даты 'YYYY-MM-DD' для кэша поиска"""
+    # Версия читается на каждый поиск - без открытия нового соединения
+    row = _reader().execute('''
+        SELECT COALESCE(SUM(version), 0) FROM slot_versions WHERE date IN (?, '*')
+    ''', (date_str,)).fetchone()
+    return row[0]
+
+
+# Порядки выдачи поиска: ближайшие, дешёвые, без ожидания
+SLOT_SORTS = ('time', 'price', 'wait')
+
+
+def _available_slots_filter(date_str: str = None, start_time: str = None,
+                            end_time: str = None, max_price: float = None,
+                            by_price: bool = False) -> Tuple[str, list]:
+    """Общие условия поиска свободных слотов
+    
+    start_time/end_time - нужное окно 'YYYY-MM-DD HH:MM:SS': подходят слоты,
+    целиком его покрывающие.
+    """
+    # CROSS JOIN фиксирует порядок соединения
+    if by_price:
+        # Места по индексу idx_spots_price, по каждому - слоты дня: выдача идёт
+        # в порядке цены без сортировки всех слотов дня
+        query = '''
+            FROM parking_spots ps
+            CROSS JOIN spot_availability sa ON sa.spot_id = ps.id
+        '''
+    else:
+        # Сначала слоты по индексу idx_availability_search, тогда LIMIT
+        # останавливает чтение после нужного числа строк
         query = '''
-            SELECT sa.*, ps.spot_number, ps.price_per_hour, ps.is_partial_allowed,
-                   ps.address, ps.description, u.full_name as supplier_name,
-                   u.card_number, u.bank
             FROM spot_availability sa
-            JOIN parking_spots ps ON sa.spot_id = ps.id
-            JOIN users u ON ps.supplier_id = u.id
-            WHERE sa.is_booked = 0 AND ps.is_available = 1
+            CROSS JOIN parking_spots ps ON sa.spot_id = ps.id
         '''
-        params = []
+    query += '''
+        CROSS JOIN users u ON ps.supplier_id = u.id
+        WHERE sa.is_booked = 0 AND sa.held_by IS NULL AND ps.is_available = 1
+    '''
+    params = []
+    
+    if date_str:
+        # Диапазон вместо DATE(sa.start_time) = ?, чтобы работал индекс
+        day_start, day_end = _day_bounds(date_str)
+        if start_time:
+            # Слот должен начаться не позже начала окна - сужает диапазон индекса
+            day_end = min(day_end, _next_second(start_time))
+        query += ' AND sa.start_time >= ? AND sa.start_time < ?'
+        params.extend([day_start, day_end])
+    elif start_time:
+        query += ' AND sa.start_time <= ?'
+        params.append(start_time)
+    
+    if end_time:
+        query += ' AND sa.end_time >= ?'
+        params.append(end_time)
+    if max_price is not None:
+        query += ' AND ps.price_per_hour <= ?'
+        params.append(max_price)
+    
+    query += ' AND sa.end_time > datetime("now")'
+    return query, params
+
+
+def _next_second(value: str) -> str:
+    """Следующая секунда - для полуоткрытого диапазона по start_time"""
+    moment = datetime.strptime(value, "%Y-%m-%d %H:%M:%S") + timedelta(seconds=1)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Ключи сортировки выдачи (последний всегда sa.id - уникальность курсора)
+_SLOT_SORT_KEYS = {
+    'time': ['sa.start_time', 'sa.id'],
+    # ps.id перед start_time: внутри места слоты уже упорядочены индексом
+    'price': ['ps.price_per_hour', 'ps.id', 'sa.start_time', 'sa.id'],
+}
+
+
+def slot_sort_key(slot: Dict[str, Any], sort: str = 'time', wait_from: str = None) -> tuple:
+    """Значения ключа сортировки слота - курсор для соседней страницы"""
+    if sort == 'price':
+        return slot['price_per_hour'], slot['spot_id'], slot['start_time'], slot['id']
+    if sort == 'wait':
+        # 0 - слот уже доступен к wait_from, 1 - придётся подождать
+        if slot['start_time'] <= wait_from:
+            return (0,) + slot_sort_key(slot, 'price')
+        return (1,) + slot_sort_key(slot, 'time')
+    return slot['start_time'], slot['id']
+
+
+def _fetch_slots(cursor: sqlite3.Cursor, sort: str, where: str, params: list,
+                 key: tuple = None, backward: bool = False, limit: int = None) -> List[Availability]:
+    """Страница слотов в порядке sort ('time'/'price') после/до ключа key"""
+    keys = _SLOT_SORT_KEYS[sort]
+    query = '''
+        SELECT sa.*, ps.spot_number, ps.price_per_hour, ps.is_partial_allowed,
+               ps.address, ps.description, u.full_name as supplier_name,
+               u.card_number, u.bank
+    ''' + where
+    params = list(params)
+    
+    if key:
+        # Отдельное условие по первому ключу даёт индексу точку старта
+        op = '<' if backward else '>'
+        query += f' AND {keys[0]} {op}= ?'
+        query += f' AND ({", ".join(keys)}) {op} ({", ".join("?" * len(keys))})'
+        params.append(key[0])
+        params.extend(key)
+    
+    # Назад: берём ближайшие слоты перед курсором и разворачиваем
+    direction = ' DESC' if backward else ' ASC'
+    query += ' ORDER BY ' + ', '.join(k + direction for k in keys)
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    if backward:
+        rows.reverse()
+    return rows
+
+
+def get_available_slots(date_str: str = None, start_time: str = None, 
+                        end_time: str = None, limit: int = None,
+                        after: tuple = None, before: tuple = None,
+                        max_price: float = None, sort: str = 'time',
+                        wait_from: str = None) -> List[Availability]:
+    """Найти свободные слоты
+    
+    sort: 'time' - раньше начало, 'price' - дешевле, 'wait' - меньше ждать
+    от wait_from (доступные сразу - по цене, остальные - по началу).
+    Постранично: after/before - slot_sort_key последнего/первого слота
+    соседней страницы, limit - размер страницы.
+    """
+    with get_connection() as conn:
+        cursor = _cursor(conn, Availability)
         
-        if date_str:
-            query += ' AND DATE(sa.start_time) = ?'
-            params.append(date_str)
+        if sort != 'wait':
+            where, params = _available_slots_filter(date_str, start_time, end_time, max_price,
+                                                    by_price=sort == 'price')
+            return _fetch_slots(cursor, sort, where, params, after or before,
+                                backward=bool(before), limit=limit)
         
-        query += ' AND sa.end_time > datetime("now")'
-        query += ' ORDER BY sa.start_time ASC'
+        # MAX(start_time, wait_from) индекс не обслуживает - две фазы по своим индексам
+        where, params = _available_slots_filter(date_str, start_time, end_time, max_price, by_price=True)
+        ready = (where + ' AND sa.start_time <= ?', params + [wait_from])
+        where, params = _available_slots_filter(date_str, start_time, end_time, max_price)
+        later = (where + ' AND sa.start_time > ?', params + [wait_from])
         
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        if before:
+            rows = []
+            if before[0] == 1:
+                rows = _fetch_slots(cursor, 'time', *later, before[1:], backward=True, limit=limit)
+            if limit is None or len(rows) < limit:
+                rest = None if limit is None else limit - len(rows)
+                key = before[1:] if before[0] == 0 else None
+                rows = _fetch_slots(cursor, 'price', *ready, key, backward=True, limit=rest) + rows
+            return rows
+        
+        rows = []
+        if not after or after[0] == 0:
+            rows = _fetch_slots(cursor, 'price', *ready, after[1:] if after else None, limit=limit)
+        if limit is None or len(rows) < limit:
+            rest = None if limit is None else limit - len(rows)
+            key = after[1:] if after and after[0] == 1 else None
+            rows += _fetch_slots(cursor, 'time', *later, key, limit=rest)
+        return rows
 
 
-def get_availability_by_id(availability_id: int) -> Optional[Dict[str, Any]]:
-    """Получить слот доступности по ID"""
+def count_available_slots(date_str: str = None, start_time: str = None,
+                          end_time: str = None, max_price: float = None) -> int:
+    """Количество свободных слотов (для заголовка выдачи)"""
+    return count_available_slots_until(date_str, start_time, end_time, max_price)[0]
+
+
+def count_available_slots_until(date_str: str = None, start_time: str = None,
+                                end_time: str = None, max_price: float = None) -> Tuple[int, Optional[str]]:
+    """Количество свободных слотов и самый ранний их конец - после него число устареет"""
     with get_connection() as conn:
         cursor = conn.cursor()
+        where, params = _available_slots_filter(date_str, start_time, end_time, max_price)
+        cursor.execute('SELECT COUNT(*), MIN(sa.end_time) ' + where, params)
+        count, first_end = cursor.fetchone()
+        return count, first_end
+
+
+def get_availability_by_id(availability_id: int) -> Optional[Availability]:
+    """Получить слот доступности по ID"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, Availability)
         cursor.execute('''
             SELECT sa.*, ps.spot_number, ps.price_per_hour, ps.is_partial_allowed,
                    ps.address, ps.supplier_id, u.full_name as supplier_name,
@@ -386,29 +1119,228 @@ def get_availability_by_id(availability_id: int) -> Optional[Dict[str, Any]]:
             WHERE sa.id = ?
         ''', (availability_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        return row
 
 
-def get_spot_availabilities(spot_id: int) -> List[Dict[str, Any]]:
+def get_spot_availabilities(spot_id: int) -> List[Availability]:
     """Получить все слоты доступности для места"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Availability)
         cursor.execute('''
             SELECT * FROM spot_availability 
             WHERE spot_id = ? AND is_booked = 0 AND end_time > datetime("now")
             ORDER BY start_time ASC
         ''', (spot_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
+
+
+# ==================== SCHEDULES ====================
+
+@writes
+def create_availability_rule(spot_id: int, weekdays: int, start_time: str, end_time: str,
+                             valid_from: str, valid_until: str = None) -> int:
+    """Создать расписание места: weekdays - маска дней (бит 0 - понедельник), время 'HH:MM'
+
+    end_time не позже start_time - слот заканчивается на следующие сутки.
+    Слоты не создаются: их досоздаёт materialize_rules.
+    """
+    materialized_until = (datetime.strptime(valid_from, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO availability_rules
+            (spot_id, weekdays, start_time, end_time, valid_from, valid_until, materialized_until)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (spot_id, weekdays, start_time, end_time, valid_from, valid_until, materialized_until))
+        rule_id = cursor.lastrowid
+
+        log_admin_action('schedule_added', spot_id=spot_id,
+                         details=json.dumps({'rule_id': rule_id, 'weekdays': weekdays,
+                                             'time': f"{start_time}-{end_time}", 'until': valid_until}),
+                         cursor=cursor)
+        return rule_id
+
+
+def get_availability_rule(rule_id: int) -> Optional[Record]:
+    """Расписание с номером и владельцем места"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT r.*, ps.spot_number, ps.supplier_id
+            FROM availability_rules r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id = ?
+        ''', (rule_id,))
+        row = cursor.fetchone()
+        return row
+
+
+def get_spot_rules(spot_id: int) -> List[Dict[str, Any]]:
+    """Действующие расписания места с предстоящими исключениями (список 'YYYY-MM-DD')"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT r.*, (
+                SELECT group_concat(date) FROM (
+                    SELECT date FROM availability_rule_exceptions
+                    WHERE rule_id = r.id AND date >= :today ORDER BY date
+                )
+            ) AS exceptions
+            FROM availability_rules r
+            WHERE r.spot_id = :spot_id AND r.is_active = 1
+              AND (r.valid_until IS NULL OR r.valid_until >= :today)
+            ORDER BY r.id
+        ''', {'spot_id': spot_id, 'today': datetime.now().strftime("%Y-%m-%d")})
+        rules = [dict(row) for row in cursor.fetchall()]
+    for rule in rules:
+        rule['exceptions'] = rule['exceptions'].split(',') if rule['exceptions'] else []
+    return rules
+
+
+def _rule_slots(rule: Dict[str, Any], first: datetime, last: datetime, exceptions: set):
+    """Начало и конец слотов правила по дням first..last включительно"""
+    start = datetime.strptime(rule['start_time'], "%H:%M").time()
+    end = datetime.strptime(rule['end_time'], "%H:%M").time()
+    day = first
+    while day <= last:
+        if rule['weekdays'] >> day.weekday() & 1 and day.strftime("%Y-%m-%d") not in exceptions:
+            slot_start, slot_end = datetime.combine(day, start), datetime.combine(day, end)
+            if slot_end <= slot_start:
+                slot_end += timedelta(days=1)
+            yield slot_start, slot_end
+        day += timedelta(days=1)
+
+
+@writes
+def materialize_rules(until: str, rule_id: int = None) -> List[Dict[str, Any]]:
+    """Создать слоты расписаний по день until 'YYYY-MM-DD' включительно; вернуть новые слоты
+
+    Прошедшие дни не создаются. Слоты получают rule_id, в остальном они такие же,
+    как добавленные вручную, - поиск и бронирование их не различают.
+    """
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    created = []
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # Чтение под блокировкой записи пачки: исключение, добавленное параллельно,
+        # не будет перекрыто слотом, созданным по прочитанному до него состоянию
+        query = '''
+            SELECT r.*, ps.spot_number, ps.price_per_hour
+            FROM availability_rules r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.is_active = 1 AND r.materialized_until < ? AND ps.is_available = 1
+        '''
+        params = [until]
+        if rule_id is not None:
+            query += ' AND r.id = ?'
+            params.append(rule_id)
+        rules = cursor.execute(query, params).fetchall()
+
+        for rule in rules:
+            first = max(datetime.strptime(rule['materialized_until'], "%Y-%m-%d") + timedelta(days=1),
+                        datetime.strptime(rule['valid_from'], "%Y-%m-%d"), today)
+            last = datetime.strptime(min(until, rule['valid_until'] or until), "%Y-%m-%d")
+            exceptions = {row[0] for row in cursor.execute('''
+                SELECT date FROM availability_rule_exceptions WHERE rule_id = ? AND date >= ?
+            ''', (rule['id'], first.strftime("%Y-%m-%d")))}
+
+            for slot_start, slot_end in _rule_slots(rule, first, last, exceptions):
+                start_str, end_str = slot_start.strftime("%Y-%m-%d %H:%M:%S"), slot_end.strftime("%Y-%m-%d %H:%M:%S")
+                # Такой же слот, добавленный вручную, не дублируется
+                cursor.execute('''
+                    INSERT OR IGNORE INTO spot_availability (spot_id, start_time, end_time, rule_id)
+                    VALUES (?, ?, ?, ?)
+                ''', (rule['spot_id'], start_str, end_str, rule['id']))
+                if cursor.rowcount:
+                    created.append({'id': cursor.lastrowid, 'spot_id': rule['spot_id'], 'rule_id': rule['id'],
+                                    'start_time': start_str, 'end_time': end_str,
+                                    'spot_number': rule['spot_number'], 'price_per_hour': rule['price_per_hour']})
+
+            if first <= last:
+                bump_slot_versions(cursor, 'rule_id = ? AND start_time >= ?',
+                                   (rule['id'], first.strftime("%Y-%m-%d %H:%M:%S")))
+            # Отметка двигается и за концом расписания - правило больше не выбирается
+            cursor.execute('UPDATE availability_rules SET materialized_until = ? WHERE id = ?',
+                           (until, rule['id']))
+    return created
+
+
+def get_pending_rules_until(date_str: str) -> Optional[str]:
+    """Дата, по которую нужно досоздать слоты расписаний для поиска на 'YYYY-MM-DD'
+    (не дальше RULE_MAX_DAYS_AHEAD); None - всё уже создано"""
+    limit = (datetime.now() + timedelta(days=RULE_MAX_DAYS_AHEAD)).strftime("%Y-%m-%d")
+    until = min(date_str, limit)
+    # Обычно всё уже создано - проверка по idx_rules_pending без блокировки записи
+    pending = _reader().execute('''
+        SELECT 1 FROM availability_rules WHERE is_active = 1 AND materialized_until < ? LIMIT 1
+    ''', (until,)).fetchone()
+    return until if pending else None
+
+
+async def ensure_rule_slots(date_str: str) -> List[Dict[str, Any]]:
+    """Досоздать слоты расписаний по дату поиска 'YYYY-MM-DD'; вернуть созданные (как materialize_rules)"""
+    until = get_pending_rules_until(date_str)
+    if until is None:
+        return []
+    return await write(materialize_rules, until)
+
+
+@writes
+def add_rule_exception(rule_id: int, date_str: str) -> Dict[str, int]:
+    """Исключить день 'YYYY-MM-DD' из расписания
+
+    Свободный слот этого дня удаляется, забронированный остаётся:
+    {'removed': удалено, 'booked': осталось забронированных}.
+    """
+    day_start, day_end = _day_bounds(date_str)
+    where = 'rule_id = ? AND start_time >= ? AND start_time < ?'
+    params = (rule_id, day_start, day_end)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO availability_rule_exceptions (rule_id, date) VALUES (?, ?)',
+                       (rule_id, date_str))
+        bump_slot_versions(cursor, where + ' AND is_booked = 0', params)
+        _rollup_deleted_slots(cursor, where + ' AND is_booked = 0', params)
+        cursor.execute(f'DELETE FROM spot_availability WHERE {where} AND is_booked = 0', params)
+        removed = cursor.rowcount
+        cursor.execute(f'SELECT COUNT(*) FROM spot_availability WHERE {where}', params)
+        return {'removed': removed, 'booked': cursor.fetchone()[0]}
+
+
+@writes
+def delete_availability_rule(rule_id: int) -> int:
+    """Отключить расписание и удалить его будущие свободные слоты; вернуть их число"""
+    where = 'rule_id = ? AND is_booked = 0 AND start_time > ?'
+    params = (rule_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE availability_rules SET is_active = 0 WHERE id = ?', (rule_id,))
+        bump_slot_versions(cursor, where, params)
+        _rollup_deleted_slots(cursor, where, params)
+        cursor.execute(f'DELETE FROM spot_availability WHERE {where}', params)
+        return cursor.rowcount
 
 
 # ==================== BOOKING OPERATIONS ====================
 
+@writes
 def create_booking(customer_id: int, spot_id: int, availability_id: int,
-                   start_time: datetime, end_time: datetime, total_price: float) -> int:
-    """Создать бронирование"""
+                   start_time: datetime, end_time: datetime, total_price: float) -> Optional[int]:
+    """Создать бронирование; None - слот уже занят, закончился или придержан для другого жильца"""
     with get_connection() as conn:
         cursor = conn.cursor()
         
+        # Сначала занимаем слот: свободный, не закончившийся (как в поиске)
+        # и не придержанный за другим подписчиком
+        cursor.execute('''
+            UPDATE spot_availability 
+            SET is_booked = 1, booked_by = ?, held_by = NULL
+            WHERE id = ? AND is_booked = 0 AND (held_by IS NULL OR held_by = ?)
+            AND end_time > datetime("now")
+        ''', (customer_id, availability_id, customer_id))
+        if not cursor.rowcount:
+            return None
+        
         # Создаём бронирование
         cursor.execute('''
             INSERT INTO bookings 
@@ -419,24 +1351,30 @@ def create_booking(customer_id: int, spot_id: int, availability_id: int,
               end_time.strftime("%Y-%m-%d %H:%M:%S"), total_price))
         booking_id = cursor.lastrowid
         
-        # Обновляем статус слота
-        cursor.execute('''
-            UPDATE spot_availability 
-            SET is_booked = 1, booked_by = ?, booking_id = ?
-            WHERE id = ?
-        ''', (customer_id, booking_id, availability_id))
+        cursor.execute('UPDATE spot_availability SET booking_id = ? WHERE id = ?', (booking_id, availability_id))
+        bump_slot_versions(cursor, 'id = ?', (availability_id,))
+        
+        # Бронь по предложению закрывает и подписку, по которой оно пришло
+        offer = cursor.execute('''
+            SELECT id, notification_id FROM slot_offers
+            WHERE availability_id = ? AND user_id = ? AND status = 'offered'
+        ''', (availability_id, customer_id)).fetchone()
+        if offer:
+            cursor.execute("UPDATE slot_offers SET status = 'accepted' WHERE id = ?", (offer['id'],))
+            cursor.execute('UPDATE spot_notifications SET is_active = 0 WHERE id = ?', (offer['notification_id'],))
         
         # Логируем действие
         log_admin_action('booking_created', booking_id=booking_id, user_id=customer_id,
-                        spot_id=spot_id, details=json.dumps({'total_price': total_price}))
+                        spot_id=spot_id, details=json.dumps({'total_price': total_price}),
+                        cursor=cursor)
         
         return booking_id
 
 
-def get_booking_by_id(booking_id: int) -> Optional[Dict[str, Any]]:
+def get_booking_by_id(booking_id: int) -> Optional[Booking]:
     """Получить бронирование по ID"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Booking)
         cursor.execute('''
             SELECT b.*, ps.spot_number, ps.price_per_hour,
                    u.full_name as customer_name, u.phone as customer_phone,
@@ -449,13 +1387,13 @@ def get_booking_by_id(booking_id: int) -> Optional[Dict[str, Any]]:
             WHERE b.id = ?
         ''', (booking_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        return row
 
 
-def get_user_bookings(user_id: int, status: str = None) -> List[Dict[str, Any]]:
+def get_user_bookings(user_id: int, status: str = None) -> List[Booking]:
     """Получить бронирования пользователя"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Booking)
         
         query = '''
             SELECT b.*, ps.spot_number, ps.address,
@@ -474,13 +1412,13 @@ def get_user_bookings(user_id: int, status: str = None) -> List[Dict[str, Any]]:
         query += ' ORDER BY b.created_at DESC'
         
         cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
-def get_supplier_bookings(supplier_id: int) -> List[Dict[str, Any]]:
+def get_supplier_bookings(supplier_id: int) -> List[Booking]:
     """Получить бронирования мест поставщика"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Booking)
         cursor.execute('''
             SELECT b.*, ps.spot_number, u.full_name as customer_name, u.phone as customer_phone
             FROM bookings b
@@ -489,37 +1427,47 @@ def get_supplier_bookings(supplier_id: int) -> List[Dict[str, Any]]:
             WHERE ps.supplier_id = ? AND b.status IN ('pending', 'confirmed')
             ORDER BY b.start_time ASC
         ''', (supplier_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
-def cancel_booking(booking_id: int) -> bool:
-    """Отменить бронирование"""
+@writes
+def cancel_booking(booking_id: int) -> Optional[Booking]:
+    """Отменить действующее бронирование; вернуть отменённое (None - не найдено или уже не действует)"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Booking)
         
-        # Получаем бронирование
-        cursor.execute('SELECT availability_id FROM bookings WHERE id = ?', (booking_id,))
-        row = cursor.fetchone()
-        if not row:
-            return False
-        
-        availability_id = row[0]
-        
-        # Обновляем статус бронирования
-        cursor.execute('''
-            UPDATE bookings SET status = 'cancelled' WHERE id = ?
-        ''', (booking_id,))
+        # Статус и слот брони - одним запросом; отменённая или завершённая бронь не меняется
+        booking = _update_returning(cursor, 'bookings', "status = 'cancelled'", booking_id, [],
+                                    where="status IN ('pending', 'confirmed')")
+        if not booking:
+            return None
         
-        # Освобождаем слот
+        # Освобождаем слот, только если он всё ещё за этой бронью
         cursor.execute('''
             UPDATE spot_availability 
             SET is_booked = 0, booked_by = NULL, booking_id = NULL
-            WHERE id = ?
-        ''', (availability_id,))
+            WHERE id = ? AND booking_id = ?
+        ''', (booking['availability_id'], booking_id))
+        bump_slot_versions(cursor, 'id = ?', (booking['availability_id'],))
         
-        log_admin_action('booking_cancelled', booking_id=booking_id)
+        log_admin_action('booking_cancelled', booking_id=booking_id, user_id=booking['customer_id'],
+                         spot_id=booking['spot_id'], cursor=cursor)
         
-        return True
+        return booking
+
+
+def get_spot_active_bookings(spot_id: int) -> List[Booking]:
+    """Ожидающие и подтверждённые бронирования места с контактами арендаторов"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, Booking)
+        cursor.execute('''
+            SELECT b.*, u.full_name as customer_name, u.phone as customer_phone
+            FROM bookings b
+            JOIN users u ON b.customer_id = u.id
+            WHERE b.spot_id = ? AND b.status IN ('pending', 'confirmed')
+            ORDER BY b.start_time ASC
+        ''', (spot_id,))
+        return cursor.fetchall()
 
 
 def get_active_bookings_count(user_id: int) -> int:
@@ -535,6 +1483,7 @@ def get_active_bookings_count(user_id: int) -> int:
 
 # ==================== NOTIFICATIONS ====================
 
+@writes
 def create_spot_notification(user_id: int, desired_date: str = None,
                             start_time: str = None, end_time: str = None,
                             spot_id: int = None, notify_any: bool = True) -> int:
@@ -549,42 +1498,20 @@ def create_spot_notification(user_id: int, desired_date: str = None,
         return cursor.lastrowid
 
 
-def get_active_notifications() -> List[Dict[str, Any]]:
+def get_active_notifications() -> List[Notification]:
     """Получить все активные подписки на уведомления"""
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn, Notification)
         cursor.execute('''
             SELECT sn.*, u.telegram_id
             FROM spot_notifications sn
             JOIN users u ON sn.user_id = u.id
             WHERE sn.is_active = 1
         ''')
-        return [dict(row) for row in cursor.fetchall()]
-
-
-def get_matching_notifications(spot_id: int, start_time: datetime, 
-                              end_time: datetime) -> List[Dict[str, Any]]:
-    """Найти подписки, соответствующие новому слоту"""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        
-        date_str = start_time.strftime("%Y-%m-%d")
-        start_time_str = start_time.strftime("%H:%M:%S")
-        end_time_str = end_time.strftime("%H:%M:%S")
-        
-        cursor.execute('''
-            SELECT sn.*, u.telegram_id
-            FROM spot_notifications sn
-            JOIN users u ON sn.user_id = u.id
-            WHERE sn.is_active = 1
-            AND (sn.notify_any = 1 OR sn.spot_id = ?)
-            AND (sn.desired_date IS NULL OR sn.desired_date = ?)
-            AND (sn.start_time IS NULL OR sn.start_time <= ?)
-            AND (sn.end_time IS NULL OR sn.end_time >= ?)
-        ''', (spot_id, date_str, end_time_str, start_time_str))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
 
+@writes
 def deactivate_notification(notification_id: int) -> bool:
     """Деактивировать подписку"""
     with get_connection() as conn:
@@ -595,20 +1522,182 @@ def deactivate_notification(notification_id: int) -> bool:
         return cursor.rowcount > 0
 
 
-def get_user_notifications(user_id: int) -> List[Dict[str, Any]]:
-    """Получить активные подписки пользователя"""
+@writes
+def deactivate_notifications(notification_ids: List[int]) -> int:
+    """Деактивировать несколько подписок одним запросом"""
+    if not notification_ids:
+        return 0
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute(f'''
+            UPDATE spot_notifications SET is_active = 0
+            WHERE id IN ({', '.join('?' * len(notification_ids))})
+        ''', notification_ids)
+        return cursor.rowcount
+
+
+def get_user_notifications(user_id: int) -> List[Notification]:
+    """Получить активные подписки пользователя"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, Notification)
         cursor.execute('''
             SELECT * FROM spot_notifications 
             WHERE user_id = ? AND is_active = 1
             ORDER BY created_at DESC
         ''', (user_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        return cursor.fetchall()
+
+
+# ==================== WAITLIST ====================
+
+# Первый в очереди подписчик, которому подходит слот. Подписки на дату и на
+# любую дату - выборки по idx_notifications_waitlist в порядке id, каждая
+# останавливается на первой подходящей: тысячи подписчиков на дату не
+# читаются целиком. Жилец с действующим предложением ждёт его исхода, слот не
+# предлагается одному жильцу дважды. INDEXED BY: для IS NULL планировщик
+# иначе берёт idx_notifications_active и читает все действующие подписки.
+_WAITLIST_CANDIDATE = '''
+    SELECT * FROM (
+        SELECT sn.id, sn.user_id, u.telegram_id
+        FROM spot_notifications sn INDEXED BY idx_notifications_waitlist
+        JOIN users u ON sn.user_id = u.id
+        WHERE sn.is_active = 1 AND sn.desired_date {date} AND ({window})
+        AND (sn.spot_id IS NULL OR sn.spot_id = :spot_id)
+        AND sn.user_id != :supplier_id AND u.is_active = 1 AND u.telegram_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM slot_offers o WHERE o.user_id = sn.user_id AND o.status = 'offered')
+        AND NOT EXISTS (SELECT 1 FROM slot_offers o WHERE o.availability_id = :slot_id AND o.user_id = sn.user_id)
+        ORDER BY sn.id LIMIT 1
+    )
+'''
+
+
+def _window_overlaps(day: str) -> str:
+    """Условие: окно подписки в сутки day пересекает слот [:start_time, :end_time)
+
+    Окно сравнивается полными датой и временем: без времени - все сутки,
+    конец не позже начала - окно через полночь, до конца на следующие сутки.
+    """
+    return f'''(
+        datetime({day}, COALESCE(sn.start_time, '00:00')) < :end_time
+        AND CASE WHEN sn.end_time IS NULL THEN datetime({day}, '+1 day')
+                 WHEN sn.end_time <= COALESCE(sn.start_time, '00:00') THEN datetime({day}, sn.end_time, '+1 day')
+                 ELSE datetime({day}, sn.end_time) END > :start_time
+    )'''
+
+
+# Слот пересекают окна суток его начала, суток окончания (слот через полночь)
+# и ночные окна предыдущих суток; :end_date - NULL, если слот в одних сутках
+_WAITLIST_DAYS = (':prev_date', ':date', ':end_date')
+WAITLIST_QUERY = ' UNION ALL '.join(
+    [_WAITLIST_CANDIDATE.format(date=f'= {day}', window=_window_overlaps('sn.desired_date'))
+     for day in _WAITLIST_DAYS]
+    # Окно на любую дату повторяется каждые сутки: слот от суток и дольше пересекает любое
+    + [_WAITLIST_CANDIDATE.format(date='IS NULL', window=' OR '.join(
+        [_window_overlaps(day) for day in _WAITLIST_DAYS] + ["datetime(:start_time, '+1 day') <= :end_time"]))]
+) + ' ORDER BY id LIMIT 1'
+
+
+# Предложение со слотом и подписчиком - для сообщения и кнопок
+OFFER_SELECT = '''
+    SELECT o.*, u.telegram_id, sa.spot_id, sa.start_time, sa.end_time,
+           ps.spot_number, ps.price_per_hour
+    FROM slot_offers o
+    JOIN users u ON o.user_id = u.id
+    JOIN spot_availability sa ON o.availability_id = sa.id
+    JOIN parking_spots ps ON sa.spot_id = ps.id
+'''
+
+
+def _offer_slot(cursor: sqlite3.Cursor, slot_id: int) -> Optional[Record]:
+    """Предложить свободный слот первому подходящему подписчику и придержать за ним"""
+    slot = cursor.execute('''
+        SELECT sa.id, sa.spot_id, sa.start_time, sa.end_time, ps.supplier_id
+        FROM spot_availability sa
+        JOIN parking_spots ps ON sa.spot_id = ps.id
+        WHERE sa.id = ? AND sa.is_booked = 0 AND sa.held_by IS NULL
+        AND ps.is_available = 1 AND sa.end_time > ?
+    ''', (slot_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))).fetchone()
+    if slot is None:
+        return None
+    start = datetime.strptime(slot['start_time'], "%Y-%m-%d %H:%M:%S")
+    end = datetime.strptime(slot['end_time'], "%Y-%m-%d %H:%M:%S")
+    date, last_date = start.strftime("%Y-%m-%d"), (end - timedelta(seconds=1)).strftime("%Y-%m-%d")
+    candidate = cursor.execute(WAITLIST_QUERY, {
+        'slot_id': slot_id, 'spot_id': slot['spot_id'], 'supplier_id': slot['supplier_id'],
+        'prev_date': (start - timedelta(days=1)).strftime("%Y-%m-%d"), 'date': date,
+        'end_date': last_date if last_date != date else None,
+        'start_time': slot['start_time'], 'end_time': slot['end_time'],
+    }).fetchone()
+    if candidate is None:
+        return None
+    
+    expires_at = (datetime.now() + timedelta(minutes=OFFER_HOLD_MINUTES)).strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute('''
+        INSERT INTO slot_offers (availability_id, notification_id, user_id, expires_at) VALUES (?, ?, ?, ?)
+    ''', (slot_id, candidate['id'], candidate['user_id'], expires_at))
+    offer_id = cursor.lastrowid
+    cursor.execute('UPDATE spot_availability SET held_by = ? WHERE id = ?', (candidate['user_id'], slot_id))
+    # Придержанный слот пропадает из поиска остальных
+    bump_slot_versions(cursor, 'id = ?', (slot_id,))
+    return cursor.execute(OFFER_SELECT + ' WHERE o.id = ?', (offer_id,)).fetchone()
+
+
+@writes
+def offer_slots(slot_ids: List[int]) -> List[Offer]:
+    """Предложить новые или освободившиеся слоты очереди подписчиков; вернуть предложения для отправки"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, Offer)
+        return [offer for offer in (_offer_slot(cursor, slot_id) for slot_id in slot_ids) if offer]
+
+
+def _release_offer(cursor: sqlite3.Cursor, offer: Record, status: str) -> Optional[Offer]:
+    """Закрыть предложение, снять придержку слота и предложить его следующему"""
+    cursor.execute('UPDATE slot_offers SET status = ? WHERE id = ?', (status, offer['id']))
+    cursor.execute('UPDATE spot_availability SET held_by = NULL WHERE id = ? AND held_by = ?',
+                   (offer['availability_id'], offer['user_id']))
+    # Слот вернётся в поиск, если следующего в очереди нет
+    bump_slot_versions(cursor, 'id = ?', (offer['availability_id'],))
+    return _offer_slot(cursor, offer['availability_id'])
+
+
+@writes
+def decline_offer(offer_id: int, user_id: int) -> Optional[List[Offer]]:
+    """Отказ жильца от предложения -> предложения следующему (None - предложение не его или уже закрыто)"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, Offer)
+        offer = cursor.execute('''
+            SELECT * FROM slot_offers WHERE id = ? AND user_id = ? AND status = 'offered'
+        ''', (offer_id, user_id)).fetchone()
+        if offer is None:
+            return None
+        next_offer = _release_offer(cursor, offer, 'declined')
+        return [next_offer] if next_offer else []
+
+
+@writes
+def expire_offers() -> List[Offer]:
+    """Закрыть просроченные предложения и передать слоты дальше по очереди; вернуть новые предложения"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_connection() as conn:
+        cursor = _cursor(conn, Offer)
+        expired = cursor.execute('''
+            SELECT * FROM slot_offers WHERE status = 'offered' AND expires_at <= ? ORDER BY id
+        ''', (now,)).fetchall()
+        offers = (_release_offer(cursor, offer, 'expired') for offer in expired)
+        return [offer for offer in offers if offer]
+
+
+def get_slot_offer(offer_id: int) -> Optional[Offer]:
+    """Предложение со слотом и telegram_id подписчика"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, Offer)
+        cursor.execute(OFFER_SELECT + ' WHERE o.id = ?', (offer_id,))
+        return cursor.fetchone()
 
 
 # ==================== ADMIN OPERATIONS ====================
 
+@writes
 def create_admin_session(user_id: int, telegram_id: int) -> int:
     """Создать сессию администратора"""
     with get_connection() as conn:
@@ -624,7 +1713,7 @@ def create_admin_session(user_id: int, telegram_id: int) -> int:
         return cursor.lastrowid
 
 
-def get_admin_session(telegram_id: int) -> Optional[Dict[str, Any]]:
+def get_admin_session(telegram_id: int) -> Optional[Record]:
     """Получить сессию администратора"""
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -632,20 +1721,20 @@ def get_admin_session(telegram_id: int) -> Optional[Dict[str, Any]]:
             SELECT * FROM admin_sessions WHERE telegram_id = ?
         ''', (telegram_id,))
         row = cursor.fetchone()
-        return dict(row) if row else None
+        return row
 
 
-def update_admin_session_activity(telegram_id: int) -> bool:
-    """Обновить время последней активности"""
+@writes
+def update_admin_sessions_activity(activity: Dict[int, str]) -> int:
+    """Записать последнюю активность пачкой: {id сессии: 'YYYY-MM-DD HH:MM:SS' UTC}"""
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE admin_sessions SET last_activity = CURRENT_TIMESTAMP
-            WHERE telegram_id = ?
-        ''', (telegram_id,))
-        return cursor.rowcount > 0
+        cursor.executemany('UPDATE admin_sessions SET last_activity = ? WHERE id = ?',
+                           [(moment, session_id) for session_id, moment in activity.items()])
+        return cursor.rowcount
 
 
+@writes
 def delete_admin_session(telegram_id: int) -> bool:
     """Удалить сессию администратора"""
     with get_connection() as conn:
@@ -654,38 +1743,378 @@ def delete_admin_session(telegram_id: int) -> bool:
         return cursor.rowcount > 0
 
 
-def get_active_admin_sessions() -> List[Dict[str, Any]]:
-    """Получить все активные сессии админов"""
+def get_active_admin_sessions() -> List[Record]:
+    """Получить все активные сессии админов
+
+    last_activity отстаёт от памяти процесса не больше чем на ADMIN_ACTIVITY_FLUSH_SECONDS.
+    """
+    # Граница в UTC, как CURRENT_TIMESTAMP: сравнение с колонкой идёт по idx_admin_sessions_activity
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=ADMIN_SESSION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT as_s.*, u.full_name, u.telegram_id
             FROM admin_sessions as_s
             JOIN users u ON as_s.user_id = u.id
-            WHERE datetime(as_s.last_activity, '+24 hours') > datetime('now')
-        ''')
-        return [dict(row) for row in cursor.fetchall()]
+            WHERE as_s.last_activity > ?
+        ''', (cutoff,))
+        return cursor.fetchall()
 
 
+@writes
 def log_admin_action(action_type: str, user_id: int = None, spot_id: int = None,
-                     booking_id: int = None, details: str = None):
-    """Записать действие в лог"""
+                     booking_id: int = None, details: str = None,
+                     cursor: sqlite3.Cursor = None):
+    """Записать действие в лог (в транзакции вызывающего, если передан cursor)"""
+    query = '''
+        INSERT INTO admin_logs (action_type, user_id, spot_id, booking_id, details)
+        VALUES (?, ?, ?, ?, ?)
+    '''
+    params = (action_type, user_id, spot_id, booking_id, details)
+    
+    # Запись другой операции - её курсором, в её транзакции
+    if cursor is not None:
+        cursor.execute(query, params)
+        return
+    
+    with get_connection() as conn:
+        conn.execute(query, params)
+
+
+def get_admin_logs(limit: int = 100, action_type: str = None, user_id: int = None,
+                   spot_id: int = None, booking_id: int = None, date_from: str = None,
+                   date_to: str = None, after: tuple = None, before: tuple = None) -> List[Record]:
+    """Получить логи действий, новые первыми
+    
+    Фильтры - по колонкам, даты 'YYYY-MM-DD' включительно. Постранично:
+    after/before - (created_at, id) последней/первой записи текущей страницы.
+    """
+    filters = {'action_type': action_type, 'user_id': user_id, 'spot_id': spot_id, 'booking_id': booking_id}
+    by_id = any(filters[column] is not None for column in ADMIN_LOG_FILTERS[1:])
+    where, params = [], []
+    for column, value in filters.items():
+        if value is not None:
+            # С фильтром по id индекс по типу действия (всего несколько значений)
+            # планировщику не даём: "+" выключает индекс для этого условия
+            where.append(f"{'+' if column == 'action_type' and by_id else ''}{column} = ?")
+            params.append(value)
+    # Курсор строже границы дат с той же стороны: вторая граница сбила бы выбор
+    # диапазона по индексу, поэтому со стороны курсора она не нужна
+    if date_from and not before:
+        where.append('created_at >= ?')
+        params.append(_day_bounds(date_from)[0])
+    if date_to and not after:
+        where.append('created_at < ?')
+        params.append(_day_bounds(date_to)[1])
+    
+    order = 'DESC'
+    if after:
+        where.append('(created_at, id) < (?, ?)')
+        params.extend(after)
+    elif before:
+        where.append('(created_at, id) > (?, ?)')
+        params.extend(before)
+        order = 'ASC'
+    
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT * FROM admin_logs
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY created_at {order}, id {order}
+            LIMIT ?
+        ''', params + [limit])
+        rows = cursor.fetchall()
+    return rows[::-1] if before else rows
+
+
+# ==================== EXPORT ====================
+
+# Выгрузки для админов: (FROM с джойнами, колонка диапазона дат, [(выражение, заголовок)])
+EXPORTS = {
+    'bookings': (
+        '''bookings b
+           JOIN parking_spots ps ON b.spot_id = ps.id
+           JOIN users c ON b.customer_id = c.id
+           JOIN users s ON ps.supplier_id = s.id''',
+        'b.start_time',
+        [('b.id', 'booking_id'), ('b.created_at', 'created_at'), ('b.start_time', 'start_time'),
+         ('b.end_time', 'end_time'), ('b.status', 'status'), ('b.payment_status', 'payment_status'),
+         ('b.total_price', 'total_price'), ('ps.id', 'spot_id'), ('ps.spot_number', 'spot_number'),
+         ('ps.address', 'address'), ('c.id', 'customer_id'), ('c.full_name', 'customer_name'),
+         ('c.phone', 'customer_phone'), ('s.id', 'supplier_id'), ('s.full_name', 'supplier_name'),
+         ('s.phone', 'supplier_phone')],
+    ),
+    'spots': (
+        'parking_spots ps JOIN users s ON ps.supplier_id = s.id',
+        'ps.created_at',
+        [('ps.id', 'spot_id'), ('ps.spot_number', 'spot_number'), ('ps.address', 'address'),
+         ('ps.price_per_hour', 'price_per_hour'), ('ps.is_partial_allowed', 'is_partial_allowed'),
+         ('ps.is_available', 'is_available'), ('s.id', 'supplier_id'), ('s.full_name', 'supplier_name'),
+         ('s.phone', 'supplier_phone'), ('ps.created_at', 'created_at')],
+    ),
+    'users': (
+        'users u',
+        'u.created_at',
+        # Номера карт в выгрузку не попадают
+        [('u.id', 'user_id'), ('u.telegram_id', 'telegram_id'), ('u.username', 'username'),
+         ('u.full_name', 'full_name'), ('u.phone', 'phone'), ('u.bank', 'bank'), ('u.role', 'role'),
+         ('u.is_active', 'is_active'), ('u.created_at', 'created_at')],
+    ),
+}
+
+
+def get_export_columns(kind: str) -> List[str]:
+    """Заголовки колонок выгрузки"""
+    return [name for _, name in EXPORTS[kind][2]]
+
+
+def iter_export_rows(kind: str, date_from: str = None, date_to: str = None,
+                     chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """Строки выгрузки пачками по chunk_size (даты 'YYYY-MM-DD' включительно)
+
+    Каждая пачка - отдельный короткий запрос с продолжением по id, поэтому
+    выгрузка любого размера не держит в памяти больше одной пачки и не
+    держит открытым снимок чтения.
+    """
+    from_sql, date_column, columns = EXPORTS[kind]
+    id_column = columns[0][0]
+    where, params = [f'{id_column} > ?'], []
+    if date_from:
+        where.append(f'{date_column} >= ?')
+        params.append(_day_bounds(date_from)[0])
+    if date_to:
+        where.append(f'{date_column} < ?')
+        params.append(_day_bounds(date_to)[1])
+    query = f'''
+        SELECT {', '.join(expr for expr, _ in columns)}
+        FROM {from_sql}
+        WHERE {' AND '.join(where)}
+        ORDER BY {id_column}
+        LIMIT ?
+    '''
+
+    last_id = 0
+    while True:
+        with get_connection() as conn:
+            rows = [tuple(row) for row in conn.execute(query, [last_id] + params + [chunk_size]).fetchall()]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+# ==================== RESIDENT IMPORT ====================
+
+# Телефонов в одном IN (...): старые SQLite ограничивают запрос 999 параметрами
+PHONES_PER_QUERY = 500
+
+
+def _taken_phones(cursor: sqlite3.Cursor, phones: List[str]) -> set:
+    taken = set()
+    for start in range(0, len(phones), PHONES_PER_QUERY):
+        chunk = phones[start:start + PHONES_PER_QUERY]
+        cursor.execute(f'SELECT phone FROM users WHERE phone IN ({", ".join("?" * len(chunk))})', chunk)
+        taken.update(row[0] for row in cursor.fetchall())
+    return taken
+
+
+def get_taken_phones(phones: List[str]) -> set:
+    """Какие из телефонов уже есть в базе (у зарегистрированных и импортированных)"""
+    with get_connection() as conn:
+        return _taken_phones(conn.cursor(), phones)
+
+
+def import_residents(residents: List[Dict[str, Any]], admin_id: int = None,
+                     chunk_size: int = IMPORT_CHUNK_ROWS) -> Dict[str, int]:
+    """Записать проверенных жильцов без telegram_id и их места
+
+    residents - {'full_name', 'phone', 'card_number', 'bank', 'spots': [(номер, цена)]}.
+    Каждые chunk_size жильцов - своя операция записи с executemany: сбой пачки
+    не откатывает записанные до неё, а клики жильцов встают в очередь между
+    пачками. Телефон, появившийся в базе после проверки, пропускается.
+    Вернуть {'users', 'spots', 'skipped'}.
+    """
+    totals = {'users': 0, 'spots': 0, 'skipped': 0}
+    for start in range(0, len(residents), chunk_size):
+        for key, value in _import_chunk(residents[start:start + chunk_size], admin_id).items():
+            totals[key] += value
+    return totals
+
+
+@writes
+def _import_chunk(chunk: List[Dict[str, Any]], admin_id: int = None) -> Dict[str, int]:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        taken = _taken_phones(cursor, [resident['phone'] for resident in chunk])
+        chunk = [resident for resident in chunk if resident['phone'] not in taken]
+        if not chunk:
+            return {'users': 0, 'spots': 0, 'skipped': len(taken)}
+        
+        # MAX(id) читается под блокировкой записи пачки: новые id идут строго после него
+        last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]
+        cursor.executemany('''
+            INSERT INTO users (full_name, phone, card_number, bank) VALUES (?, ?, ?, ?)
+        ''', [(resident['full_name'], resident['phone'], resident['card_number'], resident['bank'])
+              for resident in chunk])
+        user_ids = {row['phone']: row['id'] for row in cursor.execute(
+            'SELECT id, phone FROM users WHERE id > ?', (last_id,)
+        ).fetchall()}
+        
+        spots = [(user_ids[resident['phone']], spot_number, price)
+                 for resident in chunk for spot_number, price in resident['spots']]
+        cursor.executemany('''
+            INSERT INTO parking_spots (supplier_id, spot_number, price_per_hour) VALUES (?, ?, ?)
+        ''', spots)
+        
+        log_admin_action('residents_imported', user_id=admin_id,
+                         details=json.dumps({'users': len(chunk), 'spots': len(spots)}),
+                         cursor=cursor)
+        return {'users': len(chunk), 'spots': len(spots), 'skipped': len(taken)}
+
+
+def has_unlinked_residents() -> bool:
+    """Есть ли импортированные жильцы, ещё не заходившие в бот"""
+    return _reader().execute('SELECT 1 FROM users WHERE telegram_id IS NULL LIMIT 1').fetchone() is not None
+
+
+@writes
+def link_imported_resident(telegram_id: int, username: str, phone: str) -> Optional[User]:
+    """Привязать аккаунт Telegram к импортированному жильцу с этим телефоном (None - такого нет)"""
+    with get_connection() as conn:
+        cursor = _cursor(conn, User)
+        # Поиск и привязка в одной транзакции записи: двое с одним номером не получат одного жильца
+        cursor.execute('''
+            SELECT id FROM users WHERE phone = ? AND telegram_id IS NULL ORDER BY id LIMIT 1
+        ''', (phone,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        user = _update_returning(cursor, 'users', 'telegram_id = ?, username = ?',
+                                 row['id'], [telegram_id, username])
+        
+        # Для журнала жилец регистрируется сейчас, когда впервые пришёл в бот
+        log_admin_action('user_registered', user_id=user['id'],
+                         details=json.dumps({'full_name': user['full_name'], 'phone': phone, 'imported': True}),
+                         cursor=cursor)
+        return user
+
+
+# ==================== MAINTENANCE ====================
+
+@writes
+def cleanup_old_data(cutoff: str):
+    """Завершить бронирования, закончившиеся до cutoff, удалить старые свободные слоты, подписки и предложения"""
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO admin_logs (action_type, user_id, spot_id, booking_id, details)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (action_type, user_id, spot_id, booking_id, details))
+            UPDATE bookings 
+            SET status = 'completed' 
+            WHERE status = 'confirmed' AND end_time < ?
+        ''', (cutoff,))
+        
+        bump_slot_versions(cursor, 'end_time < ? AND is_booked = 0', (cutoff,))
+        _rollup_deleted_slots(cursor, 'end_time < ? AND is_booked = 0', (cutoff,), withdrawn=False)
+        cursor.execute('''
+            DELETE FROM spot_availability 
+            WHERE end_time < ? AND is_booked = 0
+        ''', (cutoff,))
+        
+        cursor.execute('''
+            UPDATE spot_notifications 
+            SET is_active = 0 
+            WHERE desired_date < DATE('now', '-7 days')
+        ''')
+        
+        cursor.execute("DELETE FROM slot_offers WHERE status != 'offered' AND created_at < ?", (cutoff,))
 
 
-def get_admin_logs(limit: int = 100) -> List[Dict[str, Any]]:
-    """Получить логи действий"""
+@writes
+def expire_pending_bookings(cutoff: str) -> List[Record]:
+    """Отменить неоплаченные бронирования, созданные до cutoff, и освободить их слоты
+
+    Вернуть отменённые с telegram_id клиента и номером места - для уведомлений.
+    """
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT * FROM admin_logs ORDER BY created_at DESC LIMIT ?
-        ''', (limit,))
-        return [dict(row) for row in cursor.fetchall()]
+            SELECT b.id, b.availability_id, b.customer_id, b.spot_id,
+                   u.telegram_id as customer_telegram_id,
+                   ps.spot_number
+            FROM bookings b
+            JOIN users u ON b.customer_id = u.id
+            JOIN parking_spots ps ON b.spot_id = ps.id
+            WHERE b.status = 'pending' AND b.created_at < ?
+        ''', (cutoff,))
+        expired = []
+        
+        for booking in cursor.fetchall():
+            # Отменяется только всё ещё неоплаченная бронь; слот - если занят ею
+            cursor.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ? AND status = 'pending'",
+                           (booking['id'],))
+            if cursor.rowcount == 0:
+                continue
+            expired.append(booking)
+            cursor.execute('''
+                UPDATE spot_availability 
+                SET is_booked = 0, booked_by = NULL, booking_id = NULL
+                WHERE id = ? AND booking_id = ?
+            ''', (booking['availability_id'], booking['id']))
+            bump_slot_versions(cursor, 'id = ?', (booking['availability_id'],))
+            log_admin_action('booking_cancelled', booking_id=booking['id'], user_id=booking['customer_id'],
+                             spot_id=booking['spot_id'], details=json.dumps({'reason': 'expired'}),
+                             cursor=cursor)
+        return expired
+
+
+def get_upcoming_bookings(start_from: str, start_to: str) -> List[Record]:
+    """Подтверждённые бронирования, начинающиеся в [start_from, start_to], - для напоминаний"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT b.id, b.start_time, b.end_time, b.total_price,
+                   u.telegram_id as customer_telegram_id,
+                   ps.spot_number,
+                   supplier.full_name as supplier_name
+            FROM bookings b
+            JOIN users u ON b.customer_id = u.id
+            JOIN parking_spots ps ON b.spot_id = ps.id
+            JOIN users supplier ON ps.supplier_id = supplier.id
+            WHERE b.status = 'confirmed' 
+            AND b.start_time BETWEEN ? AND ?
+        ''', (start_from, start_to))
+        return cursor.fetchall()
+
+
+# ==================== OCCUPANCY ====================
+
+def get_occupancy_intervals(date_from: str, date_to: str, supplier_id: int = None) -> Tuple[str, str]:
+    """Слоты и действующие брони, пересекающие период: "spot_id,начало,конец,..." в секундах эпохи
+
+    Строки склеиваются в SQLite в одну строку на таблицу: на годе истории их
+    сотни тысяч, и объект Python на каждую стоит дороже самого чтения.
+    Время в базе локальное без зоны и переводится как есть - разность с началом
+    периода, переведённым так же, остаётся верной.
+    """
+    spot_filter = 'AND spot_id IN (SELECT id FROM parking_spots WHERE supplier_id = ?)' if supplier_id else ''
+    params = (date_to, date_from) + ((supplier_id,) if supplier_id else ())
+    columns = "group_concat(spot_id || ',' || strftime('%s', start_time) || ',' || strftime('%s', end_time))"
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # Оба запроса покрываются индексами *_period, строки таблиц не читаются
+        cursor.execute(f'''
+            SELECT {columns} FROM spot_availability
+            WHERE start_time < ? AND end_time > ? {spot_filter}
+        ''', params)
+        offered = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT {columns} FROM bookings
+            WHERE start_time < ? AND end_time > ? AND status != 'cancelled' {spot_filter}
+        ''', params)
+        booked = cursor.fetchone()[0]
+    return offered or '', booked or ''
 
 
 # ==================== STATISTICS ====================
@@ -762,3 +2191,160 @@ def get_user_statistics(user_id: int) -> Dict[str, Any]:
         stats['total_earned'] = cursor.fetchone()[0]
         
         return stats
+
+
+# ==================== ANALYTICS ====================
+
+# Источники сводок: запрос (day, spot_id, значения...) по новым строкам
+# :last_id < id <= :upper и колонки сводок для значений. Строки источников только
+# добавляются, поэтому каждый проход читает лишь id после прошлого водяного знака;
+# удаление слотов поправляет сводки само (_rollup_deleted_slots)
+_HOURS = "(strftime('%s', {0}.end_time) - strftime('%s', {0}.start_time)) / 3600.0"
+ROLLUP_SOURCES = {
+    'spot_availability': (f'''
+        SELECT date(a.start_time), a.spot_id, SUM({_HOURS.format('a')})
+        FROM spot_availability a WHERE a.id > :last_id AND a.id <= :upper
+        GROUP BY 1, 2
+    ''', ('offered_hours',)),
+    'bookings': (f'''
+        SELECT date(b.start_time), b.spot_id, COUNT(*), SUM(b.total_price), SUM({_HOURS.format('b')})
+        FROM bookings b WHERE b.id > :last_id AND b.id <= :upper
+        GROUP BY 1, 2
+    ''', ('bookings', 'revenue', 'booked_hours')),
+    # Отмена - переход брони в cancelled: вычитается один раз на бронь, даже если
+    # в журнале несколько записей об её отмене
+    'admin_logs': (f'''
+        SELECT date(b.start_time), b.spot_id, COUNT(*), -SUM(b.total_price), -SUM({_HOURS.format('b')})
+        FROM bookings b
+        WHERE b.status = 'cancelled'
+        AND b.id IN (
+            SELECT l.booking_id FROM admin_logs l
+            WHERE l.id > :last_id AND l.id <= :upper AND l.action_type = 'booking_cancelled'
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM admin_logs p
+            WHERE p.booking_id = b.id AND p.action_type = 'booking_cancelled' AND p.id <= :last_id
+        )
+        GROUP BY 1, 2
+    ''', ('cancellations', 'revenue', 'booked_hours')),
+}
+
+
+@writes
+def record_empty_search(date_str: str):
+    """Отметить поиск на дату 'YYYY-MM-DD' без результатов"""
+    with get_connection() as conn:
+        conn.execute('INSERT INTO empty_searches (search_date) VALUES (?)', (date_str,))
+
+
+def _add_to_rollups(cursor: sqlite3.Cursor, rows: List[tuple], columns: Tuple[str, ...]):
+    """Прибавить строки (day, spot_id, значения...) к сводкам по местам и по дням"""
+    names = ', '.join(columns)
+    placeholders = ', '.join('?' * len(columns))
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in columns)
+    cursor.executemany(f'''
+        INSERT INTO daily_spot_stats (day, spot_id, {names}) VALUES (?, ?, {placeholders})
+        ON CONFLICT(day, spot_id) DO UPDATE SET {updates}
+    ''', rows)
+    
+    by_day: Dict[str, List[float]] = {}
+    for day, _, *values in rows:
+        totals = by_day.setdefault(day, [0] * len(columns))
+        for i, value in enumerate(values):
+            totals[i] += value
+    cursor.executemany(f'''
+        INSERT INTO daily_stats (day, {names}) VALUES (?, {placeholders})
+        ON CONFLICT(day) DO UPDATE SET {updates}
+    ''', [(day, *totals) for day, totals in by_day.items()])
+
+
+def _rollup_deleted_slots(cursor: sqlite3.Cursor, where: str, params: tuple, withdrawn: bool = True):
+    """Поправить offered_hours до удаления слотов where
+
+    Снятые с предложения слоты (withdrawn) вычитаются, если уже сложены в сводки.
+    Старые слоты при очистке действительно предлагались: их часы остаются, а ещё
+    не сложенные прибавляются - проход сводок удалённых строк уже не увидит.
+    """
+    row = cursor.execute("SELECT last_id FROM rollup_watermarks WHERE source = 'spot_availability'").fetchone()
+    last_id = row[0] if row else 0
+    condition, sign = ('a.id <= ?', '-') if withdrawn else ('a.id > ?', '')
+    cursor.execute(f'''
+        SELECT date(a.start_time), a.spot_id, {sign}SUM({_HOURS.format('a')})
+        FROM spot_availability a WHERE {where} AND {condition}
+        GROUP BY 1, 2
+    ''', (*params, last_id))
+    rows = [tuple(row) for row in cursor.fetchall()]
+    if rows:
+        _add_to_rollups(cursor, rows, ('offered_hours',))
+
+
+@writes
+def run_rollups() -> Dict[str, int]:
+    """Сложить в сводки строки, появившиеся после прошлого прохода; вернуть их число по источникам"""
+    processed = {}
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # Проход начинается с записи - блокировка берётся сразу, два прохода не пересекутся
+        cursor.executemany('INSERT OR IGNORE INTO rollup_watermarks (source) VALUES (?)',
+                           [(source,) for source in ROLLUP_SOURCES])
+        watermarks = dict(cursor.execute('SELECT source, last_id FROM rollup_watermarks').fetchall())
+        
+        for source, (query, columns) in ROLLUP_SOURCES.items():
+            last_id = watermarks[source]
+            upper = cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {source}').fetchone()[0]
+            if upper <= last_id:
+                processed[source] = 0
+                continue
+            rows = [tuple(row) for row in
+                    cursor.execute(query, {'last_id': last_id, 'upper': upper}).fetchall()]
+            _add_to_rollups(cursor, rows, columns)
+            cursor.execute('''
+                UPDATE rollup_watermarks SET last_id = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE source = ?
+            ''', (upper, source))
+            processed[source] = upper - last_id
+        
+        # Поиски без результатов нужны только сводкам - сложенные удаляются
+        cursor.execute('''
+            INSERT INTO daily_stats (day, empty_searches)
+            SELECT search_date, COUNT(*) FROM empty_searches WHERE true GROUP BY search_date
+            ON CONFLICT(day) DO UPDATE SET empty_searches = empty_searches + excluded.empty_searches
+        ''')
+        cursor.execute('DELETE FROM empty_searches')
+        processed['empty_searches'] = cursor.rowcount
+    
+    return processed
+
+
+def get_daily_stats(date_from: str, date_to: str) -> List[Record]:
+    """Суточные сводки за дни 'YYYY-MM-DD' включительно"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM daily_stats WHERE day BETWEEN ? AND ? ORDER BY day
+        ''', (date_from, date_to))
+        return cursor.fetchall()
+
+
+def get_spot_stats(date_from: str, date_to: str, limit: int = 10) -> List[Record]:
+    """Места с наибольшим оборотом за период - по сводкам"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.spot_id, ps.spot_number, SUM(s.bookings) as bookings,
+                   SUM(s.cancellations) as cancellations, SUM(s.revenue) as revenue,
+                   SUM(s.booked_hours) as booked_hours, SUM(s.offered_hours) as offered_hours
+            FROM daily_spot_stats s
+            JOIN parking_spots ps ON ps.id = s.spot_id
+            WHERE s.day BETWEEN ? AND ?
+            GROUP BY s.spot_id
+            ORDER BY revenue DESC
+            LIMIT ?
+        ''', (date_from, date_to, limit))
+        return cursor.fetchall()
+
+
+def get_rollups_updated_at() -> Optional[str]:
+    """Время последнего прохода сводок, который нашёл новые строки (UTC)"""
+    with get_connection() as conn:
+        return conn.execute('SELECT MAX(updated_at) FROM rollup_watermarks').fetchone()[0]
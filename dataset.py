@@ -0,0 +1,281 @@
+"""
+Генератор синтетических данных ParkingBot
+
+    python dataset.py --users 100000 [--db parking_bench.db] [--seed 1]
+
+Заполняет пустую базу жителями (валидные телефоны и карты по правилам
+utils.py), местами, слотами на 10 дней назад и 20 вперёд, бронированиями
+во всех статусах, подписками, расписаниями мест, сессиями и логом действий. Объёмы остальных
+таблиц пропорциональны числу жителей. Данные детерминированы по seed.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from utils import EVERY_DAY, WORKDAYS, luhn_check, validate_card, validate_phone
+
+# Пропорции к числу жителей
+SPOTS_PER_USER = 0.25
+SLOTS_PER_SPOT = 8
+NOTIFICATIONS_PER_USER = 0.1
+RULES_PER_SPOT = 0.2
+ADMINS = 5
+
+# Из 100 слотов: забронированы, были забронированы и отменены, остальные свободны
+BOOKED_PERCENT = 30
+CANCELLED_PERCENT = 5
+
+PRICES = [50, 80, 100, 120, 150, 200, 300]
+FIRST_NAMES = ["Иван", "Анна", "Пётр", "Мария", "Алексей", "Елена", "Дмитрий", "Ольга", "Сергей", "Наталья"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов"]
+CARD_BINS = ["2200", "4276", "5536", "4377"]
+
+FIRST_TELEGRAM_ID = 100_000_000
+
+
+def make_card(rng: random.Random) -> str:
+    """16-значный номер карты с верной контрольной цифрой"""
+    body = rng.choice(CARD_BINS) + "".join(str(rng.randint(0, 9)) for _ in range(11))
+    for check in range(10):
+        if luhn_check(body + str(check)):
+            return body + str(check)
+    raise AssertionError("Luhn check digit not found")
+
+
+def make_phone(index: int) -> str:
+    """Уникальный телефон 89XXXXXXXXX"""
+    return f"89{index:09d}"
+
+
+def _mix(*values: int) -> int:
+    """Детерминированный псевдослучайный хеш для полей по номеру строки (fmix32 из MurmurHash3)"""
+    h = 0x9E3779B9
+    for value in values:
+        h = (h ^ value) & 0xFFFFFFFF
+        h ^= h >> 16
+        h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+        h ^= h >> 13
+        h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+        h ^= h >> 16
+    return h
+
+
+def _ts(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class _Layout:
+    """Объёмы и общие для всех таблиц вычисления по номеру строки"""
+
+    def __init__(self, users: int, seed: int):
+        self.users = users
+        self.seed = seed
+        self.spots = max(1, int(users * SPOTS_PER_USER))
+        self.slots = self.spots * SLOTS_PER_SPOT
+        self.today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def slot(self, index: int) -> Tuple[int, datetime, datetime, int]:
+        """(spot_id, начало, конец, процентиль судьбы слота) слота по номеру"""
+        spot_index, n = divmod(index, SLOTS_PER_SPOT)
+        h = _mix(self.seed, index)
+        # Разные дни у слотов одного места - UNIQUE(spot_id, start_time, end_time)
+        day = -10 + n * 4 + h % 4
+        start = self.today + timedelta(days=day, hours=6 + (h >> 4) % 14, minutes=30 * ((h >> 8) % 2))
+        end = start + timedelta(hours=2 + (h >> 12) % 10)
+        return spot_index + 1, start, end, (h >> 16) % 100
+
+    def customer(self, index: int) -> int:
+        return _mix(self.seed, index, 7) % self.users + 1
+
+
+def _user_rows(layout: _Layout, rng: random.Random, banks: List[str]) -> Iterator[tuple]:
+    for i in range(layout.users):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        created = layout.today - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+        role = 'admin' if i < ADMINS else 'user'
+        is_active = 0 if rng.random() < 0.01 else 1
+        yield (FIRST_TELEGRAM_ID + i, f"resident{i}", name, make_phone(i), make_card(rng),
+               rng.choice(banks), role, is_active, _ts(created))
+
+
+def _spot_rows(layout: _Layout, rng: random.Random) -> Iterator[tuple]:
+    for j in range(layout.spots):
+        supplier_id = _mix(layout.seed, j, 3) % layout.users + 1
+        is_available = 0 if rng.random() < 0.03 else 1
+        yield (supplier_id, f"{rng.randint(1, 9)}{j:05d}", f"Корпус {rng.randint(1, 12)}",
+               rng.choice(["", "У лифта", "Крытое", "Широкое"]), rng.choice(PRICES),
+               int(rng.random() < 0.7), is_available)
+
+
+def _slot_rows(layout: _Layout) -> Iterator[tuple]:
+    booking_id = 0
+    for k in range(layout.slots):
+        spot_id, start, end, fate = layout.slot(k)
+        if fate < BOOKED_PERCENT:
+            booking_id += 1
+            yield spot_id, _ts(start), _ts(end), 1, layout.customer(k), booking_id
+        else:
+            if fate < BOOKED_PERCENT + CANCELLED_PERCENT:
+                booking_id += 1
+            yield spot_id, _ts(start), _ts(end), 0, None, None
+
+
+def _booking_rows(layout: _Layout, prices: Dict[int, float]) -> Iterator[tuple]:
+    now = datetime.now()
+    for k in range(layout.slots):
+        spot_id, start, end, fate = layout.slot(k)
+        if fate >= BOOKED_PERCENT + CANCELLED_PERCENT:
+            continue
+        price = round(prices[spot_id] * (end - start).total_seconds() / 3600, 2)
+        created = start - timedelta(hours=1 + fate % 48)
+        if fate >= BOOKED_PERCENT:
+            status, payment = 'cancelled', 'unpaid'
+        elif end < now:
+            status, payment = ('completed', 'paid') if fate % 3 else ('confirmed', 'paid')
+        else:
+            status, payment = ('pending', 'unpaid') if fate % 2 else ('confirmed', 'paid')
+        yield (layout.customer(k), spot_id, k + 1, _ts(start), _ts(end), price,
+               status, payment, 'card' if payment == 'paid' else None, _ts(created))
+
+
+def _notification_rows(layout: _Layout, rng: random.Random) -> Iterator[tuple]:
+    for _ in range(int(layout.users * NOTIFICATIONS_PER_USER)):
+        notify_any = rng.random() < 0.8
+        desired = layout.today + timedelta(days=rng.randint(0, 14)) if rng.random() < 0.7 else None
+        start_hour = rng.randint(6, 12)
+        has_window = rng.random() < 0.5
+        yield (rng.randint(1, layout.users),
+               None if notify_any else rng.randint(1, layout.spots),
+               desired.strftime("%Y-%m-%d") if desired else None,
+               f"{start_hour:02d}:00:00" if has_window else None,
+               f"{start_hour + rng.randint(2, 10):02d}:00:00" if has_window else None,
+               int(notify_any), int(rng.random() < 0.8))
+
+
+def _rule_rows(layout: _Layout, rng: random.Random) -> Iterator[tuple]:
+    # Слоты на 20 дней вперёд уже есть в наборе - считаем их созданными по правилам
+    materialized_until = (layout.today + timedelta(days=20)).strftime("%Y-%m-%d")
+    for _ in range(int(layout.spots * RULES_PER_SPOT)):
+        start_hour = rng.randint(6, 10)
+        valid_until = layout.today + timedelta(days=rng.randint(30, 120)) if rng.random() < 0.5 else None
+        yield (rng.randint(1, layout.spots), rng.choice([WORKDAYS, EVERY_DAY, 0b1100000]),
+               f"{start_hour:02d}:00", f"{start_hour + rng.randint(8, 11):02d}:00",
+               (layout.today - timedelta(days=rng.randint(0, 60))).strftime("%Y-%m-%d"),
+               valid_until.strftime("%Y-%m-%d") if valid_until else None, materialized_until)
+
+
+def _log_rows(conn: sqlite3.Connection) -> Iterator[tuple]:
+    """Лог действий в том же виде, что пишет database.log_admin_action"""
+    for row in conn.execute('SELECT id, full_name, phone, created_at FROM users'):
+        yield ('user_registered', row[0], None, None,
+               json.dumps({'full_name': row[1], 'phone': row[2]}), row[3])
+    for row in conn.execute('SELECT id, supplier_id, spot_number, price_per_hour, created_at FROM parking_spots'):
+        yield ('spot_added', row[1], row[0], None,
+               json.dumps({'spot_number': row[2], 'price': row[3]}), row[4])
+    for row in conn.execute('SELECT id, customer_id, spot_id, total_price, status, created_at FROM bookings'):
+        yield ('booking_created', row[1], row[2], row[0], json.dumps({'total_price': row[3]}), row[5])
+        if row[4] == 'cancelled':
+            yield ('booking_cancelled', row[1], row[2], row[0], None, row[5])
+
+
+def generate(path: str, users: int, seed: int = 1) -> Dict[str, int]:
+    """Создать базу path с нуля и заполнить её, вернуть число строк по таблицам"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.environ["DATABASE_PATH"] = path
+    # config читает DATABASE_PATH при импорте - поэтому импорт здесь, а не в начале модуля
+    import database as db
+    from config import BANKS
+
+    bound = db.TENANTS[db.get_tenant()][1]
+    if os.path.abspath(bound) != os.path.abspath(path):
+        raise RuntimeError(f"database is already bound to {bound}, not {path}")
+    db.init_database()
+    rng = random.Random(seed)
+    layout = _Layout(users, seed)
+
+    conn = sqlite3.connect(path)
+    try:
+        # Генерация - одна большая транзакция, надёжность записи здесь не нужна
+        conn.execute('PRAGMA synchronous = OFF')
+        with conn:
+            conn.executemany('''
+                INSERT INTO users (telegram_id, username, full_name, phone, card_number,
+                                   bank, role, is_active, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _user_rows(layout, rng, BANKS))
+            conn.executemany('''
+                INSERT INTO parking_spots (supplier_id, spot_number, address, description,
+                                           price_per_hour, is_partial_allowed, is_available)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', _spot_rows(layout, rng))
+            conn.executemany('''
+                INSERT INTO spot_availability (spot_id, start_time, end_time, is_booked, booked_by, booking_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', _slot_rows(layout))
+            prices = dict(conn.execute('SELECT id, price_per_hour FROM parking_spots'))
+            conn.executemany('''
+                INSERT INTO bookings (customer_id, spot_id, availability_id, start_time, end_time,
+                                      total_price, status, payment_status, payment_method, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _booking_rows(layout, prices))
+            conn.executemany('''
+                INSERT INTO spot_notifications (user_id, spot_id, desired_date, start_time,
+                                                end_time, notify_any, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', _notification_rows(layout, rng))
+            conn.executemany('''
+                INSERT INTO availability_rules (spot_id, weekdays, start_time, end_time,
+                                                valid_from, valid_until, materialized_until)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', _rule_rows(layout, rng))
+            conn.executemany('''
+                INSERT INTO admin_sessions (user_id, telegram_id) VALUES (?, ?)
+            ''', [(i + 1, FIRST_TELEGRAM_ID + i) for i in range(min(ADMINS, users))])
+            # Лог строится по уже вставленным строкам через отдельный курсор чтения
+            conn.executemany('''
+                INSERT INTO admin_logs (action_type, user_id, spot_id, booking_id, details, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', _log_rows(conn))
+
+        tables = ["users", "parking_spots", "spot_availability", "bookings",
+                  "spot_notifications", "availability_rules", "admin_sessions", "admin_logs"]
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+def check_sample(path: str, sample: int = 1000) -> int:
+    """Проверить телефоны и карты выборки валидаторами utils.py, вернуть число ошибок"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('SELECT phone, card_number FROM users LIMIT ?', (sample,)).fetchall()
+    finally:
+        conn.close()
+    return sum(1 for phone, card in rows if not validate_phone(phone)[0] or not validate_card(card)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные ParkingBot")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--db", default="parking_bench.db", help="файл базы (будет пересоздан)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(args.db, args.users, args.seed)
+    elapsed = time.perf_counter() - started
+    for table, count in counts.items():
+        print(f"{table:20} {count}")
+    print(f"invalid phones/cards in sample: {check_sample(args.db)}")
+    print(f"generated in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Доменные события ParkingBot
+
+Хендлер записывает изменение в базу, публикует событие и сразу отвечает
+жильцу, а уведомления поставщику, админам и очереди подписчиков отправляют
+подписчики событий в фоне. У каждого подписчика своя очередь на
+EVENT_QUEUE_SIZE событий и своя задача: медленный подписчик не задерживает
+остальных, события одного подписчика идут по порядку. При полной очереди
+публикация ждёт места - события не теряются и память не растёт. Событие
+публикуется после COMMIT, подписчик выполняется в ЖК, где оно случилось.
+При заданном EVENT_LOG события дописываются в лог JSON-строками;
+replay_log подаёт лог заново только подписчикам с replay=True - тем, чей
+повтор не шлёт сообщений второй раз (уведомления при повторе пропускаются).
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+import database as db
+import metrics
+from config import EVENT_LOG, EVENT_QUEUE_SIZE, METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== EVENTS ====================
+
+class UserRegistered(NamedTuple):
+    """Жилец прошёл регистрацию"""
+    user_id: int
+    full_name: str
+    phone: str
+
+
+class SpotCreated(NamedTuple):
+    """Жилец добавил место с первыми слотами"""
+    spot_id: int
+    supplier_id: int
+    spot_number: str
+    slot_ids: List[int]
+
+
+class SlotsAdded(NamedTuple):
+    """Новые слоты существующих мест: вручную, списком, по расписанию"""
+    slot_ids: List[int]
+
+
+class SlotFreed(NamedTuple):
+    """Слот снова свободен после отмены брони"""
+    slot_id: int
+
+
+class BookingCreated(NamedTuple):
+    """Жилец забронировал слот"""
+    booking_id: int
+    customer_id: int
+    supplier_telegram_id: int
+    spot_number: str
+    start_time: str
+    end_time: str
+    total_price: float
+
+
+class BookingCancelled(NamedTuple):
+    """Бронь отменена: жильцом (customer) или без оплаты (expired)"""
+    booking_id: int
+    customer_id: int
+    spot_id: int
+    availability_id: int
+    reason: str
+
+
+EVENT_TYPES: Dict[str, Type[NamedTuple]] = {
+    event_type.__name__: event_type
+    for event_type in (UserRegistered, SpotCreated, SlotsAdded, SlotFreed, BookingCreated, BookingCancelled)
+}
+
+Handler = Callable[[Any, Any], Awaitable[None]]
+
+
+# ==================== BUS ====================
+
+class Subscriber:
+    """Обработчик событий со своей очередью и задачей"""
+
+    def __init__(self, handler: Handler, queue_size: int = EVENT_QUEUE_SIZE, replay: bool = False):
+        self.handler = handler
+        self.name = handler.__name__
+        self.queue_size = queue_size
+        self.replay = replay
+        self.processed = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_running(self):
+        # Очередь и задача - в цикле событий первой публикации; задача
+        # закончившегося цикла (asyncio.run в тестах и бенчмарках) заводится заново
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(self.queue_size)
+            self._task = asyncio.create_task(self._run(), name=f"events-{self.name}")
+
+    async def put(self, item: Tuple[Any, str, Any, float]):
+        self._ensure_running()
+        await self._queue.put(item)
+
+    async def _run(self):
+        while True:
+            bot, tenant, event, published = await self._queue.get()
+            try:
+                with db.use_tenant(tenant):
+                    await self.handler(bot, event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                if METRICS_ENABLED:
+                    metrics.event_errors.inc((self.name,))
+                logger.error(f"Event subscriber {self.name} failed on {type(event).__name__}: {e}")
+            finally:
+                if METRICS_ENABLED:
+                    metrics.event_delay.observe((self.name,), time.perf_counter() - published)
+                self._queue.task_done()
+
+    async def drain(self):
+        """Дождаться обработки всего, что уже в очереди"""
+        if self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class EventLog:
+    """Дописывает события в лог (append-only, одна JSON-строка на событие)"""
+
+    def __init__(self, path: str):
+        # Построчная буферизация: событие не теряется при падении процесса
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def record(self, tenant: str, event: NamedTuple):
+        entry = {"ts": round(time.time(), 3), "tenant": tenant, "type": type(event).__name__,
+                 "data": event._asdict()}
+        try:
+            self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to write event log: {e}")
+
+    def close(self):
+        self._file.close()
+
+
+# Тип события -> подписчики; заполняется декоратором subscriber при импорте модулей
+_subscribers: Dict[Type[NamedTuple], List[Subscriber]] = {}
+_log: Optional[EventLog] = EventLog(EVENT_LOG) if EVENT_LOG else None
+
+
+def subscriber(*event_types: Type[NamedTuple], queue_size: int = EVENT_QUEUE_SIZE, replay: bool = False):
+    """Декоратор подписчика: async def handler(bot, event) на события event_types
+
+    replay=True - повтор события безопасен (обработчик сверяется с базой и не
+    шлёт уже отправленного), подписчик получает и события replay_log.
+    """
+    def register(handler: Handler) -> Handler:
+        subscription = Subscriber(handler, queue_size, replay)
+        for event_type in event_types:
+            _subscribers.setdefault(event_type, []).append(subscription)
+        return handler
+    return register
+
+
+async def publish(bot, event: NamedTuple, record: bool = True, replay: bool = False):
+    """Передать событие подписчикам текущего ЖК; ждёт только при полной очереди подписчика
+
+    replay=True - повтор из лога: только подписчикам с replay=True.
+    """
+    tenant = db.get_tenant()
+    if record and _log is not None:
+        _log.record(tenant, event)
+    item = (bot, tenant, event, time.perf_counter())
+    for subscription in _subscribers.get(type(event), ()):
+        if replay and not subscription.replay:
+            continue
+        await subscription.put(item)
+
+
+def _all_subscribers() -> List[Subscriber]:
+    unique = {id(subscription): subscription for subscriptions in _subscribers.values()
+              for subscription in subscriptions}
+    return list(unique.values())
+
+
+async def drain():
+    """Дождаться подписчиков (остановка бота, тесты)"""
+    for subscription in _all_subscribers():
+        await subscription.drain()
+
+
+async def stop():
+    """Доработать очереди и остановить задачи подписчиков"""
+    await drain()
+    for subscription in _all_subscribers():
+        subscription.stop()
+
+
+def get_event_stats() -> Dict[str, Dict[str, int]]:
+    """Обработано и с ошибкой по подписчикам"""
+    return {subscription.name: {'processed': subscription.processed, 'failed': subscription.failed}
+            for subscription in _all_subscribers()}
+
+
+# ==================== REPLAY ====================
+
+def read_log(path: str) -> Iterator[Tuple[str, NamedTuple]]:
+    """(ЖК, событие) из лога EVENT_LOG; неизвестные типы пропускаются"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            event_type = EVENT_TYPES.get(entry["type"])
+            if event_type is None:
+                logger.warning(f"Unknown event type in log: {entry['type']}")
+                continue
+            yield entry["tenant"], event_type(**entry["data"])
+
+
+async def replay_log(bot, path: str) -> int:
+    """Подать события лога заново подписчикам с replay=True; вернуть число событий
+
+    В лог события не дописываются. Уведомления жильцам, поставщикам и админам
+    при повторе не отправляются: они уже ушли при первой публикации.
+    """
+    replayed = 0
+    for tenant, event in read_log(path):
+        with db.use_tenant(tenant):
+            await publish(bot, event, record=False, replay=True)
+        replayed += 1
+    await drain()
+    return replayed
@@ -0,0 +1,54 @@
+"""
+Выгрузки данных в CSV для админов ParkingBot
+
+Файл пишется на диск пачками из database.iter_export_rows, большой
+сжимается в gzip. Сборка синхронная - хендлер запускает её в пуле
+потоков, чтобы не задерживать другие апдейты.
+"""
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+import database as db
+from config import EXPORT_CHUNK_ROWS, EXPORT_GZIP_BYTES
+
+EXPORT_KINDS = {
+    'bookings': "Бронирования",
+    'spots': "Места",
+    'users': "Пользователи",
+}
+
+
+def build_export(kind: str, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None) -> Tuple[str, str, int]:
+    """Собрать выгрузку во временный файл, вернуть (путь, имя для отправки, число строк)
+
+    Файл удаляет вызывающий.
+    """
+    fd, path = tempfile.mkstemp(prefix=f"parking_{kind}_", suffix=".csv")
+    rows = 0
+    try:
+        # utf-8-sig: Excel без BOM показывает кириллицу кракозябрами
+        with os.fdopen(fd, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(db.get_export_columns(kind))
+            for chunk in db.iter_export_rows(kind, date_from, date_to, EXPORT_CHUNK_ROWS):
+                writer.writerows(chunk)
+                rows += len(chunk)
+
+        period = f"_{date_from or 'start'}_{date_to or 'now'}" if date_from or date_to else ""
+        filename = f"{kind}{period}.csv"
+        if os.path.getsize(path) > EXPORT_GZIP_BYTES:
+            with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+            path, filename = path + ".gz", filename + ".gz"
+        return path, filename, rows
+    except Exception:
+        for leftover in (path, path + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
@@ -0,0 +1,118 @@
+"""
+Локальный фейковый Bot API ParkingBot - для бенчмарков и нагрузочных тестов
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Union, get_args, get_origin
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardMarkup, Message, Update, User
+
+FAKE_BOT_TOKEN = "123456789:AAFakeTokenForLocalBenchmarksOnly00000"
+
+
+class FakeSession(BaseSession):
+    """Сессия, которая ничего не отправляет в Telegram, а отвечает сама
+
+    Считает вызовы по методам и запоминает последнюю inline-клавиатуру в
+    каждом чате - по ней нагрузочный тест нажимает кнопки.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.keyboards: Dict[int, InlineKeyboardMarkup] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[method.__api_method__] += 1
+        markup = getattr(method, "reply_markup", None)
+        if isinstance(markup, InlineKeyboardMarkup) and getattr(method, "chat_id", None):
+            self.keyboards[method.chat_id] = markup
+
+        content = self.json_dumps({"ok": True, "result": self._fake_result(bot, method)})
+        return self.check_response(bot, method, 200, content).result
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None,
+                             timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    def _fake_result(self, bot: Bot, method: TelegramMethod) -> Any:
+        """Ответ нужного типа для метода Bot API"""
+        returning = method.__returning__
+
+        if returning is User:
+            return {"id": bot.id, "is_bot": True, "first_name": "ParkingBot", "username": "parking_bot"}
+        if returning is Message or (get_origin(returning) is Union and Message in get_args(returning)):
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": getattr(method, "chat_id", None) or 0, "type": "private"},
+                "text": getattr(method, "text", None),
+            }
+        if get_origin(returning) is list:
+            return []
+        return True
+
+
+def create_fake_bot(latency: float = 0.0) -> Bot:
+    """Бот с фейковой сессией"""
+    return Bot(token=FAKE_BOT_TOKEN, session=FakeSession(latency), parse_mode="HTML")
+
+
+# ==================== SYNTHETIC UPDATES ====================
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"Resident{user_id}", "username": f"resident{user_id}"}
+
+
+def make_message_update(user_id: int, text: str, bot: Optional[Bot] = None) -> Update:
+    """Апдейт с текстовым сообщением от пользователя"""
+    update = {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return Update.model_validate(update, context={"bot": bot})
+
+
+def make_callback_update(user_id: int, data: str, bot: Optional[Bot] = None) -> Update:
+    """Апдейт с нажатием inline-кнопки"""
+    update = {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "...",
+            },
+        },
+    }
+    return Update.model_validate(update, context={"bot": bot})
@@ -0,0 +1,152 @@
+"""
+Импорт жильцов ЖК из CSV для админов ParkingBot
+
+Файл целиком разбирается и проверяется до записи: ошибки собираются с
+номерами строк, занятые телефоны ищутся пачками, а не запросом на строку.
+Верные строки пишет database.import_residents пачками по IMPORT_CHUNK_ROWS.
+Жильцы создаются без telegram_id: аккаунт подключается при первом /start,
+когда жилец делится контактом с тем же телефоном.
+"""
+import csv
+import io
+from typing import Any, Dict, List, Optional, Tuple
+
+import database as db
+from config import BANKS, MAX_SPOTS_PER_USER, MIN_PRICE_PER_HOUR, MAX_PRICE_PER_HOUR
+from utils import validate_name, validate_phone, validate_card, validate_spot_number, validate_price
+
+# Колонка -> допустимые заголовки (без учёта регистра)
+IMPORT_COLUMNS = {
+    'full_name': ('full_name', 'name', 'фио', 'имя'),
+    'phone': ('phone', 'телефон'),
+    'card_number': ('card_number', 'card', 'карта'),
+    'bank': ('bank', 'банк'),
+    'spot_number': ('spot_number', 'spot', 'место'),
+    'price_per_hour': ('price_per_hour', 'price', 'цена'),
+}
+REQUIRED_COLUMNS = ('full_name', 'phone', 'card_number', 'bank')
+
+_BANKS_BY_NAME = {bank.lower(): bank for bank in BANKS}
+
+
+class ImportFileError(ValueError):
+    """Файл нельзя разобрать целиком (кодировка, заголовок)"""
+
+
+def _decode(data: bytes) -> str:
+    # Excel сохраняет CSV в UTF-8 с BOM или в cp1251
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1251")
+
+
+def read_rows(data: bytes) -> List[Tuple[int, Dict[str, str]]]:
+    """CSV -> [(номер строки в файле, {колонка: значение})]; разделитель - запятая, ';' или табуляция"""
+    try:
+        text = _decode(data)
+    except UnicodeDecodeError:
+        raise ImportFileError("Файл не в UTF-8 и не в cp1251") from None
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+
+    header = next(reader, None)
+    if not header:
+        raise ImportFileError("Файл пустой")
+    aliases = {alias: column for column, names in IMPORT_COLUMNS.items() for alias in names}
+    positions = {}
+    for index, title in enumerate(header):
+        column = aliases.get(title.strip().lower())
+        if column and column not in positions:
+            positions[column] = index
+    missing = [column for column in REQUIRED_COLUMNS if column not in positions]
+    if missing:
+        raise ImportFileError(f"Нет колонок: {', '.join(missing)}")
+
+    rows = []
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        rows.append((reader.line_num, {column: values[index].strip() if index < len(values) else ""
+                                       for column, index in positions.items()}))
+    return rows
+
+
+def _error(message: str) -> str:
+    # Тексты валидаторов написаны для чата - без значка в начале
+    return message.lstrip("❌").strip()
+
+
+def _check_row(row: Dict[str, str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Одна строка через валидаторы регистрации -> (жилец, ошибка)"""
+    resident = {}
+    for column, validate in (('full_name', validate_name), ('phone', validate_phone),
+                             ('card_number', validate_card)):
+        is_valid, result = validate(row[column])
+        if not is_valid:
+            return None, _error(result)
+        resident[column] = result
+
+    resident['bank'] = _BANKS_BY_NAME.get(row['bank'].lower())
+    if resident['bank'] is None:
+        return None, f"Неизвестный банк «{row['bank'][:30]}»"
+
+    spot_number, price = row.get('spot_number', ""), row.get('price_per_hour', "")
+    resident['spots'] = []
+    if spot_number or price:
+        is_valid, result = validate_spot_number(spot_number)
+        if not is_valid:
+            return None, _error(result)
+        is_valid, price_value = validate_price(price)
+        if not is_valid or not MIN_PRICE_PER_HOUR <= price_value <= MAX_PRICE_PER_HOUR:
+            return None, f"Цена места должна быть от {MIN_PRICE_PER_HOUR} до {MAX_PRICE_PER_HOUR} ₽/час"
+        resident['spots'].append((result, price_value))
+    return resident, None
+
+
+def check_rows(rows: List[Tuple[int, Dict[str, str]]]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """Проверить все строки за один проход -> (жильцы к записи, [(строка, ошибка)])
+
+    Строки с одним телефоном - один жилец с несколькими местами: данные жильца
+    берутся из первой строки, в остальных они должны совпадать.
+    """
+    residents: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    for line, row in rows:
+        resident, error = _check_row(row)
+        if error:
+            errors.append((line, error))
+            continue
+        first = residents.get(resident['phone'])
+        if first is None:
+            resident['line'] = line
+            residents[resident['phone']] = resident
+        elif any(first[key] != resident[key] for key in ('full_name', 'card_number', 'bank')):
+            errors.append((line, f"Телефон уже указан в строке {first['line']} с другими данными"))
+        elif len(first['spots']) + len(resident['spots']) > MAX_SPOTS_PER_USER:
+            errors.append((line, f"У жильца больше {MAX_SPOTS_PER_USER} мест"))
+        else:
+            first['spots'] += resident['spots']
+
+    # Занятые телефоны - пачками по всему файлу
+    taken = db.get_taken_phones(list(residents))
+    for phone in taken:
+        errors.append((residents.pop(phone)['line'], "Телефон уже есть в базе"))
+    errors.sort()
+    return list(residents.values()), errors
+
+
+def import_csv(data: bytes, admin_id: int = None) -> Dict[str, Any]:
+    """Разобрать, проверить и записать файл -> {'rows', 'users', 'spots', 'skipped', 'errors'}
+
+    Строки с ошибками пропускаются, верные записываются: исправленный файл
+    можно загрузить ещё раз - уже записанные жильцы попадут в ошибки как занятые.
+    """
+    rows = read_rows(data)
+    residents, errors = check_rows(rows)
+    result = db.import_residents(residents, admin_id)
+    result.update(rows=len(rows), errors=errors)
+    return result
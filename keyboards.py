@@ -1,20 +1,25 @@
 """
 Клавиатуры ParkingBot
+
+Неизменные клавиатуры собираются один раз при импорте, клавиатуры с
+префиксом - при первом вызове, клавиатура дат - раз в сутки. Возвращаемые
+объекты общие для всех вызовов: их нельзя изменять на месте.
 """
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
 )
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from datetime import datetime, timedelta, date
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
 
-from config import BANKS
-from utils import get_next_days, format_date
+from config import BANKS, TENANTS
+from utils import get_next_days, format_date, EVERY_DAY, WORKDAYS, WEEKDAY_NAMES
 
 
 # ==================== REPLY KEYBOARDS ====================
 
-def get_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
+def _build_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     """Главное меню"""
     buttons = [
         [KeyboardButton(text="📅 Найти место"), KeyboardButton(text="➕ Добавить место")],
@@ -28,7 +33,7 @@ def get_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
 
-def get_cancel_keyboard() -> ReplyKeyboardMarkup:
+def _build_cancel_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура с кнопкой отмены"""
     return ReplyKeyboardMarkup(
         keyboard=[[KeyboardButton(text="❌ Отмена")]],
@@ -36,7 +41,7 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
-def get_cancel_menu_keyboard() -> ReplyKeyboardMarkup:
+def _build_cancel_menu_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура с отменой и главным меню"""
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -46,13 +51,24 @@ def get_cancel_menu_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
-def get_admin_menu_keyboard() -> ReplyKeyboardMarkup:
+def _build_registration_keyboard() -> ReplyKeyboardMarkup:
+    """Регистрация: свой контакт для подключения импортированного жильца или отмена"""
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="📱 Поделиться номером", request_contact=True)],
+            [KeyboardButton(text="❌ Отмена")]
+        ],
+        resize_keyboard=True
+    )
+
+
+def _build_admin_menu_keyboard() -> ReplyKeyboardMarkup:
     """Меню администратора"""
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="👥 Пользователи"), KeyboardButton(text="🏠 Все места")],
             [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📢 Рассылка")],
-            [KeyboardButton(text="🔙 Главное меню")]
+            [KeyboardButton(text="📜 Журнал"), KeyboardButton(text="🔙 Главное меню")]
         ],
         resize_keyboard=True
     )
@@ -60,7 +76,7 @@ def get_admin_menu_keyboard() -> ReplyKeyboardMarkup:
 
 # ==================== INLINE KEYBOARDS ====================
 
-def get_banks_keyboard() -> InlineKeyboardMarkup:
+def _build_banks_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора банка"""
     buttons = []
     for bank in BANKS:
@@ -68,7 +84,15 @@ def get_banks_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_dates_keyboard(prefix: str = "date") -> InlineKeyboardMarkup:
+def _build_tenants_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора ЖК"""
+    buttons = []
+    for code, (name, _) in TENANTS.items():
+        buttons.append([InlineKeyboardButton(text=f"🏘 {name}", callback_data=f"tenant_{code}")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def _build_dates_keyboard(prefix: str = "date") -> InlineKeyboardMarkup:
     """Клавиатура выбора даты (6 ближайших дней)"""
     days = get_next_days(6)
     buttons = []
@@ -85,7 +109,7 @@ def get_dates_keyboard(prefix: str = "date") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_time_slots_keyboard(prefix: str = "time") -> InlineKeyboardMarkup:
+def _build_time_slots_keyboard(prefix: str = "time") -> InlineKeyboardMarkup:
     """Клавиатура выбора времени (слоты по 2 часа)"""
     buttons = []
     
@@ -121,7 +145,7 @@ def get_time_slots_keyboard(prefix: str = "time") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_yes_no_keyboard(prefix: str = "choice") -> InlineKeyboardMarkup:
+def _build_yes_no_keyboard(prefix: str = "choice") -> InlineKeyboardMarkup:
     """Клавиатура Да/Нет"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -131,7 +155,7 @@ def get_yes_no_keyboard(prefix: str = "choice") -> InlineKeyboardMarkup:
     ])
 
 
-def get_confirm_keyboard(prefix: str = "confirm") -> InlineKeyboardMarkup:
+def _build_confirm_keyboard(prefix: str = "confirm") -> InlineKeyboardMarkup:
     """Клавиатура подтверждения"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -141,11 +165,172 @@ def get_confirm_keyboard(prefix: str = "confirm") -> InlineKeyboardMarkup:
     ])
 
 
-def get_available_slots_keyboard(slots: List[Dict[str, Any]]) -> InlineKeyboardMarkup:
-    """Клавиатура доступных слотов"""
+def _build_no_slots_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура когда нет свободных мест"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔔 Уведомить при появлении", callback_data="notify_available")],
+        [InlineKeyboardButton(text="📅 Выбрать другую дату", callback_data="search_again")],
+        [InlineKeyboardButton(text="🔙 Главное меню", callback_data="main_menu")]
+    ])
+
+
+def _build_profile_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура профиля"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✏️ Изменить имя", callback_data="edit_name")],
+        [InlineKeyboardButton(text="📞 Изменить телефон", callback_data="edit_phone")],
+        [InlineKeyboardButton(text="💳 Изменить карту", callback_data="edit_card")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="back")]
+    ])
+
+
+def _build_notify_options_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура опций уведомления"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📅 На конкретную дату", callback_data="notify_date")],
+        [InlineKeyboardButton(text="🔔 На любое свободное место", callback_data="notify_any")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
+    ])
+
+
+def _build_analytics_keyboard() -> InlineKeyboardMarkup:
+    """Периоды аналитики под статистикой"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📈 7 дней", callback_data="analytics_past_7"),
+         InlineKeyboardButton(text="📈 30 дней", callback_data="analytics_past_30")],
+        [InlineKeyboardButton(text="🔮 Следующие 7 дней", callback_data="analytics_next_7")],
+        [InlineKeyboardButton(text="🗓 Загрузка по часам недели", callback_data="heatmap")]
+    ])
+
+
+def _build_rule_until_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура срока расписания"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="♾ Без даты окончания", callback_data="rule_until_none")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
+    ])
+
+
+# ==================== CACHED KEYBOARDS ====================
+
+_MAIN_MENU = _build_main_menu_keyboard(False)
+_MAIN_MENU_ADMIN = _build_main_menu_keyboard(True)
+_CANCEL = _build_cancel_keyboard()
+_CANCEL_MENU = _build_cancel_menu_keyboard()
+_REGISTRATION = _build_registration_keyboard()
+_ADMIN_MENU = _build_admin_menu_keyboard()
+_BANKS = _build_banks_keyboard()
+_TENANTS = _build_tenants_keyboard()
+_NO_SLOTS = _build_no_slots_keyboard()
+_PROFILE = _build_profile_keyboard()
+_NOTIFY_OPTIONS = _build_notify_options_keyboard()
+_ANALYTICS = _build_analytics_keyboard()
+_RULE_UNTIL = _build_rule_until_keyboard()
+
+# prefix -> (дата сборки, клавиатура)
+_dates_cache: Dict[str, Tuple[date, InlineKeyboardMarkup]] = {}
+
+
+def get_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
+    """Главное меню"""
+    return _MAIN_MENU_ADMIN if is_admin else _MAIN_MENU
+
+
+def get_cancel_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура с кнопкой отмены"""
+    return _CANCEL
+
+
+def get_cancel_menu_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура с отменой и главным меню"""
+    return _CANCEL_MENU
+
+
+def get_registration_keyboard() -> ReplyKeyboardMarkup:
+    """Регистрация: поделиться номером или отмена"""
+    return _REGISTRATION
+
+
+def get_admin_menu_keyboard() -> ReplyKeyboardMarkup:
+    """Меню администратора"""
+    return _ADMIN_MENU
+
+
+def get_banks_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора банка"""
+    return _BANKS
+
+
+def get_tenants_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора ЖК"""
+    return _TENANTS
+
+
+def get_dates_keyboard(prefix: str = "date") -> InlineKeyboardMarkup:
+    """Клавиатура выбора даты (6 ближайших дней), пересобирается при смене суток"""
+    today = date.today()
+    cached = _dates_cache.get(prefix)
+    if cached is None or cached[0] != today:
+        cached = (today, _build_dates_keyboard(prefix))
+        _dates_cache[prefix] = cached
+    return cached[1]
+
+
+@lru_cache(maxsize=None)
+def get_time_slots_keyboard(prefix: str = "time") -> InlineKeyboardMarkup:
+    """Клавиатура выбора времени (слоты по 2 часа)"""
+    return _build_time_slots_keyboard(prefix)
+
+
+@lru_cache(maxsize=None)
+def get_yes_no_keyboard(prefix: str = "choice") -> InlineKeyboardMarkup:
+    """Клавиатура Да/Нет"""
+    return _build_yes_no_keyboard(prefix)
+
+
+@lru_cache(maxsize=None)
+def get_confirm_keyboard(prefix: str = "confirm") -> InlineKeyboardMarkup:
+    """Клавиатура подтверждения"""
+    return _build_confirm_keyboard(prefix)
+
+
+def get_no_slots_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура когда нет свободных мест"""
+    return _NO_SLOTS
+
+
+def get_profile_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура профиля"""
+    return _PROFILE
+
+
+def get_notify_options_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура опций уведомления"""
+    return _NOTIFY_OPTIONS
+
+
+def get_analytics_keyboard() -> InlineKeyboardMarkup:
+    """Периоды аналитики под статистикой"""
+    return _ANALYTICS
+
+
+def get_rule_until_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура срока расписания"""
+    return _RULE_UNTIL
+
+
+# ==================== DYNAMIC KEYBOARDS ====================
+
+SLOT_SORT_LABELS = {'time': "🕐 Раньше", 'price': "💰 Дешевле", 'wait': "⏳ Без ожидания"}
+
+
+def get_available_slots_keyboard(slots: List[Dict[str, Any]], prev_cursor: str = None,
+                                  next_cursor: str = None, sort: str = 'time',
+                                  filtered: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура страницы доступных слотов"""
     buttons = []
     
-    for slot in slots[:10]:  # Ограничиваем 10 слотами
+    for slot in slots:
         start = datetime.fromisoformat(slot['start_time'])
         end = datetime.fromisoformat(slot['end_time'])
         
@@ -155,21 +340,30 @@ def get_available_slots_keyboard(slots: List[Dict[str, Any]]) -> InlineKeyboardM
             callback_data=f"slot_{slot['id']}"
         )])
     
+    # Навигация: курсор - ключ сортировки первого/последнего слота страницы
+    nav_row = []
+    if prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"slots_prev_{prev_cursor}"))
+    if next_cursor:
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"slots_next_{next_cursor}"))
+    if nav_row:
+        buttons.append(nav_row)
+    
+    buttons.append([
+        InlineKeyboardButton(text=f"✅ {label}" if key == sort else label, callback_data=f"search_sort_{key}")
+        for key, label in SLOT_SORT_LABELS.items()
+    ])
+    filter_row = [InlineKeyboardButton(text="🎛 Время и цена", callback_data="search_filters")]
+    if filtered:
+        filter_row.append(InlineKeyboardButton(text="♻️ Сбросить", callback_data="search_filters_reset"))
+    buttons.append(filter_row)
+    
     buttons.append([InlineKeyboardButton(text="🔔 Уведомить при появлении", callback_data="notify_available")])
     buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_no_slots_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура когда нет свободных мест"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔔 Уведомить при появлении", callback_data="notify_available")],
-        [InlineKeyboardButton(text="📅 Выбрать другую дату", callback_data="search_again")],
-        [InlineKeyboardButton(text="🔙 Главное меню", callback_data="main_menu")]
-    ])
-
-
 def get_user_spots_keyboard(spots: List[Dict[str, Any]]) -> InlineKeyboardMarkup:
     """Клавиатура мест пользователя"""
     buttons = []
@@ -181,6 +375,7 @@ def get_user_spots_keyboard(spots: List[Dict[str, Any]]) -> InlineKeyboardMarkup
             callback_data=f"myspot_{spot['id']}"
         )])
     
+    buttons.append([InlineKeyboardButton(text="🗓 Загрузка по часам", callback_data="my_heatmap")])
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -189,13 +384,52 @@ def get_user_spots_keyboard(spots: List[Dict[str, Any]]) -> InlineKeyboardMarkup
 def get_spot_actions_keyboard(spot_id: int) -> InlineKeyboardMarkup:
     """Клавиатура действий с местом"""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📅 Добавить слот", callback_data=f"add_slot_{spot_id}")],
+        [InlineKeyboardButton(text="📅 Добавить слот", callback_data=f"add_slot_{spot_id}"),
+         InlineKeyboardButton(text="🗂 Несколько слотов", callback_data=f"bulk_slots_{spot_id}")],
+        [InlineKeyboardButton(text="🔁 Расписание", callback_data=f"rules_{spot_id}")],
         [InlineKeyboardButton(text="📋 Бронирования", callback_data=f"spot_bookings_{spot_id}")],
         [InlineKeyboardButton(text="🗑 Удалить место", callback_data=f"delete_spot_{spot_id}")],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="my_spots")]
     ])
 
 
+def get_spot_rules_keyboard(spot_id: int, rules: List[Dict[str, Any]],
+                            can_add: bool = True) -> InlineKeyboardMarkup:
+    """Клавиатура расписаний места: исключение и удаление по номеру в списке"""
+    buttons = []
+    
+    for i, rule in enumerate(rules, 1):
+        buttons.append([
+            InlineKeyboardButton(text=f"🚫 Исключение {i}", callback_data=f"rule_skip_{rule['id']}"),
+            InlineKeyboardButton(text=f"🗑 Удалить {i}", callback_data=f"rule_del_{rule['id']}")
+        ])
+    
+    if can_add:
+        buttons.append([InlineKeyboardButton(text="➕ Новое расписание", callback_data=f"rule_new_{spot_id}")])
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data=f"myspot_{spot_id}")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@lru_cache(maxsize=128)
+def get_rule_weekdays_keyboard(mask: int) -> InlineKeyboardMarkup:
+    """Выбор дней недели расписания: отмеченные дни - с галочкой"""
+    days = [
+        InlineKeyboardButton(text=f"✅ {name}" if mask >> i & 1 else name, callback_data=f"rule_day_{i}")
+        for i, name in enumerate(WEEKDAY_NAMES)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[
+        days[:4],
+        days[4:],
+        [
+            InlineKeyboardButton(text="Будни", callback_data=f"rule_days_{WORKDAYS}"),
+            InlineKeyboardButton(text="Каждый день", callback_data=f"rule_days_{EVERY_DAY}")
+        ],
+        [InlineKeyboardButton(text="➡️ Далее", callback_data="rule_days_done")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
+    ])
+
+
 def get_user_bookings_keyboard(bookings: List[Dict[str, Any]]) -> InlineKeyboardMarkup:
     """Клавиатура бронирований пользователя"""
     buttons = []
@@ -252,6 +486,14 @@ def get_notifications_keyboard(notifications: List[Dict[str, Any]]) -> InlineKey
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def get_offer_keyboard(offer_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура предложения слота из очереди"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Забронировать", callback_data=f"offer_book_{offer_id}"),
+        InlineKeyboardButton(text="❌ Не нужно", callback_data=f"offer_decline_{offer_id}")
+    ]])
+
+
 # ==================== ADMIN KEYBOARDS ====================
 
 def get_users_pagination_keyboard(users: List[Dict[str, Any]], page: int, 
@@ -294,6 +536,51 @@ def get_users_pagination_keyboard(users: List[Dict[str, Any]], page: int,
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+LOG_ACTION_LABELS = {
+    'user_registered': "📝 Регистрации",
+    'spot_added': "🏠 Места",
+    'booking_created': "🎫 Брони",
+    'booking_cancelled': "❌ Отмены",
+    'admin_login': "🔐 Входы",
+    'data_exported': "📤 Выгрузки",
+    'schedule_added': "🔁 Расписания",
+    'residents_imported': "📥 Импорт",
+}
+
+
+def get_admin_logs_keyboard(action_type: str = None, prev_cursor: str = None,
+                            next_cursor: str = None, filtered: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура страницы журнала действий"""
+    buttons = []
+    
+    # Навигация: курсор - (created_at, id) первой/последней записи страницы
+    nav_row = []
+    if prev_cursor:
+        nav_row.append(InlineKeyboardButton(text="◀️ Новее", callback_data=f"logs_prev_{prev_cursor}"))
+    if next_cursor:
+        nav_row.append(InlineKeyboardButton(text="Старее ▶️", callback_data=f"logs_next_{next_cursor}"))
+    if nav_row:
+        buttons.append(nav_row)
+    
+    types = [(None, "📜 Все")] + list(LOG_ACTION_LABELS.items())
+    type_buttons = [
+        InlineKeyboardButton(text=f"✅ {label}" if key == action_type else label,
+                             callback_data=f"logs_type_{key or 'all'}")
+        for key, label in types
+    ]
+    for i in range(0, len(type_buttons), 3):
+        buttons.append(type_buttons[i:i + 3])
+    
+    filter_row = [InlineKeyboardButton(text="🎛 Фильтры", callback_data="logs_filters")]
+    if filtered:
+        filter_row.append(InlineKeyboardButton(text="♻️ Сбросить", callback_data="logs_filters_reset"))
+    buttons.append(filter_row)
+    
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_back")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 def get_user_admin_actions_keyboard(user_id: int, user: Dict[str, Any]) -> InlineKeyboardMarkup:
     """Клавиатура действий администратора над пользователем"""
     buttons = []
@@ -361,21 +648,3 @@ def get_admin_spots_keyboard(spots: List[Dict[str, Any]]) -> InlineKeyboardMarku
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-
-def get_profile_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура профиля"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✏️ Изменить имя", callback_data="edit_name")],
-        [InlineKeyboardButton(text="📞 Изменить телефон", callback_data="edit_phone")],
-        [InlineKeyboardButton(text="💳 Изменить карту", callback_data="edit_card")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="back")]
-    ])
-
-
-def get_notify_options_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура опций уведомления"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📅 На конкретную дату", callback_data="notify_date")],
-        [InlineKeyboardButton(text="🔔 На любое свободное место", callback_data="notify_any")],
-        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
-    ])
@@ -0,0 +1,220 @@
+"""
+Нагрузочный тест ParkingBot без Telegram
+
+Виртуальные жители проходят сценарии целиком через dp.feed_update на
+фейковом Bot API (fake_bot.py): регистрация, добавление места, поиск с
+бронированием и рассылка администратора. Кнопки нажимаются по тем
+клавиатурам, которые бот действительно отправил жителю. Запуск и отчёт -
+python benchmarks.py load.
+"""
+import asyncio
+import random
+import re
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+
+from fake_bot import create_fake_bot, make_callback_update, make_message_update
+
+# Доли сценариев зарегистрированного жителя
+SCENARIO_WEIGHTS = {"search_and_book": 70, "add_spot": 30}
+BROADCAST_TEXT = "Плановая уборка паркинга в субботу с 10:00 до 14:00"
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Внутренний middleware роутера: точное время каждого вызова хендлера"""
+
+    def __init__(self, router_name: str, timings: Dict[str, List[float]]):
+        self.router_name = router_name
+        self.timings = timings
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.timings[f"{self.router_name}:{name}"].append(time.perf_counter() - started)
+
+
+class LoadDriver:
+    """Подаёт апдейты в диспетчер и считает задержки и ошибки"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, think: float, rng: random.Random):
+        self.dp = dp
+        self.bot = bot
+        self.think = think
+        self.rng = rng
+        self.update_timings: List[float] = []
+        self.errors: Counter = Counter()
+        self.lock_errors = 0
+        self.scenarios: Counter = Counter()
+
+    async def feed(self, update) -> bool:
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+            return True
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e):
+                self.lock_errors += 1
+            self.errors[type(e).__name__] += 1
+            return False
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+            return False
+        finally:
+            self.update_timings.append(time.perf_counter() - started)
+
+    async def pause(self):
+        """Пауза жителя между действиями"""
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, self.think))
+
+
+class VirtualResident:
+    """Житель, который пишет боту и нажимает кнопки из его ответов"""
+
+    def __init__(self, driver: LoadDriver, telegram_id: int):
+        self.driver = driver
+        self.telegram_id = telegram_id
+
+    async def send(self, text: str) -> bool:
+        await self.driver.pause()
+        return await self.driver.feed(make_message_update(self.telegram_id, text, self.driver.bot))
+
+    async def click(self, pattern: str, first: bool = False) -> bool:
+        """Нажать кнопку последней клавиатуры, callback_data которой подходит под pattern"""
+        markup = self.driver.bot.session.keyboards.get(self.telegram_id)
+        buttons = [button.callback_data for row in (markup.inline_keyboard if markup else [])
+                   for button in row if button.callback_data and re.fullmatch(pattern, button.callback_data)]
+        if not buttons:
+            return False
+        data = buttons[0] if first else self.driver.rng.choice(buttons)
+        await self.driver.pause()
+        return await self.driver.feed(make_callback_update(self.telegram_id, data, self.driver.bot))
+
+
+# ==================== SCENARIOS ====================
+
+async def scenario_registration(resident: VirtualResident) -> bool:
+    from dataset import make_card, make_phone
+
+    rng = resident.driver.rng
+    return (await resident.send("/start")
+            and await resident.send(f"Житель {resident.telegram_id}")
+            and await resident.send(make_phone(resident.telegram_id % 10 ** 9))
+            and await resident.send(make_card(rng))
+            and await resident.click(r"bank_.+"))
+
+
+async def scenario_add_spot(resident: VirtualResident) -> bool:
+    rng = resident.driver.rng
+    # Конец - в один из следующих дней, чтобы интервал всегда был корректным
+    return (await resident.send("➕ Добавить место")
+            and await resident.send(f"L{resident.telegram_id % 100000}")
+            and await resident.click(r"start_date_\d.*", first=True)
+            and await resident.click(r"start_time_\d.*")
+            and await resident.click(r"end_date_\d.*")
+            and await resident.click(r"end_time_\d.*")
+            and await resident.click(r"partial_(yes|no)")
+            and await resident.send(str(rng.choice([80, 100, 150, 200])))
+            and await resident.click(r"spot_confirm_yes"))
+
+
+async def scenario_search_and_book(resident: VirtualResident) -> bool:
+    rng = resident.driver.rng
+    if not (await resident.send("📅 Найти место")
+            and await resident.click(r"search_date_\d.*")):
+        return False
+    if rng.random() < 0.3:
+        await resident.click(r"search_sort_\w+")
+    return (await resident.click(r"slot_\d+")
+            and await resident.click(r"booking_confirm_yes"))
+
+
+async def scenario_broadcast(resident: VirtualResident) -> bool:
+    return (await resident.send("📢 Рассылка")
+            and await resident.send(BROADCAST_TEXT))
+
+
+SCENARIOS = {
+    "registration": scenario_registration,
+    "add_spot": scenario_add_spot,
+    "search_and_book": scenario_search_and_book,
+    "broadcast": scenario_broadcast,
+}
+
+
+# ==================== RUN ====================
+
+async def _run_resident(driver: LoadDriver, resident: VirtualResident, scenarios: List[str]):
+    for name in scenarios:
+        completed = await SCENARIOS[name](resident)
+        driver.scenarios[(name, "ok" if completed else "aborted")] += 1
+
+
+async def run_load(residents: List[int], new_residents: List[int], admins: List[int],
+                   rounds: int, broadcasts: int, latency: float, think: float,
+                   seed: int) -> Dict[str, Any]:
+    """Прогнать сценарии всех жителей одновременно, вернуть сырые замеры"""
+    # Импорт здесь: main читает конфиг, а DATABASE_PATH задаёт вызывающий
+    import events
+    from admin_handlers import router as admin_router
+    from main import create_dispatcher
+    from user_handlers import router as user_router
+
+    timings: Dict[str, List[float]] = defaultdict(list)
+    for router in (user_router, admin_router):
+        middleware = HandlerTimingMiddleware(router.name, timings)
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
+
+    dp = create_dispatcher()
+    bot = create_fake_bot(latency)
+    rng = random.Random(seed)
+    driver = LoadDriver(dp, bot, think, rng)
+
+    names, weights = list(SCENARIO_WEIGHTS), list(SCENARIO_WEIGHTS.values())
+    tasks = []
+    for telegram_id in residents:
+        tasks.append(_run_resident(driver, VirtualResident(driver, telegram_id),
+                                   rng.choices(names, weights, k=rounds)))
+    for telegram_id in new_residents:
+        tasks.append(_run_resident(driver, VirtualResident(driver, telegram_id),
+                                   ["registration"] + rng.choices(names, weights, k=rounds - 1)))
+    for telegram_id in admins:
+        tasks.append(_run_resident(driver, VirtualResident(driver, telegram_id), ["broadcast"] * broadcasts))
+
+    started_at = time.time()
+    await asyncio.gather(*tasks)
+    finished_at = time.time()
+    # Уведомления подписчиков событий - вне замера сценариев, но до закрытия бота
+    await events.drain()
+    await bot.session.close()
+
+    return {
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "update_timings": driver.update_timings,
+        "handler_timings": dict(timings),
+        "errors": dict(driver.errors),
+        "lock_errors": driver.lock_errors,
+        "scenarios": dict(driver.scenarios),
+        "bot_calls": dict(bot.session.calls),
+    }
+
+
+def run_process(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Точка входа процесса нагрузки (для ProcessPoolExecutor)"""
+    return asyncio.run(run_load(**kwargs))
@@ -9,9 +9,20 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, LOG_LEVEL, LOG_FORMAT
+from config import (
+    BOT_TOKEN, LOG_LEVEL, LOG_FORMAT, WORKER_PROCESSES, THROTTLE_ENABLED,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT, UPDATE_LOG, UPDATE_LOG_SALT, RULE_HORIZON_DAYS,
+    OFFER_CHECK_SECONDS
+)
 import database as db
-from user_handlers import router as user_router
+import events
+import metrics
+import admin_sessions
+import replay
+import sharding
+import tenants
+from throttling import ThrottlingMiddleware
+from user_handlers import router as user_router, send_offers
 from admin_handlers import router as admin_router
 
 # Настройка логирования
@@ -28,31 +39,9 @@ bot_instance: Bot = None
 async def cleanup_old_data():
     """Очистка старых данных (бронирования старше 30 дней)"""
     try:
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Помечаем старые бронирования как завершённые
-            cutoff = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute('''
-                UPDATE bookings 
-                SET status = 'completed' 
-                WHERE status = 'confirmed' AND end_time < ?
-            ''', (cutoff,))
-            
-            # Удаляем старые слоты доступности
-            cursor.execute('''
-                DELETE FROM spot_availability 
-                WHERE end_time < ? AND is_booked = 0
-            ''', (cutoff,))
-            
-            # Деактивируем старые уведомления
-            cursor.execute('''
-                UPDATE spot_notifications 
-                SET is_active = 0 
-                WHERE desired_date < DATE('now', '-7 days')
-            ''')
-            
-            logger.info("Old data cleanup completed")
+        cutoff = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+        await db.write(db.cleanup_old_data, cutoff)
+        logger.info("Old data cleanup completed")
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
 
@@ -60,109 +49,134 @@ async def cleanup_old_data():
 async def check_pending_bookings():
     """Проверка просроченных бронирований (не оплачены за 24 часа)"""
     try:
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Находим бронирования старше 24 часов в статусе pending
-            cutoff = (datetime.now() - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute('''
-                SELECT b.id, b.availability_id, b.customer_id, b.spot_id,
-                       u.telegram_id as customer_telegram_id,
-                       ps.spot_number
-                FROM bookings b
-                JOIN users u ON b.customer_id = u.id
-                JOIN parking_spots ps ON b.spot_id = ps.id
-                WHERE b.status = 'pending' AND b.created_at < ?
-            ''', (cutoff,))
-            
-            expired_bookings = cursor.fetchall()
-            
-            for booking in expired_bookings:
-                # Отменяем бронирование
-                cursor.execute('''
-                    UPDATE bookings SET status = 'cancelled' WHERE id = ?
-                ''', (booking['id'],))
-                
-                # Освобождаем слот
-                cursor.execute('''
-                    UPDATE spot_availability 
-                    SET is_booked = 0, booked_by = NULL, booking_id = NULL
-                    WHERE id = ?
-                ''', (booking['availability_id'],))
-                
-                # Уведомляем пользователя
-                if bot_instance:
-                    try:
-                        await bot_instance.send_message(
-                            booking['customer_telegram_id'],
-                            f"❌ <b>Бронирование отменено</b>\n\n"
-                            f"Ваше бронирование места {booking['spot_number']} "
-                            f"было автоматически отменено из-за отсутствия оплаты в течение 24 часов.",
-                            parse_mode="HTML"
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to notify about expired booking: {e}")
+        cutoff = (datetime.now() - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
+        # События - после COMMIT, не внутри транзакции записи
+        expired_bookings = await db.write(db.expire_pending_bookings, cutoff)
+        
+        for booking in expired_bookings:
+            await events.publish(bot_instance, events.BookingCancelled(
+                booking['id'], booking['customer_id'], booking['spot_id'], booking['availability_id'], 'expired'))
+            await events.publish(bot_instance, events.SlotFreed(booking['availability_id']))
+        
+        if expired_bookings:
+            logger.info(f"Cancelled {len(expired_bookings)} expired bookings")
             
-            if expired_bookings:
-                logger.info(f"Cancelled {len(expired_bookings)} expired bookings")
-                
     except Exception as e:
         logger.error(f"Pending bookings check error: {e}")
 
 
+@events.subscriber(events.BookingCancelled)
+async def notify_booking_expired(bot, event: events.BookingCancelled):
+    """Жильцу - об отмене неоплаченной брони"""
+    if event.reason != 'expired':
+        return
+    booking = db.get_booking_by_id(event.booking_id)
+    customer = db.get_user_by_id(event.customer_id)
+    if not booking or not customer or not customer['telegram_id']:
+        logger.warning(f"Expired booking {event.booking_id}: booking or customer not found")
+        return
+    try:
+        await bot.send_message(
+            customer['telegram_id'],
+            f"❌ <b>Бронирование отменено</b>\n\n"
+            f"Ваше бронирование места {booking['spot_number']} "
+            f"было автоматически отменено из-за отсутствия оплаты в течение 24 часов.",
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.error(f"Failed to notify about expired booking: {e}")
+
+
 async def send_booking_reminders():
     """Отправка напоминаний о предстоящих бронированиях (за 1 час)"""
     try:
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Находим бронирования, которые начнутся через 1-2 часа
-            now = datetime.now()
-            in_1_hour = (now + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
-            in_2_hours = (now + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
-            
-            cursor.execute('''
-                SELECT b.id, b.start_time, b.end_time, b.total_price,
-                       u.telegram_id as customer_telegram_id,
-                       ps.spot_number,
-                       supplier.full_name as supplier_name
-                FROM bookings b
-                JOIN users u ON b.customer_id = u.id
-                JOIN parking_spots ps ON b.spot_id = ps.id
-                JOIN users supplier ON ps.supplier_id = supplier.id
-                WHERE b.status = 'confirmed' 
-                AND b.start_time BETWEEN ? AND ?
-            ''', (in_1_hour, in_2_hours))
-            
-            upcoming = cursor.fetchall()
-            
-            for booking in upcoming:
-                if bot_instance:
-                    try:
-                        start = datetime.fromisoformat(booking['start_time'])
-                        await bot_instance.send_message(
-                            booking['customer_telegram_id'],
-                            f"⏰ <b>Напоминание!</b>\n\n"
-                            f"Ваше бронирование места {booking['spot_number']} "
-                            f"начнётся через ~1 час ({start.strftime('%H:%M')}).",
-                            parse_mode="HTML"
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to send reminder: {e}")
-                        
+        # Находим бронирования, которые начнутся через 1-2 часа
+        now = datetime.now()
+        in_1_hour = (now + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+        in_2_hours = (now + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
+        upcoming = db.get_upcoming_bookings(in_1_hour, in_2_hours)
+        
+        for booking in upcoming:
+            if bot_instance:
+                try:
+                    start = datetime.fromisoformat(booking['start_time'])
+                    await bot_instance.send_message(
+                        booking['customer_telegram_id'],
+                        f"⏰ <b>Напоминание!</b>\n\n"
+                        f"Ваше бронирование места {booking['spot_number']} "
+                        f"начнётся через ~1 час ({start.strftime('%H:%M')}).",
+                        parse_mode="HTML"
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to send reminder: {e}")
+                    
     except Exception as e:
         logger.error(f"Reminders error: {e}")
 
 
+async def update_rollups():
+    """Досчитать сводки аналитики по данным после прошлого прохода"""
+    try:
+        processed = await db.write(db.run_rollups)
+        if any(processed.values()):
+            logger.info(f"Rollups updated: {processed}")
+    except Exception as e:
+        logger.error(f"Rollups error: {e}")
+
+
+async def extend_rule_slots():
+    """Досоздать слоты расписаний мест на RULE_HORIZON_DAYS вперёд"""
+    try:
+        until = (datetime.now() + timedelta(days=RULE_HORIZON_DAYS)).strftime("%Y-%m-%d")
+        slots = await db.write(db.materialize_rules, until)
+        if slots:
+            logger.info(f"Created {len(slots)} slots from schedules")
+            await events.publish(bot_instance, events.SlotsAdded([slot['id'] for slot in slots]))
+    except Exception as e:
+        logger.error(f"Schedule slots error: {e}")
+
+
+async def expire_slot_offers():
+    """Передать слоты с истёкшим придержанием следующим в очереди"""
+    while True:
+        try:
+            await asyncio.sleep(OFFER_CHECK_SECONDS)
+            for code in db.tenant_codes():
+                with db.use_tenant(code):
+                    offers = await db.write(db.expire_offers)
+                    if offers and bot_instance:
+                        await send_offers(bot_instance, offers)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Slot offers check error: {e}")
+
+
+async def flush_admin_activity():
+    """Записать накопленную активность админов"""
+    try:
+        flushed = await admin_sessions.flush_activity()
+        if flushed:
+            logger.info(f"Admin activity flushed for {flushed} sessions")
+    except Exception as e:
+        logger.error(f"Admin activity flush error: {e}")
+
+
 async def background_tasks():
     """Фоновые задачи"""
     while True:
         try:
             await asyncio.sleep(300)  # Каждые 5 минут
             
-            await cleanup_old_data()
-            await check_pending_bookings()
-            await send_booking_reminders()
+            await flush_admin_activity()
+            # Задачи по данным - в базе каждого ЖК по очереди
+            for code in db.tenant_codes():
+                with db.use_tenant(code):
+                    await cleanup_old_data()
+                    await extend_rule_slots()
+                    await check_pending_bookings()
+                    await update_rollups()
+                    await send_booking_reminders()
             
         except asyncio.CancelledError:
             logger.info("Background tasks cancelled")
@@ -189,12 +203,53 @@ async def on_startup(bot: Bot):
     
     # Запускаем фоновые задачи
     asyncio.create_task(background_tasks())
+    asyncio.create_task(expire_slot_offers())
     logger.info("Background tasks started")
 
 
 async def on_shutdown(bot: Bot):
     """Действия при остановке бота"""
     logger.info("Bot is shutting down...")
+    await flush_admin_activity()
+    # Доработать очереди подписчиков событий - они тоже пишут в базу
+    await events.stop()
+    # Дописать то, что ещё в очередях потоков записи
+    await asyncio.to_thread(db.stop_writers)
+
+
+def create_bot(session=None) -> Bot:
+    """Создать бота"""
+    return Bot(token=BOT_TOKEN, session=session, parse_mode=ParseMode.HTML)
+
+
+def create_dispatcher(recorder: replay.UpdateRecorder = None) -> Dispatcher:
+    """Создать диспетчер с роутерами (один раз на процесс)"""
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    
+    if recorder:
+        # Самым первым: в лог попадает весь входящий поток, включая флуд
+        dp.update.outer_middleware(replay.UpdateRecorderMiddleware(recorder))
+    
+    if METRICS_ENABLED:
+        # Первым, чтобы в задержку апдейта попадали и отброшенные антифлудом
+        dp.update.outer_middleware(metrics.UpdateMetricsMiddleware())
+        metrics.setup_router_metrics(user_router)
+        metrics.setup_router_metrics(admin_router)
+    
+    # Антифлуд - до FSM и хендлеров, чтобы флуд не доходил до БД
+    if THROTTLE_ENABLED:
+        dp.update.outer_middleware(ThrottlingMiddleware())
+    
+    # ЖК автора - до хендлеров и фильтров, которые уже читают его базу
+    if tenants.is_multi_tenant():
+        dp.update.outer_middleware(tenants.TenantMiddleware())
+    
+    # Регистрируем роутеры
+    dp.include_router(user_router)
+    dp.include_router(admin_router)
+    
+    return dp
 
 
 async def main():
@@ -206,26 +261,42 @@ async def main():
         return
     
     # Создаём бота и диспетчер
-    bot = Bot(token=BOT_TOKEN, default={"parse_mode": ParseMode.HTML})
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    
-    # Регистрируем роутеры
-    dp.include_router(user_router)
-    dp.include_router(admin_router)
+    bot = create_bot()
+    recorder = replay.UpdateRecorder(UPDATE_LOG, UPDATE_LOG_SALT) if UPDATE_LOG else None
+    # В многопроцессном режиме апдейты пишет фронт, а не диспетчер
+    dp = create_dispatcher(recorder if WORKER_PROCESSES <= 1 else None)
     
     # Регистрируем хуки
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
+    metrics_runner = None
+    if METRICS_ENABLED:
+        metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+    
     try:
         # Удаляем вебхук если был
         await bot.delete_webhook(drop_pending_updates=True)
         
-        # Запускаем polling
-        logger.info("Starting polling...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if WORKER_PROCESSES > 1:
+            # Фронт: фоновые задачи здесь, апдейты - в процессы-воркеры
+            logger.info(f"Starting polling with {WORKER_PROCESSES} workers...")
+            await on_startup(bot)
+            try:
+                await sharding.run_front(bot, WORKER_PROCESSES,
+                                         allowed_updates=dp.resolve_used_update_types(),
+                                         recorder=recorder)
+            finally:
+                await on_shutdown(bot)
+        else:
+            # Запускаем polling
+            logger.info("Starting polling...")
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if recorder:
+            recorder.close()
         await bot.session.close()
 
 
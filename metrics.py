@@ -0,0 +1,314 @@
+"""
+Метрики ParkingBot: задержки хендлеров и запросов к БД, endpoint /metrics
+
+Формат - текстовый Prometheus. Метрики живут в памяти процесса: в
+многопроцессном режиме у каждого воркера свой endpoint (см. sharding.py).
+"""
+import logging
+import sqlite3
+import sys
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import slow_queries
+from config import METRICS_ENABLED, SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов: секунды для задержек, штуки для строк
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROWS_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [счётчики по бакетам..., +Inf], сумма
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(число наблюдений, сумма) по меткам"""
+        return {labels: (sum(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            label_text = _format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    """Счётчик Prometheus с метками"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], value: float = 1):
+        self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+# ==================== REGISTRY ====================
+
+update_latency = Histogram("parking_update_duration_seconds",
+                           "Update processing time by update type", ("update_type",))
+update_errors = CounterMetric("parking_update_errors_total",
+                              "Updates that raised an exception", ("update_type",))
+handler_latency = Histogram("parking_handler_duration_seconds",
+                            "Handler time by router and handler", ("router", "handler"))
+handler_errors = CounterMetric("parking_handler_errors_total",
+                               "Handler exceptions by router and handler", ("router", "handler"))
+query_latency = Histogram("parking_db_query_duration_seconds",
+                          "SQL execute + fetch time by calling function", ("query",))
+query_rows = Histogram("parking_db_query_rows",
+                       "Rows returned (SELECT) or changed (DML) by calling function", ("query",),
+                       buckets=ROWS_BUCKETS)
+write_batch = Histogram("parking_db_write_batch_size",
+                        "Write operations committed together by the writer thread", ("database",),
+                        buckets=ROWS_BUCKETS)
+event_delay = Histogram("parking_event_delay_seconds",
+                        "Time from event publish to subscriber done", ("subscriber",))
+event_errors = CounterMetric("parking_event_errors_total",
+                             "Event subscriber exceptions", ("subscriber",))
+
+REGISTRY = [update_latency, update_errors, handler_latency, handler_errors, query_latency, query_rows,
+            write_batch, event_delay, event_errors]
+
+
+def _app_counters() -> List[str]:
+    """Счётчики антифлуда и кэша поиска в формате Prometheus"""
+    # Импорт здесь: search_cache -> database -> metrics
+    from search_cache import get_search_cache_stats
+    from throttling import get_throttle_stats
+
+    throttle = get_throttle_stats()
+    search = get_search_cache_stats()
+    lines = ["# HELP parking_throttle_total Updates seen by the flood filter",
+             "# TYPE parking_throttle_total counter"]
+    lines += [f'parking_throttle_total{{result="{key}"}} {throttle[key]}'
+              for key in ("passed", "dropped_user", "dropped_global")]
+    lines += ["# HELP parking_search_cache_total Search cache lookups",
+              "# TYPE parking_search_cache_total counter"]
+    lines += [f'parking_search_cache_total{{result="{key}"}} {search[key]}'
+              for key in ("hits", "misses", "stale")]
+    return lines
+
+
+def render_metrics() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(_app_counters())
+    return "\n".join(lines) + "\n"
+
+
+# ==================== AIOGRAM ====================
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: полное время апдейта по типу"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            update_errors.inc((update_type,))
+            raise
+        finally:
+            update_latency.observe((update_type,), time.perf_counter() - started)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware роутера: время конкретного хендлера"""
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        labels = (self.router_name, name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(labels)
+            raise
+        finally:
+            handler_latency.observe(labels, time.perf_counter() - started)
+
+
+def setup_router_metrics(router):
+    """Повесить HandlerMetricsMiddleware на события роутера"""
+    middleware = HandlerMetricsMiddleware(router.name)
+    router.message.middleware(middleware)
+    router.callback_query.middleware(middleware)
+
+
+# ==================== SQLITE ====================
+
+def _query_label(frame) -> str:
+    """Имя функции, выполнившей запрос
+
+    Обёртки этого модуля и приватные помощники (_fetch_slots) пропускаются -
+    запрос относится к публичной функции, которая их вызвала.
+    """
+    while frame is not None and (frame.f_code.co_filename == __file__
+                                 or frame.f_code.co_name.startswith('_')):
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "unknown"
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, который меряет execute + fetch и считает строки
+
+    Замер закрывается на fetchall/fetchone или сразу для запросов без
+    результата (INSERT/UPDATE/DELETE), иначе - на следующем execute/close.
+    Результат идёт в метрики и, если запрос медленный, в slow_queries.
+    """
+
+    _label: Optional[str] = None
+    _sql = ""
+    _params: Any = None
+    _elapsed = 0.0
+    _rows = 0
+
+    def execute(self, sql, parameters=(), *, label: str = None):
+        self._finish()
+        if sql.startswith('PRAGMA'):
+            # Настройка соединения, а не запрос приложения
+            return super().execute(sql, parameters)
+        self._label = label or _query_label(sys._getframe(1))
+        self._sql, self._params = sql, parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            self._rows = 0
+            if self.description is None:
+                self._rows = max(self.rowcount, 0)
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._label = _query_label(sys._getframe(1))
+        self._sql, self._params = sql, None
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        self._rows += row is not None
+        # Почти всегда fetchone - единственная строка (по id, COUNT)
+        self._finish()
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        if self._label is None:
+            return
+        label, self._label = self._label, None
+        if METRICS_ENABLED:
+            query_latency.observe((label,), self._elapsed)
+            query_rows.observe((label,), self._rows)
+        if SLOW_QUERY_MS > 0 and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_queries.record(label, self._sql, self._params, self._elapsed, self._rows, self.connection)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение, выдающее TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters, label=_query_label(sys._getframe(1)))
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ==================== HTTP ====================
+
+async def start_metrics_server(host: str, port: int):
+    """Поднять /metrics на host:port, вернуть runner для остановки"""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,197 @@
+"""
+Тепловая карта загрузки мест по часам недели
+
+Слоты (предложение) и действующие брони (спрос) за период раскладываются
+по 15-минутным интервалам недели в NumPy целиком: у каждого интервала
+учитываются только концы, без цикла по времени. Карта по всему ЖК
+кэшируется (своя у каждого ЖК) и подсказывает цену при добавлении места.
+"""
+import calendar
+import html
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import database as db
+from config import OCCUPANCY_CACHE_SECONDS, OCCUPANCY_DAYS
+
+BIN_MINUTES = 15
+BIN_SECONDS = BIN_MINUTES * 60
+HOUR_BINS = 60 // BIN_MINUTES
+WEEK_HOURS = 7 * 24
+WEEK_BINS = WEEK_HOURS * HOUR_BINS
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+# Загрузка 0..100% -> символ; "·" - в этот час мест не предлагали
+LEVELS = "░▒▓█"
+
+# Подсказка цены: во сколько раз она может отличаться от средней цены занятых часов
+PRICE_FACTOR_RANGE = (0.8, 1.25)
+
+# ЖК -> {'at', 'value'}
+_complex_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def hourly_coverage(spot_index: np.ndarray, start_bin: np.ndarray, end_bin: np.ndarray,
+                    spots: int) -> np.ndarray:
+    """Сколько 15-минуток каждого часа недели покрыто интервалами [start_bin, end_bin) каждого места
+
+    Номера 15-минуток считаются от понедельника 00:00. Интервал [s, e) покрывает в
+    часе недели h (e // W - s // W) * 4 + f(e % W, h) - f(s % W, h) 15-минуток, где
+    f(x, h) = clip(x - 4h, 0, 4): полные обороты недели - одно число на интервал,
+    f - ступенька, которая записывается двумя точками в массив разностей по часам
+    и накапливается cumsum. Цикла по времени нет, а массивы - в часах, не в 15-минутках.
+    """
+    width = WEEK_HOURS + 1
+    turns = np.bincount(spot_index, weights=end_bin // WEEK_BINS - start_bin // WEEK_BINS, minlength=spots)
+    base = spot_index * width
+    indices, weights = [], []
+    # f(x, .) - f(0, .): -(4 - x % 4) в часе x // 4 и -(x % 4) в следующем (константа 4 у s и e сокращается)
+    for bins, sign in ((end_bin % WEEK_BINS, 1), (start_bin % WEEK_BINS, -1)):
+        hour, rest = np.divmod(bins, HOUR_BINS)
+        indices += [base + hour, base + hour + 1]
+        weights += [-sign * (HOUR_BINS - rest), -sign * rest]
+    steps = np.bincount(np.concatenate(indices), weights=np.concatenate(weights), minlength=spots * width)
+    return np.cumsum(steps.reshape(spots, width)[:, :WEEK_HOURS], axis=1) + HOUR_BINS * turns[:, None]
+
+
+def _parse_intervals(text: str) -> np.ndarray:
+    """"spot_id,начало,конец,..." из базы -> массив (n, 3) одним разбором"""
+    if not text:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.fromstring(text, dtype=np.int64, sep=',').reshape(-1, 3)
+
+
+def _to_bins(data: np.ndarray, spot_ids: np.ndarray, origin: int, lower: int, upper: int):
+    """Строки (spot_id, начало, конец) в секундах -> индекс места и интервалы, обрезанные по периоду"""
+    spot_index = np.searchsorted(spot_ids, data[:, 0])
+    start_bin = np.clip(np.rint((data[:, 1] - origin) / BIN_SECONDS).astype(np.int64), lower, upper)
+    end_bin = np.clip(np.rint((data[:, 2] - origin) / BIN_SECONDS).astype(np.int64), lower, upper)
+    return spot_index, start_bin, end_bin
+
+
+def compute_heatmap(date_from: datetime, date_to: datetime, supplier_id: int = None) -> Dict[str, Any]:
+    """Предложенные и занятые часы по каждому месту и часу недели за [date_from, date_to)
+
+    offered/booked - массивы (мест, 168) в часах; по строкам - места spot_ids.
+    """
+    intervals = [_parse_intervals(text) for text in db.get_occupancy_intervals(
+        date_from.strftime("%Y-%m-%d %H:%M:%S"), date_to.strftime("%Y-%m-%d %H:%M:%S"), supplier_id
+    )]
+    spot_ids = np.unique(np.concatenate([data[:, 0] for data in intervals]))
+
+    # Начало отсчёта - понедельник 00:00 недели date_from, границы периода - в интервалах от него
+    monday = (date_from - timedelta(days=date_from.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    origin = calendar.timegm(monday.timetuple())
+    lower = (calendar.timegm(date_from.timetuple()) - origin) // BIN_SECONDS
+    upper = (calendar.timegm(date_to.timetuple()) - origin) // BIN_SECONDS
+
+    hours = {}
+    for name, data in zip(('offered', 'booked'), intervals):
+        hours[name] = hourly_coverage(*_to_bins(data, spot_ids, origin, lower, upper), len(spot_ids)) / HOUR_BINS
+    return {'spot_ids': spot_ids, 'offered': hours['offered'], 'booked': hours['booked'],
+            'weeks': (upper - lower) / WEEK_BINS}
+
+
+def occupancy(booked: np.ndarray, offered: np.ndarray) -> np.ndarray:
+    """Доля занятых часов; nan - часы без предложения"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(offered > 0, booked / offered, np.nan)
+
+
+def render_grid(booked: np.ndarray, offered: np.ndarray) -> str:
+    """Сетка 7 дней x 24 часа для <pre>: чем плотнее символ, тем выше загрузка"""
+    share = occupancy(booked, offered).reshape(7, 24)
+    lines = ["   0     6     12    18"]
+    for day, row in zip(WEEKDAYS, share):
+        cells = ["·" if np.isnan(value) else LEVELS[min(int(value * len(LEVELS)), len(LEVELS) - 1)]
+                 for value in row]
+        lines.append(f"{day} {''.join(cells)}")
+    lines.append(f"·  нет мест  {' '.join(f'{level} до {(i + 1) * 100 // len(LEVELS)}%' for i, level in enumerate(LEVELS))}")
+    return "\n".join(lines)
+
+
+def busiest_hours(booked: np.ndarray, offered: np.ndarray, count: int = 3) -> List[Tuple[str, float]]:
+    """Часы недели с наибольшей загрузкой: ('Пн 08:00', доля)"""
+    share = occupancy(booked, offered)
+    order = np.argsort(np.nan_to_num(share, nan=-1.0))[::-1][:count]
+    return [(f"{WEEKDAYS[hour // 24]} {hour % 24:02d}:00", float(share[hour]))
+            for hour in order if not np.isnan(share[hour])]
+
+
+def recent_period(days: int = OCCUPANCY_DAYS) -> Tuple[datetime, datetime]:
+    """Последние days суток до начала текущего часа"""
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    return end - timedelta(days=days), end
+
+
+def complex_heatmap() -> Dict[str, Any]:
+    """Карта за OCCUPANCY_DAYS по всему ЖК, обновляется раз в OCCUPANCY_CACHE_SECONDS"""
+    now = time.monotonic()
+    cache = _complex_cache.setdefault(db.get_tenant(), {'at': 0.0, 'value': None})
+    if cache['value'] is None or now - cache['at'] > OCCUPANCY_CACHE_SECONDS:
+        heatmap = compute_heatmap(*recent_period())
+        cache['value'] = {'booked': heatmap['booked'].sum(axis=0),
+                          'offered': heatmap['offered'].sum(axis=0)}
+        cache['at'] = now
+    return cache['value']
+
+
+def suggest_price(start: datetime, end: datetime) -> Optional[Dict[str, Any]]:
+    """Подсказка цены для нового слота: средняя цена занятого часа с поправкой на загрузку его часов
+
+    None - данных для подсказки пока нет.
+    """
+    heatmap = complex_heatmap()
+    date_from, date_to = recent_period()
+    days = db.get_daily_stats(date_from.strftime("%Y-%m-%d"), date_to.strftime("%Y-%m-%d"))
+    revenue = sum(day['revenue'] for day in days)
+    booked_hours = sum(day['booked_hours'] for day in days)
+    total_offered = heatmap['offered'].sum()
+    if booked_hours <= 0 or total_offered <= 0:
+        return None
+
+    # Часы недели, которые покрывает слот (не больше недели)
+    first = start.weekday() * 24 + start.hour
+    count = min(max(int((end - start).total_seconds() // 3600), 1), WEEK_HOURS)
+    hours = (first + np.arange(count)) % WEEK_HOURS
+    offered = heatmap['offered'][hours].sum()
+    slot_share = heatmap['booked'][hours].sum() / offered if offered else 0.0
+    average_share = heatmap['booked'].sum() / total_offered
+
+    factor = slot_share / average_share if average_share else 1.0
+    factor = min(max(factor, PRICE_FACTOR_RANGE[0]), PRICE_FACTOR_RANGE[1])
+    price = max(10, int(round(revenue / booked_hours * factor / 10)) * 10)
+    return {'price': price, 'slot_share': float(slot_share), 'average_share': float(average_share)}
+
+
+def heatmap_report(title: str, date_from: datetime, date_to: datetime, supplier_id: int = None) -> str:
+    """HTML-отчёт: сетка загрузки по часам недели, пиковые часы и места (для поставщика - его места)"""
+    heatmap = compute_heatmap(date_from, date_to, supplier_id)
+    booked, offered = heatmap['booked'].sum(axis=0), heatmap['offered'].sum(axis=0)
+    period = f"{date_from.strftime('%d.%m.%Y')}–{(date_to - timedelta(seconds=1)).strftime('%d.%m.%Y')}"
+    if not offered.any():
+        return f"🗓 <b>{title}</b>\n{period}\n\nЗа этот период мест не предлагали."
+
+    text = (
+        f"🗓 <b>{title}</b>\n{period}\n"
+        f"Занято {booked.sum():.0f} ч из {offered.sum():.0f} ч ({booked.sum() / offered.sum() * 100:.0f}%)\n\n"
+        f"<pre>{render_grid(booked, offered)}</pre>\n"
+    )
+    peaks = busiest_hours(booked, offered)
+    if peaks:
+        text += "\n🔥 Пиковые часы: " + ", ".join(f"{hour} ({share * 100:.0f}%)" for hour, share in peaks) + "\n"
+
+    # Места с наибольшей загрузкой за период (если мест больше одного)
+    if len(heatmap['spot_ids']) > 1:
+        spot_booked, spot_offered = heatmap['booked'].sum(axis=1), heatmap['offered'].sum(axis=1)
+        share = occupancy(spot_booked, spot_offered)
+        # При равной доле выше то место, где занятых часов больше
+        order = np.lexsort((spot_booked, np.nan_to_num(share, nan=-1.0)))[::-1][:5]
+        text += "\n🏆 <b>Самые загруженные места:</b>\n"
+        for i, index in enumerate(order, 1):
+            spot = db.get_spot_by_id(int(heatmap['spot_ids'][index]))
+            number = html.escape(spot['spot_number']) if spot else f"#{heatmap['spot_ids'][index]}"
+            text += f"{i}. {number} — {share[index] * 100:.0f}% ({spot_booked[index]:.0f} из {spot_offered[index]:.0f} ч)\n"
+    return text
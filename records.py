@@ -0,0 +1,186 @@
+"""
+Строки выборок ParkingBot
+
+Record хранит значения строки кортежем, а имена колонок - в одной раскладке
+{имя: номер} на все строки с таким набором колонок: строка не несёт свой
+словарь, как dict(sqlite3.Row). Доступ как у словаря (row['id'], get, keys,
+items, dict(row)), по атрибуту (row.id) и, как у sqlite3.Row, по номеру
+колонки (row[0]) с распаковкой значений. Строки только для чтения: результаты
+кэшируются и отдаются разным хендлерам.
+"""
+import sqlite3
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Набор колонок -> раскладка; наборов столько, сколько разных запросов
+_layouts: Dict[Tuple[str, ...], Dict[str, int]] = {}
+# Описание колонок последней выборки и его раскладка - cursor.description
+# один объект на все строки выборки, поэтому обычно хватает проверки `is`
+_last: Tuple[Any, Optional[Dict[str, int]]] = (None, None)
+
+
+def _layout(description) -> Dict[str, int]:
+    global _last
+    last = _last
+    if last[0] is description:
+        return last[1]
+    names = tuple(column[0] for column in description)
+    layout = _layouts.get(names)
+    if layout is None:
+        # При повторе имени (as_s.*, u.telegram_id) побеждает последняя колонка, как в dict(row)
+        layout = _layouts.setdefault(names, {name: index for index, name in enumerate(names)})
+    _last = (description, layout)
+    return layout
+
+
+class Record:
+    """Строка выборки с доступом по имени колонки"""
+
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, layout: Dict[str, int], values: tuple):
+        self._layout = layout
+        self._values = values
+
+    @classmethod
+    def factory(cls, cursor: sqlite3.Cursor, values: tuple) -> "Record":
+        """row_factory для sqlite3"""
+        return cls(_layout(cursor.description), values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._layout[key]]
+        return self._values[key]
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[self._layout[name]]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        index = self._layout.get(key)
+        return default if index is None else self._values[index]
+
+    def keys(self):
+        return self._layout.keys()
+
+    def values(self) -> Iterator[Any]:
+        return (self._values[index] for index in self._layout.values())
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return ((name, self._values[index]) for name, index in self._layout.items())
+
+    def __contains__(self, key) -> bool:
+        return key in self._layout
+
+    def __iter__(self) -> Iterator[Any]:
+        # Как sqlite3.Row: значения по порядку колонок (a, b = row; tuple(row))
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Record):
+            return dict(self.items()) == dict(other.items())
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return self.__class__, (self._layout, self._values)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.items())
+        return f"{self.__class__.__name__}({fields})"
+
+
+# Записи по таблицам: колонки - для подсказок типов, выборки с JOIN добавляют свои
+
+class User(Record):
+    """Пользователь (users)"""
+    __slots__ = ()
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    full_name: str
+    phone: str
+    card_number: str
+    bank: str
+    role: str
+    is_active: int
+    balance: float
+    created_at: str
+
+
+class Spot(Record):
+    """Парковочное место (parking_spots)"""
+    __slots__ = ()
+    id: int
+    supplier_id: int
+    spot_number: str
+    address: Optional[str]
+    description: Optional[str]
+    price_per_hour: float
+    is_partial_allowed: int
+    is_available: int
+    created_at: str
+
+
+class Availability(Record):
+    """Слот доступности места (spot_availability)"""
+    __slots__ = ()
+    id: int
+    spot_id: int
+    start_time: str
+    end_time: str
+    is_booked: int
+    booked_by: Optional[int]
+    booking_id: Optional[int]
+    rule_id: Optional[int]
+
+
+class Booking(Record):
+    """Бронирование (bookings)"""
+    __slots__ = ()
+    id: int
+    customer_id: int
+    spot_id: int
+    availability_id: int
+    start_time: str
+    end_time: str
+    total_price: float
+    status: str
+    payment_status: str
+    payment_method: Optional[str]
+    created_at: str
+
+
+class Notification(Record):
+    """Подписка на появление места (spot_notifications)"""
+    __slots__ = ()
+    id: int
+    user_id: int
+    spot_id: Optional[int]
+    desired_date: str
+    start_time: str
+    end_time: str
+    notify_any: int
+    is_active: int
+    created_at: str
+
+
+class Offer(Record):
+    """Предложение слота подписчику (slot_offers)"""
+    __slots__ = ()
+    id: int
+    availability_id: int
+    notification_id: int
+    user_id: int
+    status: str
+    expires_at: str
+    created_at: str
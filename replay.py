@@ -0,0 +1,229 @@
+"""
+Запись и воспроизведение потока апдейтов ParkingBot
+
+При заданном UPDATE_LOG каждый входящий апдейт дописывается в лог одной
+JSON-строкой: время прихода, анонимный id пользователя и текст сообщения
+(приведённый к форме) или callback_data. Воспроизведение -
+python benchmarks.py replay: тот же поток через диспетчер на копии снимка
+базы в реальном темпе, ускоренно или без пауз.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import ReplyKeyboardMarkup, TelegramObject, Update
+
+from utils import luhn_check
+
+logger = logging.getLogger(__name__)
+
+# Цифр в числе (с пробелами, скобками, дефисами), начиная с которых оно личное: телефон, карта
+PERSONAL_DIGITS = 10
+_NUMBER_RE = re.compile(r'\+?\d[\d\s\-()]*\d')
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+
+def anon_id(user_id: int, salt: bytes) -> int:
+    """Анонимный id: стабилен при одном ключе, остаток по модулю для шардов сохраняет смысл"""
+    digest = hmac.new(salt, str(user_id).encode(), hashlib.sha256).hexdigest()
+    return int(digest[:10], 16) + 1
+
+
+def _ui_texts() -> frozenset:
+    """Тексты кнопок reply-клавиатур - по ним хендлеры узнают команды, их не скрываем"""
+    import keyboards
+
+    return frozenset(
+        button.text
+        for value in vars(keyboards).values() if isinstance(value, ReplyKeyboardMarkup)
+        for row in value.keyboard for button in row
+    )
+
+
+def _redact_number(match: re.Match) -> str:
+    """Длинное число -> нули с той же разметкой; телефон и карта остаются валидными"""
+    text = match.group()
+    digits = [c for c in text if c.isdigit()]
+    if len(digits) < PERSONAL_DIGITS:
+        return text
+    # Код страны/оператора (8 9.., +7 9..) оставляем - иначе телефон не пройдёт проверку
+    keep = 2 if len(digits) == 11 else 1
+    redacted = digits[:keep] + ['0'] * (len(digits) - keep)
+    if len(digits) == 16 and luhn_check("".join(digits)):
+        for check in "0123456789":
+            if luhn_check("".join(redacted[:-1]) + check):
+                redacted[-1] = check
+                break
+    replacement = iter(redacted)
+    return "".join(next(replacement) if c.isdigit() else c for c in text)
+
+
+def redact_text(text: str, ui_texts: frozenset) -> str:
+    """Текст сообщения -> форма: буквы заменены, длинные числа обнулены, кнопки и команды как есть"""
+    if text in ui_texts:
+        return text
+    command = ""
+    if text.startswith("/"):
+        command, separator, text = text.partition(" ")
+        command += separator
+    text = _NUMBER_RE.sub(_redact_number, text)
+    return command + _LETTER_RE.sub(lambda m: "X" if m.group().isupper() else "x", text)
+
+
+class UpdateRecorder:
+    """Дописывает апдейты в лог (append-only, одна JSON-строка на апдейт)"""
+
+    def __init__(self, path: str, salt: str = ""):
+        if not salt:
+            logger.warning("UPDATE_LOG_SALT is not set: ids in the update log will not match any snapshot")
+        self.salt = salt.encode() if salt else secrets.token_bytes(16)
+        self.recorded = 0
+        self._ui_texts = _ui_texts()
+        # Построчная буферизация: запись не теряется при падении процесса
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def record(self, update: Update):
+        entry = self.encode(update)
+        if entry is None:
+            return
+        try:
+            self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.recorded += 1
+        except OSError as e:
+            logger.error(f"Failed to write update log: {e}")
+
+    def encode(self, update: Update) -> Optional[Dict[str, Any]]:
+        """Запись лога для апдейта (None - тип, который бот не обрабатывает)"""
+        entry: Dict[str, Any] = {"ts": round(time.time(), 3)}
+        if update.message and update.message.from_user:
+            entry["u"] = anon_id(update.message.from_user.id, self.salt)
+            entry["m"] = redact_text(update.message.text or "", self._ui_texts)
+        elif update.callback_query:
+            entry["u"] = anon_id(update.callback_query.from_user.id, self.salt)
+            entry["c"] = update.callback_query.data or ""
+        else:
+            return None
+        return entry
+
+    def close(self):
+        self._file.close()
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: пишет апдейт в лог до антифлуда и хендлеров"""
+
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            self.recorder.record(event)
+        return await handler(event, data)
+
+
+# ==================== REPLAY ====================
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def prepare_snapshot(snapshot: str, target: str, salt: str = ""):
+    """Копия снимка базы для прогона; с ключом - telegram_id заменены на анонимные, как в логе"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    source, copy = sqlite3.connect(snapshot), sqlite3.connect(target)
+    try:
+        source.backup(copy)
+        if salt:
+            # NULL у импортированных жильцов, ещё не заходивших в бот, остаётся NULL
+            copy.create_function("anon_id", 1, lambda value: None if value is None else anon_id(value, salt.encode()),
+                                 deterministic=True)
+            with copy:
+                copy.execute('UPDATE users SET telegram_id = anon_id(telegram_id)')
+                copy.execute('UPDATE admin_sessions SET telegram_id = anon_id(telegram_id)')
+    finally:
+        source.close()
+        copy.close()
+
+
+async def replay_updates(path: str, speed: Optional[float], max_gap: float,
+                         latency: float = 0.0) -> Dict[str, Any]:
+    """Подать лог в диспетчер (speed=None - без пауз), вернуть сырые замеры
+
+    DATABASE_PATH должен указывать на подготовленную копию до импорта модулей бота.
+    """
+    import random
+    from collections import defaultdict
+
+    import events
+    import metrics
+    from admin_handlers import router as admin_router
+    from fake_bot import create_fake_bot, make_callback_update, make_message_update
+    from loadtest import HandlerTimingMiddleware, LoadDriver
+    from main import create_dispatcher
+    from sharding import UserSerializer
+    from user_handlers import router as user_router
+
+    timings = defaultdict(list)
+    for router in (user_router, admin_router):
+        middleware = HandlerTimingMiddleware(router.name, timings)
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
+
+    dp = create_dispatcher()
+    bot = create_fake_bot(latency)
+    driver = LoadDriver(dp, bot, 0, random.Random(0))
+    serializer = UserSerializer()
+    loop = asyncio.get_running_loop()
+
+    started = loop.time()
+    offset, previous_ts = 0.0, None
+    for entry in read_log(path):
+        # Паузы дольше max_gap (ночь, перезапуск бота) сжимаются
+        if previous_ts is not None:
+            offset += min(max(entry["ts"] - previous_ts, 0), max_gap)
+        previous_ts = entry["ts"]
+        if speed:
+            delay = started + offset / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if "c" in entry:
+            update = make_callback_update(entry["u"], entry["c"], bot)
+        else:
+            update = make_message_update(entry["u"], entry["m"], bot)
+        # Апдейты одного пользователя - по порядку, как в воркерах sharding.py
+        await serializer.submit(entry["u"], lambda u=update: driver.feed(u))
+
+    await serializer.drain()
+    seconds = loop.time() - started
+    await events.drain()
+    await bot.session.close()
+
+    return {
+        "seconds": seconds,
+        "log_seconds": offset,
+        "update_timings": driver.update_timings,
+        "handler_timings": dict(timings),
+        "query_totals": {labels[0]: totals for labels, totals in metrics.query_latency.totals().items()},
+        "errors": dict(driver.errors),
+        "lock_errors": driver.lock_errors,
+    }
@@ -0,0 +1,113 @@
+"""
+Кэш результатов поиска ParkingBot
+
+Ключ - ЖК, дата и фильтры поиска. Запись помнит версию даты из slot_versions
+на момент запроса: любая запись слотов этой даты поднимает версию в своей
+транзакции, и следующий поиск идёт мимо кэша. Версия читается до запроса,
+поэтому в кэш никогда не попадает результат старше своей версии.
+
+Закончившиеся слоты выпадают из поиска без записи в базу (условие
+end_time > datetime("now")), поэтому запись помнит и самый ранний конец
+своих слотов: после него она устарела, как при смене версии.
+"""
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Optional
+
+import database as db
+from records import Availability
+from config import SEARCH_CACHE_SIZE
+
+# Счётчики кэша процесса: hits, misses, stale (версия даты устарела или слот закончился)
+stats: Counter = Counter()
+
+
+class SearchCache:
+    """LRU-кэш результатов с версией на запись"""
+
+    def __init__(self, max_size: int = SEARCH_CACHE_SIZE):
+        self.max_size = max_size
+        # key -> (версия, результат, самый ранний конец слота результата)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """Результат для key, если он посчитан на этой версии и его слоты не закончились"""
+        entry = self._entries.get(key)
+        if entry is None:
+            stats['misses'] += 1
+            return None
+        if entry[0] != version or (entry[2] is not None and entry[2] <= _db_now()):
+            stats['stale'] += 1
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        stats['hits'] += 1
+        return entry[1]
+
+    def put(self, key: Hashable, version: int, value: Any, expires_at: str = None):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (version, value, expires_at)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+def _db_now() -> str:
+    # Время datetime("now") SQLite (UTC) - с ним сравнивает end_time поиск
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+_cache = SearchCache()
+
+
+def get_available_slots(date_str: str, start_time: str = None, end_time: str = None,
+                        limit: int = None, after: tuple = None, before: tuple = None,
+                        max_price: float = None, sort: str = 'time',
+                        wait_from: str = None) -> List[Availability]:
+    """db.get_available_slots через кэш (аргументы те же, дата обязательна)"""
+    if _cache.max_size <= 0:
+        return db.get_available_slots(date_str, start_time, end_time, limit, after, before,
+                                      max_price, sort, wait_from)
+
+    # wait_from влияет только на порядок 'wait'
+    key = ('slots', db.get_tenant(), date_str, start_time, end_time, limit, after, before, max_price, sort,
+           wait_from if sort == 'wait' else None)
+    version = db.get_slot_version(date_str)
+    rows = _cache.get(key, version)
+    if rows is None:
+        rows = db.get_available_slots(date_str, start_time, end_time, limit, after, before,
+                                      max_price, sort, wait_from)
+        _cache.put(key, version, rows, min((row['end_time'] for row in rows), default=None))
+    # Строки только для чтения (records.Record) - копируется только список
+    return list(rows)
+
+
+def count_available_slots(date_str: str, start_time: str = None, end_time: str = None,
+                          max_price: float = None) -> int:
+    """db.count_available_slots через кэш"""
+    if _cache.max_size <= 0:
+        return db.count_available_slots(date_str, start_time, end_time, max_price)
+
+    key = ('count', db.get_tenant(), date_str, start_time, end_time, max_price)
+    version = db.get_slot_version(date_str)
+    count = _cache.get(key, version)
+    if count is None:
+        count, first_end = db.count_available_slots_until(date_str, start_time, end_time, max_price)
+        _cache.put(key, version, count, first_end)
+    return count
+
+
+def get_search_cache_stats() -> Dict[str, Any]:
+    """Счётчики кэша поиска"""
+    lookups = stats['hits'] + stats['misses'] + stats['stale']
+    return {
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'stale': stats['stale'],
+        'size': len(_cache),
+        'hit_rate': round(stats['hits'] / lookups * 100, 1) if lookups else 0.0,
+    }
@@ -0,0 +1,247 @@
+"""
+Многопроцессный режим ParkingBot: фронт раскладывает апдейты по воркерам
+
+Апдейт уходит в воркер по from_user.id, поэтому все апдейты одного
+пользователя обрабатываются одним процессом по порядку, а его FSM-состояние
+живёт в MemoryStorage этого процесса.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import Update
+
+import metrics
+from config import (
+    LOG_LEVEL, LOG_FORMAT, WORKER_QUEUE_SIZE, WORKER_CONCURRENCY, WORKER_BACKLOG,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_user_id(update: Update) -> Optional[int]:
+    """Telegram id автора апдейта (None для апдейтов без пользователя)"""
+    try:
+        user = getattr(update.event, 'from_user', None)
+    except LookupError:
+        return None
+    return user.id if user else None
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    """Номер воркера для пользователя"""
+    if user_id is None:
+        return 0
+    return user_id % workers
+
+
+class UserSerializer:
+    """Запускает задачи параллельно, но задачи одного пользователя - строго по очереди
+
+    Место среди concurrency выполняемых задача занимает, только дождавшись
+    предыдущей задачи своего пользователя: очередь одного пользователя не
+    занимает места других. Принятых и не законченных задач - не больше backlog.
+    """
+
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY, backlog: int = WORKER_BACKLOG):
+        self._tails: Dict[Any, asyncio.Task] = {}
+        self._running = asyncio.Semaphore(concurrency)
+        self._backlog = asyncio.Semaphore(max(backlog, concurrency))
+
+    async def submit(self, key: Any, job: Callable[[], Awaitable[Any]]):
+        """Поставить задачу (ждёт, если у воркера уже WORKER_BACKLOG незаконченных задач)"""
+        await self._backlog.acquire()
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(previous, job))
+        self._tails[key] = task
+        task.add_done_callback(lambda t: self._release(key, t))
+
+    async def drain(self):
+        """Дождаться всех поставленных задач"""
+        while self._tails:
+            await asyncio.gather(*self._tails.values(), return_exceptions=True)
+
+    async def _run(self, previous: Optional[asyncio.Task], job: Callable[[], Awaitable[Any]]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self._running:
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Update processing error: {e}")
+
+    def _release(self, key: Any, task: asyncio.Task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        self._backlog.release()
+
+
+# ==================== WORKER ====================
+
+def _worker_main(index: int, updates: multiprocessing.Queue, results: multiprocessing.Queue,
+                 fake_latency: Optional[float] = None):
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
+    asyncio.run(_worker_loop(index, updates, results, fake_latency))
+
+
+async def _worker_loop(index: int, updates: multiprocessing.Queue, results: multiprocessing.Queue,
+                       fake_latency: Optional[float]):
+    # Импорт здесь: воркер стартует через spawn и собирает свой диспетчер
+    from main import create_bot, create_dispatcher
+    import admin_sessions
+    import database as db
+    import events
+
+    if fake_latency is not None:
+        from fake_bot import create_fake_bot
+        bot = create_fake_bot(fake_latency)
+    else:
+        bot = create_bot()
+    dp = create_dispatcher()
+    
+    metrics_runner = None
+    if METRICS_ENABLED:
+        # Метрики в памяти воркера - у каждого свой порт после фронта
+        metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT + 1 + index)
+    results.put(("ready", index))
+
+    loop = asyncio.get_running_loop()
+    reader = ThreadPoolExecutor(max_workers=1)
+    serializer = UserSerializer()
+    processed = 0
+
+    logger.info(f"Worker {index} started")
+    try:
+        while True:
+            payload = await loop.run_in_executor(reader, updates.get)
+            if payload is None:
+                break
+
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            await serializer.submit(get_update_user_id(update),
+                                    lambda u=update: dp.feed_update(bot, u))
+            processed += 1
+
+        await serializer.drain()
+    finally:
+        # Сессии админов этого воркера живут в его памяти - активность пишет он сам
+        await admin_sessions.flush_activity()
+        # События его хендлеров разбирают его подписчики
+        await events.stop()
+        # И дописывает то, что осталось в очереди его потока записи
+        db.stop_writers()
+        results.put(("done", index, processed))
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        reader.shutdown(wait=False)
+        logger.info(f"Worker {index} stopped, processed {processed} updates")
+
+
+# ==================== FRONT ====================
+
+class ShardRouter:
+    """Фронт: держит процессы-воркеры и раскладывает им апдейты"""
+
+    def __init__(self, workers: int, queue_size: int = WORKER_QUEUE_SIZE,
+                 fake_latency: Optional[float] = None):
+        ctx = multiprocessing.get_context("spawn")
+        self._queues = [ctx.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._results = ctx.Queue()
+        self._processes = [
+            ctx.Process(
+                target=_worker_main,
+                args=(i, q, self._results, fake_latency),
+                name=f"parking-worker-{i}",
+                daemon=True
+            )
+            for i, q in enumerate(self._queues)
+        ]
+        # Блокирующий put в переполненную очередь не должен останавливать event loop
+        self._writer = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def workers(self) -> int:
+        return len(self._queues)
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+        logger.info(f"Started {self.workers} worker processes")
+
+    async def wait_ready(self, timeout: float = 60):
+        """Дождаться, пока все воркеры поднимут диспетчер"""
+        loop = asyncio.get_running_loop()
+        for _ in self._processes:
+            await loop.run_in_executor(None, self._results.get, True, timeout)
+
+    async def dispatch(self, update: Update):
+        """Отправить апдейт в воркер его пользователя"""
+        target = self._queues[shard_for(get_update_user_id(update), self.workers)]
+        payload = update.model_dump_json(exclude_unset=True)
+        try:
+            target.put_nowait(payload)
+        except queue.Full:
+            # Воркер не успевает - ждём места, сохраняя порядок апдейтов
+            await asyncio.get_running_loop().run_in_executor(self._writer, target.put, payload)
+
+    async def stop(self, timeout: float = 60) -> Dict[int, int]:
+        """Остановить воркеры после обработки очереди, вернуть число апдейтов по воркерам"""
+        loop = asyncio.get_running_loop()
+        for q in self._queues:
+            await loop.run_in_executor(self._writer, q.put, None)
+
+        processed = {}
+        while len(processed) < self.workers:
+            try:
+                message = await loop.run_in_executor(None, self._results.get, True, timeout)
+            except queue.Empty:
+                logger.error("Worker did not report on shutdown")
+                break
+            if message[0] == "done":
+                _, index, count = message
+                processed[index] = count
+
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._writer.shutdown(wait=False)
+        return processed
+
+
+async def run_front(bot: Bot, workers: int, allowed_updates: List[str] = None,
+                    polling_timeout: int = 30, recorder=None):
+    """Long polling во фронт-процессе с раздачей апдейтов воркерам
+
+    recorder (replay.UpdateRecorder) пишет весь поток до раздачи.
+    """
+    shards = ShardRouter(workers)
+    shards.start()
+
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=polling_timeout,
+                                                allowed_updates=allowed_updates)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to fetch updates: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            for update in updates:
+                if recorder:
+                    recorder.record(update)
+                await shards.dispatch(update)
+                offset = update.update_id + 1
+    finally:
+        await shards.stop()
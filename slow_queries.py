@@ -0,0 +1,126 @@
+"""
+Лог медленных запросов ParkingBot
+
+Запрос дольше SLOW_QUERY_MS пишется в ротируемый лог вместе с формой
+параметров и EXPLAIN QUERY PLAN, а повторы сводятся в агрегат по функции
+и тексту запроса - его показывает админская команда /slow.
+"""
+import logging
+import re
+import sqlite3
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import SLOW_QUERY_LOG, SLOW_QUERY_LOG_BYTES, SLOW_QUERY_LOG_BACKUPS
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных запросов помнить (дальше новые только пишутся в лог)
+MAX_TRACKED_QUERIES = 500
+# План повторного нарушителя перечитывается не чаще раза в столько секунд
+PLAN_REFRESH_SECONDS = 300
+
+# (функция, нормализованный SQL) -> агрегат
+_offenders: Dict[tuple, Dict[str, Any]] = {}
+_log: Optional[logging.Logger] = None
+
+
+def _get_log() -> logging.Logger:
+    """Отдельный логгер с ротацией - не смешивается с логом бота"""
+    global _log
+    if _log is None:
+        _log = logging.getLogger("parking.slow_queries")
+        _log.propagate = False
+        handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                      backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _log.addHandler(handler)
+        _log.setLevel(logging.INFO)
+    return _log
+
+
+def _normalize(sql: str) -> str:
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def param_shape(params: Any) -> str:
+    """Типы параметров без значений (в логе не должно быть телефонов и карт)"""
+    if params is None:
+        return "[executemany]"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    return type(params).__name__
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Any) -> List[str]:
+    """EXPLAIN QUERY PLAN запроса с отступами по дереву плана"""
+    if params is None:
+        return ["<executemany: plan not captured>"]
+    try:
+        # Обычный курсор: план не должен сам попасть в замеры
+        rows = sqlite3.Connection.cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f"<no plan: {e}>"]
+
+    depth = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def has_full_scan(plan: Sequence[str]) -> bool:
+    """Есть ли в плане полный проход по таблице"""
+    return any(line.strip().startswith("SCAN ") and "COVERING INDEX" not in line for line in plan)
+
+
+def record(label: str, sql: str, params: Any, elapsed: float, rows: int,
+           conn: sqlite3.Connection):
+    """Учесть медленный запрос: агрегат + запись в лог"""
+    normalized = _normalize(sql)
+    key = (label, normalized)
+    now = time.time()
+    entry = _offenders.get(key)
+
+    if entry is None or now - entry['plan_at'] > PLAN_REFRESH_SECONDS:
+        plan = explain(conn, sql, params)
+        plan_at = now
+    else:
+        plan, plan_at = entry['plan'], entry['plan_at']
+
+    if entry is None and len(_offenders) < MAX_TRACKED_QUERIES:
+        entry = _offenders[key] = {
+            'function': label, 'sql': normalized, 'count': 0,
+            'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+        }
+    if entry is not None:
+        entry['count'] += 1
+        entry['total_ms'] += elapsed * 1000
+        entry['max_ms'] = max(entry['max_ms'], elapsed * 1000)
+        entry['rows'] = rows
+        entry['params'] = param_shape(params)
+        entry['plan'], entry['plan_at'] = plan, plan_at
+        entry['full_scan'] = has_full_scan(plan)
+
+    try:
+        lines = [f"{elapsed * 1000:.1f} ms {label} rows={rows} params={param_shape(params)}",
+                 f"  SQL: {normalized}"]
+        lines.extend(f"  PLAN: {line}" for line in plan)
+        _get_log().info("\n".join(lines))
+    except OSError as e:
+        logger.error(f"Failed to write slow query log: {e}")
+
+
+def get_top_slow_queries(limit: int = 10) -> List[Dict[str, Any]]:
+    """Самые дорогие запросы по суммарному времени"""
+    entries = sorted(_offenders.values(), key=lambda e: e['total_ms'], reverse=True)
+    return [dict(entry, avg_ms=entry['total_ms'] / entry['count']) for entry in entries[:limit]]
+
+
+def reset():
+    """Очистить агрегат (лог на диске остаётся)"""
+    _offenders.clear()
@@ -0,0 +1,82 @@
+"""
+Несколько ЖК в одном боте ParkingBot
+
+У каждого ЖК своя база (config.TENANTS): запись в одном доме не держит
+блокировку для других. ЖК жильца хранится в общем справочнике
+(database.get_user_tenant) и кэшируется в памяти процесса; middleware
+ставит его текущим на время апдейта, и все запросы хендлеров идут в базу
+этого ЖК. В многопроцессном режиме жилец всегда попадает в один воркер,
+поэтому кэш воркера не расходится со справочником.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import database as db
+from config import TENANT_CACHE_USERS
+
+logger = logging.getLogger(__name__)
+
+
+class TenantDirectory:
+    """telegram_id -> код ЖК: справочник в базе и LRU в памяти"""
+
+    def __init__(self, max_users: int = TENANT_CACHE_USERS):
+        self.max_users = max_users
+        self._tenants: "OrderedDict[int, Optional[str]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def get(self, telegram_id: int) -> Optional[str]:
+        """ЖК жильца (None - ещё не выбирал)"""
+        if telegram_id in self._tenants:
+            self._tenants.move_to_end(telegram_id)
+            return self._tenants[telegram_id]
+        code = db.get_user_tenant(telegram_id)
+        self._remember(telegram_id, code)
+        return code
+
+    async def assign(self, telegram_id: int, code: str):
+        """Выбор ЖК при регистрации"""
+        # Справочник пишется своим соединением с COMMIT - не в цикле событий
+        await asyncio.to_thread(db.set_user_tenant, telegram_id, code)
+        self._remember(telegram_id, code)
+
+    def _remember(self, telegram_id: int, code: Optional[str]):
+        self._tenants[telegram_id] = code
+        self._tenants.move_to_end(telegram_id)
+        if len(self._tenants) > self.max_users:
+            self._tenants.popitem(last=False)
+
+
+directory = TenantDirectory()
+
+
+def is_multi_tenant() -> bool:
+    return len(db.tenant_codes()) > 1
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Делает ЖК автора апдейта текущим для всех запросов к базе
+
+    Жилец, ещё не выбравший ЖК, попадает в первый из TENANTS: там он не
+    найден и /start предлагает выбрать свой.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        code = directory.get(user.id) if user is not None else None
+        if code is None:
+            return await handler(event, data)
+        with db.use_tenant(code):
+            return await handler(event, data)
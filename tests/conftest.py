@@ -0,0 +1,49 @@
+"""
+Общие фикстуры тестов ParkingBot
+
+Тесты работают с временным файлом базы: DATABASE_PATH задаётся до импорта
+config и database. Фикстура fresh_db пересоздаёт базу перед тестом.
+"""
+import os
+import sys
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="parkingbot-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_TMP_DIR, "parking.db")
+os.environ["SLOW_QUERY_LOG"] = os.path.join(_TMP_DIR, "slow_queries.log")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("THROTTLE_ENABLED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as db
+from config import BANKS, DATABASE_PATH
+
+
+@pytest.fixture
+def fresh_db():
+    """Пустая база со схемой; после теста потоки записи останавливаются"""
+    db.close_connections()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
+    db.init_database()
+    yield db
+    db.close_connections()
+
+
+@pytest.fixture
+def residents(fresh_db):
+    """Три жильца: id 1 - поставщик, 2 и 3 - клиенты"""
+    return [db.create_user(telegram_id, f"user{telegram_id}", f"Жилец {telegram_id}",
+                           f"89160000{telegram_id:03d}", "2200000000000012", BANKS[0])
+            for telegram_id in (1, 2, 3)]
+
+
+@pytest.fixture
+def tomorrow() -> datetime:
+    """Завтра 10:00 - начало слотов тестов"""
+    return (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
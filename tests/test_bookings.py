@@ -0,0 +1,88 @@
+"""Бронирование: слот занимается одной бронью, отмена - только действующей"""
+from datetime import timedelta
+
+import pytest
+
+import database as db
+
+
+@pytest.fixture
+def slot(residents, tomorrow):
+    """Свободный слот поставщика: (spot_id, availability_id, начало, конец)"""
+    spot_id = db.create_parking_spot(residents[0], "A1", 100)
+    end = tomorrow + timedelta(hours=2)
+    return spot_id, db.create_spot_availability(spot_id, tomorrow, end), tomorrow, end
+
+
+def book(customer_id, slot):
+    spot_id, availability_id, start, end = slot
+    return db.create_booking(customer_id, spot_id, availability_id, start, end, 200)
+
+
+@db.writes
+def _hold(availability_id, user_id):
+    with db.get_connection() as conn:
+        conn.execute('UPDATE spot_availability SET held_by = ? WHERE id = ?', (user_id, availability_id))
+
+
+def test_booking_takes_slot(residents, slot):
+    booking_id = book(residents[1], slot)
+
+    assert db.get_booking_by_id(booking_id)['status'] == 'pending'
+    availability = db.get_availability_by_id(slot[1])
+    assert availability['is_booked'] == 1
+    assert availability['booking_id'] == booking_id
+
+
+def test_taken_slot_cannot_be_booked(residents, slot):
+    assert book(residents[1], slot) is not None
+    assert book(residents[2], slot) is None
+
+
+def test_cancel_frees_slot(residents, slot):
+    booking_id = book(residents[1], slot)
+
+    cancelled = db.cancel_booking(booking_id)
+
+    assert cancelled['id'] == booking_id
+    assert cancelled['status'] == 'cancelled'
+    availability = db.get_availability_by_id(slot[1])
+    assert availability['is_booked'] == 0
+    assert availability['booking_id'] is None
+
+
+@pytest.mark.parametrize("has_returning", [True, False])
+def test_recancel_keeps_rebooked_slot(residents, slot, monkeypatch, has_returning):
+    monkeypatch.setattr(db, "HAS_RETURNING", has_returning)
+    first = book(residents[1], slot)
+    assert db.cancel_booking(first) is not None
+    second = book(residents[2], slot)
+
+    # Повторная отмена первой брони не освобождает слот второй
+    assert db.cancel_booking(first) is None
+    availability = db.get_availability_by_id(slot[1])
+    assert availability['is_booked'] == 1
+    assert availability['booking_id'] == second
+    assert db.get_booking_by_id(second)['status'] == 'pending'
+
+
+def test_cancel_unknown_booking(residents):
+    assert db.cancel_booking(12345) is None
+
+
+def test_held_slot_only_for_holder(residents, slot):
+    _hold(slot[1], residents[2])
+
+    assert book(residents[1], slot) is None
+    assert book(residents[2], slot) is not None
+    assert db.get_availability_by_id(slot[1])['held_by'] is None
+
+
+
+def test_expire_cancels_pending_once(residents, slot, tomorrow):
+    booking_id = book(residents[1], slot)
+    cutoff = (tomorrow + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+    assert [booking['id'] for booking in db.expire_pending_bookings(cutoff)] == [booking_id]
+    assert db.expire_pending_bookings(cutoff) == []
+    assert db.get_availability_by_id(slot[1])['is_booked'] == 0
@@ -0,0 +1,73 @@
+"""Шина событий: публикация всем подписчикам, повтор лога - только безопасным"""
+import asyncio
+import json
+
+import pytest
+
+import database as db
+import events
+
+
+@pytest.fixture
+def received(monkeypatch):
+    """Два подписчика на SlotFreed: обычный и с replay=True -> полученные ими события"""
+    monkeypatch.setattr(events, "_subscribers", {})
+    received = {'notify': [], 'offer': []}
+
+    @events.subscriber(events.SlotFreed)
+    async def notify(bot, event):
+        received['notify'].append(event)
+
+    @events.subscriber(events.SlotFreed, replay=True)
+    async def offer(bot, event):
+        received['offer'].append(event)
+
+    return received
+
+
+def run(coroutine):
+    async def main():
+        await coroutine
+        await events.stop()
+    asyncio.run(main())
+
+
+def test_publish_reaches_all_subscribers(received):
+    run(events.publish(None, events.SlotFreed(1), record=False))
+    assert received == {'notify': [events.SlotFreed(1)], 'offer': [events.SlotFreed(1)]}
+
+
+def test_replay_reaches_only_replay_subscribers(received, tmp_path):
+    path = tmp_path / "events.log"
+    path.write_text("\n".join(json.dumps({"ts": 0, "tenant": db.get_tenant(), "type": event_type, "data": data})
+                              for event_type, data in (("SlotFreed", {"slot_id": 7}), ("Unknown", {}))) + "\n",
+                    encoding="utf-8")
+
+    replayed = []
+
+    async def replay():
+        replayed.append(await events.replay_log(None, str(path)))
+    run(replay())
+
+    assert replayed == [1]
+    assert received == {'notify': [], 'offer': [events.SlotFreed(7)]}
+
+
+def test_failing_subscriber_does_not_stop_queue(monkeypatch):
+    monkeypatch.setattr(events, "_subscribers", {})
+    handled = []
+
+    @events.subscriber(events.SlotFreed)
+    async def flaky(bot, event):
+        if event.slot_id == 1:
+            raise ValueError("boom")
+        handled.append(event.slot_id)
+
+    async def publish():
+        for slot_id in (1, 2):
+            await events.publish(None, events.SlotFreed(slot_id), record=False)
+        await events.drain()
+        assert events.get_event_stats() == {'flaky': {'processed': 1, 'failed': 1}}
+    run(publish())
+
+    assert handled == [2]
@@ -0,0 +1,73 @@
+"""Хендлеры: чужое место из подделанной callback_data не меняется"""
+import asyncio
+
+import pytest
+
+import database as db
+import events
+from fake_bot import create_fake_bot, make_callback_update, make_message_update
+
+
+@pytest.fixture(scope="module")
+def dispatcher():
+    # Роутеры подключаются к одному диспетчеру на процесс
+    from main import create_dispatcher
+    return create_dispatcher()
+
+
+@pytest.fixture
+def feed(dispatcher):
+    """Подать апдейты жильца по очереди -> (бот, FSM-состояние после)"""
+    def run(telegram_id, *updates):
+        async def main():
+            bot = create_fake_bot()
+            for make, payload in updates:
+                await dispatcher.feed_update(bot, make(telegram_id, payload, bot))
+            await events.stop()
+            return bot, await dispatcher.fsm.get_context(bot, telegram_id, telegram_id).get_state()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def foreign_spot(residents):
+    """Место жильца 1 - для остальных чужое"""
+    return db.create_parking_spot(residents[0], "A1", 100)
+
+
+def test_forged_rule_new_rejected(feed, foreign_spot):
+    bot, state = feed(2, (make_callback_update, f"rule_new_{foreign_spot}"))
+
+    assert state is None
+    assert bot.session.calls["answerCallbackQuery"] == 1
+    assert bot.session.calls["editMessageText"] == 0
+
+
+def test_forged_rules_page_rejected(feed, foreign_spot):
+    bot, _ = feed(2, (make_callback_update, f"rules_{foreign_spot}"))
+    assert bot.session.calls["editMessageText"] == 0
+
+
+def test_forged_bulk_slots_rejected(feed, foreign_spot):
+    _, state = feed(2, (make_callback_update, f"bulk_slots_{foreign_spot}"),
+                    (make_message_update, "01.01.2099 10:00-12:00"))
+
+    assert state is None
+    assert db.get_spot_availabilities(foreign_spot) == []
+
+
+def test_own_bulk_slots_created(feed, foreign_spot):
+    _, state = feed(1, (make_callback_update, f"bulk_slots_{foreign_spot}"),
+                    (make_message_update, "01.01.2099 10:00-12:00"))
+
+    assert state is None
+    assert len(db.get_spot_availabilities(foreign_spot)) == 1
+
+
+def test_bulk_slots_for_hidden_spot_rejected(feed, foreign_spot):
+    _, state = feed(1, (make_callback_update, f"bulk_slots_{foreign_spot}"))
+    assert state is not None
+    db.delete_spot(foreign_spot)
+
+    feed(1, (make_message_update, "01.01.2099 10:00-12:00"))
+    assert db.get_spot_availabilities(foreign_spot) == []
@@ -0,0 +1,95 @@
+"""Импорт жильцов из CSV: разбор файла, проверка строк, запись и привязка"""
+import pytest
+
+import database as db
+import imports
+
+CARD = "4111 1111 1111 1111"
+
+
+def csv_bytes(*lines, encoding="utf-8", delimiter=","):
+    return "\n".join(delimiter.join(line) for line in lines).encode(encoding)
+
+
+HEADER = ("ФИО", "Телефон", "Карта", "Банк", "Место", "Цена")
+
+
+@pytest.mark.parametrize("encoding, delimiter", [
+    ("utf-8", ","), ("utf-8-sig", ";"), ("cp1251", ";"), ("utf-8", "\t"),
+])
+def test_read_rows_encodings_and_delimiters(encoding, delimiter):
+    data = csv_bytes(HEADER, ("Иван Петров", "+79160000001", CARD, "Сбербанк", "A1", "150"),
+                     encoding=encoding, delimiter=delimiter)
+
+    rows = imports.read_rows(data)
+
+    assert rows == [(2, {'full_name': "Иван Петров", 'phone': "+79160000001", 'card_number': CARD,
+                         'bank': "Сбербанк", 'spot_number': "A1", 'price_per_hour': "150"})]
+
+
+def test_read_rows_skips_blank_and_pads_short_lines():
+    data = "name,phone,card,bank\n\nИван Петров,89160000001\n".encode()
+    assert imports.read_rows(data) == [(3, {'full_name': "Иван Петров", 'phone': "89160000001",
+                                           'card_number': "", 'bank': ""})]
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"", "пустой"),
+    ("ФИО,Телефон\nИван,89160000001".encode(), "card_number"),
+])
+def test_read_rows_rejects_file(data, message):
+    with pytest.raises(imports.ImportFileError, match=message):
+        imports.read_rows(data)
+
+
+def test_check_rows_errors_by_line(fresh_db):
+    rows = imports.read_rows(csv_bytes(
+        HEADER,
+        ("Иван Петров", "+7 916 000-00-01", CARD, "сбербанк", "A1", "150"),
+        ("Иван Петров", "89160000001", CARD, "Сбербанк", "A2", "200.5"),
+        ("Пётр Иванов", "89160000001", CARD, "Сбербанк", "", ""),
+        ("Анна", "12345", CARD, "Сбербанк", "", ""),
+        ("Мария Сидорова", "89160000004", CARD, "Банк Мечты", "", ""),
+        ("Олег Орлов", "89160000005", CARD, "ВТБ", "B1", "0"),
+        ("Ольга Белова", "89160000006", "1234567812345678", "ВТБ", "", ""),
+    ))
+
+    residents, errors = imports.check_rows(rows)
+
+    assert [resident['phone'] for resident in residents] == ["89160000001"]
+    assert residents[0]['bank'] == "Сбербанк"
+    assert residents[0]['spots'] == [("A1", 150.0), ("A2", 200.5)]
+    assert [line for line, _ in errors] == [4, 5, 6, 7, 8]
+    assert "строке 2" in errors[0][1]
+    assert "Банк Мечты" in errors[2][1]
+
+
+def test_too_many_spots_for_one_phone(fresh_db):
+    lines = [("Иван Петров", "89160000001", CARD, "ВТБ", f"S{n}", "100") for n in range(11)]
+    residents, errors = imports.check_rows(imports.read_rows(csv_bytes(HEADER, *lines)))
+
+    assert len(residents[0]['spots']) == 10
+    assert [line for line, _ in errors] == [12]
+
+
+def test_import_and_reimport(fresh_db):
+    data = csv_bytes(HEADER, ("Иван Петров", "89160000001", CARD, "ВТБ", "A1", "150"),
+                     ("Анна Смирнова", "89160000002", CARD, "ВТБ", "", ""))
+
+    result = imports.import_csv(data)
+    assert (result['rows'], result['users'], result['spots'], result['errors']) == (2, 2, 1, [])
+
+    # Исправленный файл можно загрузить ещё раз: записанные жильцы - ошибки «уже есть»
+    again = imports.import_csv(data)
+    assert again['users'] == 0
+    assert [line for line, _ in again['errors']] == [2, 3]
+
+
+def test_imported_resident_links_on_first_start(fresh_db):
+    imports.import_csv(csv_bytes(HEADER, ("Иван Петров", "89160000001", CARD, "ВТБ", "A1", "150")))
+
+    user = db.link_imported_resident(555, "ivan", "89160000001")
+
+    assert user['telegram_id'] == 555
+    assert [spot['spot_number'] for spot in db.get_user_spots(user['id'])] == ["A1"]
+    assert db.link_imported_resident(556, "other", "89160000001") is None
@@ -0,0 +1,65 @@
+"""Сводки аналитики: отмены и удалённые слоты не уводят их в минус и вверх"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as db
+
+
+@pytest.fixture
+def spot(residents):
+    return db.create_parking_spot(residents[0], "A1", 100)
+
+
+def day_stats(day: datetime) -> dict:
+    date_str = day.strftime("%Y-%m-%d")
+    rows = db.get_daily_stats(date_str, date_str)
+    return dict(rows[0]) if rows else {}
+
+
+def test_cancellation_counted_once(residents, spot, tomorrow):
+    slot = db.create_spot_availability(spot, tomorrow, tomorrow + timedelta(hours=2))
+    booking_id = db.create_booking(residents[1], spot, slot, tomorrow, tomorrow + timedelta(hours=2), 200)
+    db.run_rollups()
+
+    db.cancel_booking(booking_id)
+    # Лишние записи журнала об отмене той же брони - до и после прохода сводок
+    db.log_admin_action('booking_cancelled', booking_id=booking_id, user_id=residents[1])
+    db.run_rollups()
+    db.cancel_booking(booking_id)
+    db.log_admin_action('booking_cancelled', booking_id=booking_id, user_id=residents[1])
+    db.run_rollups()
+
+    stats = day_stats(tomorrow)
+    assert (stats['bookings'], stats['cancellations']) == (1, 1)
+    assert stats['revenue'] == 0
+    assert stats['booked_hours'] == 0
+    assert stats['offered_hours'] == 2
+
+
+def test_deleted_rule_slots_leave_offered_hours(spot, tomorrow):
+    rule_id = db.create_availability_rule(spot, 127, "08:00", "10:00", tomorrow.strftime("%Y-%m-%d"))
+    db.materialize_rules((tomorrow + timedelta(days=2)).strftime("%Y-%m-%d"))
+    db.run_rollups()
+    assert day_stats(tomorrow)['offered_hours'] == 2
+
+    assert db.add_rule_exception(rule_id, tomorrow.strftime("%Y-%m-%d"))['removed'] == 1
+    assert day_stats(tomorrow)['offered_hours'] == 0
+
+    # Слоты, ещё не сложенные в сводки, вычитать не из чего
+    db.materialize_rules((tomorrow + timedelta(days=3)).strftime("%Y-%m-%d"))
+    assert db.delete_availability_rule(rule_id) == 3
+    db.run_rollups()
+    assert sum(row['offered_hours'] for row in db.get_daily_stats("2000-01-01", "2100-01-01")) == 0
+
+
+def test_cleanup_keeps_offered_history(spot):
+    old = (datetime.now() - timedelta(days=40)).replace(hour=10, minute=0, second=0, microsecond=0)
+    db.create_spot_availability(spot, old, old + timedelta(hours=1))
+    db.run_rollups()
+    db.create_spot_availability(spot, old + timedelta(hours=2), old + timedelta(hours=3))
+
+    db.cleanup_old_data((datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S"))
+    db.run_rollups()
+
+    assert day_stats(old)['offered_hours'] == 2
@@ -0,0 +1,45 @@
+"""Кэш поиска: не отдаёт слотов, которых уже нет в выдаче базы"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import database as db
+import search_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    """Свой кэш на тест: версии дат новой базы начинаются заново"""
+    monkeypatch.setattr(search_cache, "_cache", search_cache.SearchCache())
+
+
+def test_ended_slot_leaves_cache(residents):
+    # Слот по часам базы (datetime("now") - UTC), кончается через 2 секунды
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    spot_id = db.create_parking_spot(residents[0], "A1", 100)
+    slot_id = db.create_spot_availability(spot_id, now - timedelta(hours=1), now + timedelta(seconds=2))
+    date_str = (now - timedelta(hours=1)).strftime("%Y-%m-%d")
+
+    assert [slot['id'] for slot in search_cache.get_available_slots(date_str)] == [slot_id]
+    assert search_cache.count_available_slots(date_str) == 1
+    time.sleep(3)
+
+    assert db.get_available_slots(date_str) == []
+    assert search_cache.get_available_slots(date_str) == []
+    assert search_cache.count_available_slots(date_str) == 0
+    assert db.create_booking(residents[1], spot_id, slot_id, now - timedelta(hours=1), now, 100) is None
+
+
+def test_cache_hit_before_change(residents, tomorrow):
+    spot_id = db.create_parking_spot(residents[0], "A1", 100)
+    db.create_spot_availability(spot_id, tomorrow, tomorrow + timedelta(hours=1))
+    date_str = tomorrow.strftime("%Y-%m-%d")
+    search_cache.stats.clear()
+
+    first = search_cache.get_available_slots(date_str)
+    assert search_cache.get_available_slots(date_str) == first
+    assert search_cache.stats['hits'] == 1
+
+    db.create_spot_availability(spot_id, tomorrow + timedelta(hours=2), tomorrow + timedelta(hours=3))
+    assert len(search_cache.get_available_slots(date_str)) == 2
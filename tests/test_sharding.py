@@ -0,0 +1,52 @@
+"""Воркер: апдейты одного пользователя по порядку, очередь одного не держит других"""
+import asyncio
+
+from sharding import UserSerializer
+
+
+def test_same_user_in_order_and_others_not_starved():
+    async def main():
+        serializer = UserSerializer(concurrency=4, backlog=100)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        done = []
+
+        def job(key, seconds):
+            async def run():
+                await asyncio.sleep(seconds)
+                done.append((key, loop.time() - started))
+            return run
+
+        for _ in range(6):
+            await serializer.submit("a", job("a", 0.1))
+        await serializer.submit("b", job("b", 0.01))
+        await serializer.drain()
+        return done
+
+    done = asyncio.run(main())
+
+    assert [key for key, _ in done] == ["b"] + ["a"] * 6
+    assert done[0][1] < 0.08
+    # Задачи пользователя a не пересекаются: шесть по 0.1 с подряд
+    assert done[-1][1] >= 0.6
+
+
+def test_submit_waits_for_backlog():
+    async def main():
+        serializer = UserSerializer(concurrency=1, backlog=2)
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+
+        await serializer.submit("a", blocked)
+        await serializer.submit("b", blocked)
+        third = asyncio.create_task(serializer.submit("c", blocked))
+        await asyncio.sleep(0.01)
+        accepted = third.done()
+        release.set()
+        await third
+        await serializer.drain()
+        return accepted
+
+    assert asyncio.run(main()) is False
@@ -0,0 +1,63 @@
+"""Курсоры страниц поиска: ключ сортировки -> callback_data -> ключ"""
+from datetime import timedelta
+
+import pytest
+
+import database as db
+from utils import format_slot_cursor, parse_slot_cursor
+
+SLOT = {'id': 42, 'spot_id': 7, 'price_per_hour': 150.5, 'start_time': "2030-05-17 08:30:00"}
+
+
+@pytest.mark.parametrize("sort, wait_from", [
+    ('time', None),
+    ('price', None),
+    ('wait', "2030-05-17 09:00:00"),
+    ('wait', "2030-05-17 08:00:00"),
+])
+def test_slot_cursor_round_trip(sort, wait_from):
+    key = db.slot_sort_key(SLOT, sort, wait_from)
+    cursor = format_slot_cursor(key)
+
+    assert parse_slot_cursor(cursor) == key
+    assert len(f"slots_prev_{cursor}".encode()) <= 64
+
+
+def test_log_cursor_round_trip():
+    key = ("2030-05-17 08:30:00", 123456)
+    assert parse_slot_cursor(format_slot_cursor(key)) == key
+
+
+def test_whole_price_round_trips_as_float():
+    key = db.slot_sort_key(dict(SLOT, price_per_hour=100.0), 'price')
+    assert parse_slot_cursor(format_slot_cursor(key)) == key
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "2030_x", "20301317000000_1"])
+def test_broken_cursor_is_none(cursor):
+    assert parse_slot_cursor(cursor) is None
+
+
+@pytest.mark.parametrize("sort", ['time', 'price'])
+def test_pages_cover_all_slots_once(residents, tomorrow, sort):
+    for number, price in enumerate((300, 100, 200)):
+        spot_id = db.create_parking_spot(residents[0], f"P{number}", price)
+        for hour in range(3):
+            start = tomorrow + timedelta(hours=hour)
+            db.create_spot_availability(spot_id, start, start + timedelta(hours=1))
+    date_str = tomorrow.strftime("%Y-%m-%d")
+    everything = [slot['id'] for slot in db.get_available_slots(date_str, sort=sort)]
+
+    pages, after = [], None
+    while True:
+        page = db.get_available_slots(date_str, sort=sort, limit=4, after=after)
+        if not page:
+            break
+        pages.append(page)
+        after = parse_slot_cursor(format_slot_cursor(db.slot_sort_key(page[-1], sort)))
+
+    assert [slot['id'] for page in pages for slot in page] == everything
+    assert len(everything) == 9
+    # Назад от первого слота второй страницы - первая страница
+    before = parse_slot_cursor(format_slot_cursor(db.slot_sort_key(pages[1][0], sort)))
+    assert db.get_available_slots(date_str, sort=sort, limit=4, before=before) == pages[0]
@@ -0,0 +1,63 @@
+"""Очередь подписчиков: слот предлагается первому, кому подходят дата и окно"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as db
+from config import BANKS
+
+
+@pytest.fixture
+def day(fresh_db) -> datetime:
+    """Полночь через три дня; поставщик - жилец 1, подписчики - 2 и 3"""
+    for telegram_id in (1, 2, 3):
+        db.create_user(telegram_id, f"user{telegram_id}", f"Жилец {telegram_id}",
+                       f"89160000{telegram_id:03d}", "2200000000000012", BANKS[0])
+    return (datetime.now() + timedelta(days=3)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def offered(day, desired_day, window, start_hour, end_hour):
+    """Предложен ли подписчику слот [day + start_hour, day + end_hour)"""
+    desired_date = None if desired_day is None else (day + timedelta(days=desired_day)).strftime("%Y-%m-%d")
+    db.create_spot_notification(2, desired_date, *window)
+    spot_id = db.create_parking_spot(1, "A1", 100)
+    slot_id = db.create_spot_availability(spot_id, day + timedelta(hours=start_hour), day + timedelta(hours=end_hour))
+    return bool(db.offer_slots([slot_id]))
+
+
+@pytest.mark.parametrize("desired_day, window, start_hour, end_hour, expected", [
+    (0, ("08:00", "10:00"), 9, 12, True),
+    (0, ("08:00", "10:00"), 10, 12, False),
+    (0, (None, None), 9, 12, True),
+    (1, (None, None), 9, 12, False),
+    # Слот через полночь
+    (0, ("21:00", "23:30"), 22, 30, True),
+    (1, ("05:00", "09:00"), 22, 30, True),
+    (1, ("07:00", "09:00"), 22, 30, False),
+    # Окно через полночь
+    (-1, ("22:00", "06:00"), 1, 3, True),
+    (0, ("22:00", "06:00"), 1, 3, False),
+    (None, ("22:00", "06:00"), 2, 4, True),
+    (None, ("22:00", "06:00"), 10, 12, False),
+    (None, ("08:00", "10:00"), 12, 40, True),
+])
+def test_window_match(day, desired_day, window, start_hour, end_hour, expected):
+    assert offered(day, desired_day, window, start_hour, end_hour) is expected
+
+
+def test_decline_passes_slot_to_next(day):
+    date_str = day.strftime("%Y-%m-%d")
+    db.create_spot_notification(2, date_str)
+    db.create_spot_notification(3, date_str)
+    spot_id = db.create_parking_spot(1, "A1", 100)
+    slot_id = db.create_spot_availability(spot_id, day + timedelta(hours=9), day + timedelta(hours=11))
+
+    [first] = db.offer_slots([slot_id])
+    assert first['telegram_id'] == 2
+    assert db.get_availability_by_id(slot_id)['held_by'] == first['user_id']
+    assert db.offer_slots([slot_id]) == []
+
+    [second] = db.decline_offer(first['id'], first['user_id'])
+    assert second['telegram_id'] == 3
+    assert db.decline_offer(second['id'], second['user_id']) == []
+    assert db.get_availability_by_id(slot_id)['held_by'] is None
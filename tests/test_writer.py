@@ -0,0 +1,113 @@
+"""Поток записи: SAVEPOINT на операцию, один COMMIT на пачку"""
+import asyncio
+import sqlite3
+
+import pytest
+
+import database as db
+import writer
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Соединение как у потока записи: транзакциями управляет GroupCommitWriter"""
+    path = str(tmp_path / "writer.db")
+    setup = sqlite3.connect(path)
+    setup.executescript('''
+        CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE links (item_id INTEGER REFERENCES items (id) DEFERRABLE INITIALLY DEFERRED);
+    ''')
+    setup.close()
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.isolation_level = None
+    conn.execute('PRAGMA foreign_keys = ON')
+    yield conn
+    conn.close()
+
+
+def insert_item(name):
+    conn = writer.current_connection()
+    return conn.execute('INSERT INTO items (name) VALUES (?)', (name,)).lastrowid
+
+
+def insert_link(item_id):
+    writer.current_connection().execute('INSERT INTO links (item_id) VALUES (?)', (item_id,))
+
+
+def names(conn):
+    return [row[0] for row in conn.execute('SELECT name FROM items ORDER BY id')]
+
+
+def make_writer():
+    # Поток не нужен: _commit вызывается напрямую
+    group = writer.GroupCommitWriter.__new__(writer.GroupCommitWriter)
+    group.name, group.batches, group.ops = "test", 0, 0
+    return group
+
+
+def test_failed_op_rolls_back_only_its_savepoint(conn):
+    group = make_writer()
+    batch = [writer.WriteOp(insert_item, ("a",), {}),
+             writer.WriteOp(insert_item, ("a",), {}),
+             writer.WriteOp(insert_item, ("b",), {})]
+
+    group._commit(conn, batch)
+
+    assert batch[0].future.result() == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        batch[1].future.result()
+    assert batch[2].future.result() == 2
+    assert names(conn) == ["a", "b"]
+    assert not conn.in_transaction
+    assert (group.batches, group.ops) == (1, 3)
+
+
+def test_partial_op_is_rolled_back(conn):
+    def insert_then_fail():
+        insert_item("half")
+        raise ValueError("boom")
+
+    group = make_writer()
+    batch = [writer.WriteOp(insert_then_fail, (), {}), writer.WriteOp(insert_item, ("c",), {})]
+
+    group._commit(conn, batch)
+
+    with pytest.raises(ValueError):
+        batch[0].future.result()
+    assert names(conn) == ["c"]
+
+
+def test_commit_failure_fails_whole_batch(conn):
+    group = make_writer()
+    # Отложенный внешний ключ проверяется только на COMMIT
+    batch = [writer.WriteOp(insert_item, ("d",), {}), writer.WriteOp(insert_link, (999,), {})]
+
+    group._commit(conn, batch)
+
+    for op in batch:
+        with pytest.raises(sqlite3.IntegrityError):
+            op.future.result()
+    assert names(conn) == []
+    assert not conn.in_transaction
+    assert group.batches == 0
+    assert writer.current_connection() is None
+
+
+def test_writer_thread_commits_submitted_ops(conn, tmp_path):
+    path = str(tmp_path / "writer.db")
+    group = writer.GroupCommitWriter(lambda: sqlite3.connect(path, check_same_thread=False), name="test")
+    futures = [group.submit(insert_item, f"item{i}") for i in range(20)]
+    group.stop()
+
+    assert [future.result() for future in futures] == list(range(1, 21))
+    assert group.ops == 20
+    assert len(names(conn)) == 20
+
+
+def test_sync_write_in_event_loop_is_refused(fresh_db):
+    async def call():
+        with pytest.raises(RuntimeError):
+            db.record_empty_search("2030-01-01")
+        await db.write(db.record_empty_search, "2030-01-01")
+
+    asyncio.run(call())
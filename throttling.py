@@ -0,0 +1,124 @@
+"""
+Антифлуд ParkingBot: token bucket на пользователя и на весь бот
+"""
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import (
+    MIN_ACTION_INTERVAL, THROTTLE_USER_BURST,
+    THROTTLE_GLOBAL_RATE, THROTTLE_GLOBAL_BURST, THROTTLE_MAX_USERS
+)
+
+logger = logging.getLogger(__name__)
+
+# Счётчики антифлуда процесса: passed, dropped_user, dropped_global, evicted
+stats: Counter = Counter()
+
+
+class TokenBuckets:
+    """Token bucket'ы по ключу; давно неактивные ключи вытесняются (LRU)"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = THROTTLE_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [токены, время пополнения, предупреждали ли о флуде]
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def consume(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Списать токен; False - лимит исчерпан"""
+        if now is None:
+            now = time.monotonic()
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.burst, now, False]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                # Вытесненный пользователь просто начнёт с полного bucket'а
+                self._buckets.popitem(last=False)
+                stats['evicted'] += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return True
+        return False
+
+    def should_warn(self, key: Hashable) -> bool:
+        """Предупредить о флуде один раз за серию отброшенных действий"""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[2]:
+            return False
+        bucket[2] = True
+        return True
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты сверх лимита до FSM, хендлеров и запросов к БД
+
+    Лимиты действуют в пределах процесса: в многопроцессном режиме
+    пользователь всегда попадает в один воркер, а глобальный лимит
+    получается THROTTLE_GLOBAL_RATE на каждый воркер.
+    """
+
+    def __init__(self):
+        self.users = TokenBuckets(rate=1 / MIN_ACTION_INTERVAL, burst=THROTTLE_USER_BURST)
+        self.total = TokenBuckets(rate=THROTTLE_GLOBAL_RATE, burst=THROTTLE_GLOBAL_BURST, max_keys=1)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        now = time.monotonic()
+
+        if user is not None and not self.users.consume(user.id, now):
+            stats['dropped_user'] += 1
+            await self._reject(event, user.id)
+            return None
+
+        if not self.total.consume(None, now):
+            stats['dropped_global'] += 1
+            await self._reject(event, None)
+            return None
+
+        stats['passed'] += 1
+        return await handler(event, data)
+
+    async def _reject(self, event: TelegramObject, user_id: Optional[int]):
+        """Ответить на отброшенный апдейт без обращения к БД"""
+        if not isinstance(event, Update):
+            return
+        try:
+            if event.callback_query:
+                # Без ответа у клиента крутится индикатор и он повторяет запрос
+                await event.callback_query.answer("⏳ Слишком часто, подождите секунду")
+            elif event.message and user_id is not None and self.users.should_warn(user_id):
+                await event.message.answer("⏳ Слишком много действий. Подождите немного.")
+        except Exception as e:
+            logger.error(f"Failed to answer throttled update: {e}")
+
+
+def get_throttle_stats() -> Dict[str, int]:
+    """Счётчики антифлуда"""
+    return {
+        'passed': stats['passed'],
+        'dropped_user': stats['dropped_user'],
+        'dropped_global': stats['dropped_global'],
+        'evicted': stats['evicted'],
+    }
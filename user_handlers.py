@@ -1,8 +1,11 @@
 """
 Обработчики пользователей ParkingBot
 """
+import asyncio
+import html
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
@@ -10,23 +13,33 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 import database as db
+import events
+import occupancy
+import search_cache
+import tenants
 from keyboards import (
     get_main_menu_keyboard, get_cancel_keyboard, get_cancel_menu_keyboard,
     get_banks_keyboard, get_dates_keyboard, get_time_slots_keyboard,
     get_yes_no_keyboard, get_confirm_keyboard, get_available_slots_keyboard,
     get_no_slots_keyboard, get_user_spots_keyboard, get_spot_actions_keyboard,
     get_user_bookings_keyboard, get_booking_actions_keyboard,
-    get_notifications_keyboard, get_profile_keyboard, get_notify_options_keyboard
+    get_notifications_keyboard, get_profile_keyboard, get_notify_options_keyboard,
+    get_spot_rules_keyboard, get_rule_weekdays_keyboard, get_rule_until_keyboard,
+    get_registration_keyboard, get_tenants_keyboard, get_offer_keyboard
 )
 from utils import (
     validate_name, validate_phone, validate_card, validate_date,
-    validate_time, validate_price, validate_spot_number,
-    format_datetime, mask_card, calculate_price, parse_datetime
+    validate_time, validate_price, validate_spot_number, validate_time_window,
+    format_datetime, mask_card, calculate_price, parse_datetime,
+    format_slot_cursor, parse_slot_cursor, format_weekdays, parse_intervals, WORKDAYS
+)
+from config import (
+    MAX_SPOTS_PER_USER, MAX_ACTIVE_BOOKINGS, SLOTS_PER_PAGE, MAX_BULK_SLOTS,
+    MAX_RULES_PER_SPOT, RULE_HORIZON_DAYS
 )
-from config import MAX_SPOTS_PER_USER, MAX_ACTIVE_BOOKINGS
 
 logger = logging.getLogger(__name__)
-router = Router()
+router = Router(name="user")
 
 
 # ==================== STATES ====================
@@ -57,6 +70,8 @@ class SearchStates(StatesGroup):
     waiting_date = State()
     waiting_date_manual = State()
     selecting_slot = State()
+    waiting_window = State()
+    waiting_max_price = State()
     confirming_booking = State()
 
 
@@ -81,6 +96,52 @@ async def cmd_start(message: Message, state: FSMContext):
             reply_markup=get_main_menu_keyboard(is_admin),
             parse_mode="HTML"
         )
+    elif tenants.is_multi_tenant():
+        # Жилец ещё не зарегистрирован в своём ЖК - выбор можно поменять до конца регистрации
+        await message.answer(
+            "👋 Добро пожаловать в <b>ParkingBot</b>!\n\n"
+            "Это платформа для аренды парковочных мест между жильцами ЖК.\n\n"
+            "🏘 Выберите ваш <b>жилой комплекс</b>:",
+            reply_markup=get_tenants_keyboard(),
+            parse_mode="HTML"
+        )
+    else:
+        await start_registration(message, state)
+
+
+@router.callback_query(F.data.startswith("tenant_"))
+async def choose_tenant(callback: CallbackQuery, state: FSMContext):
+    code = callback.data.replace("tenant_", "")
+    if code not in db.tenant_codes():
+        await callback.answer("❌ ЖК не найден", show_alert=True)
+        return
+    if db.get_user_by_telegram_id(callback.from_user.id):
+        # Зарегистрированный жилец остаётся в своём ЖК
+        await callback.answer("Вы уже зарегистрированы", show_alert=True)
+        return
+    
+    await tenants.directory.assign(callback.from_user.id, code)
+    await callback.message.edit_text(f"🏘 ЖК: <b>{db.tenant_name(code)}</b>", parse_mode="HTML")
+    await state.clear()
+    # Следующие апдейты попадут в этот ЖК через middleware, этот - ещё нет
+    with db.use_tenant(code):
+        await start_registration(callback.message, state)
+
+
+async def start_registration(message: Message, state: FSMContext):
+    """Приветствие и первый шаг регистрации в текущем ЖК"""
+    if db.has_unlinked_residents():
+        # Жильца могли внести импортом: свой контакт подтверждает номер из файла
+        await message.answer(
+            "👋 Добро пожаловать в <b>ParkingBot</b>!\n\n"
+            "Это платформа для аренды парковочных мест между жильцами ЖК.\n\n"
+            "Если управляющая компания уже внесла вас в список жильцов, нажмите "
+            "«📱 Поделиться номером» - профиль и места подключатся сразу.\n\n"
+            "📝 Или введите ваше <b>имя и фамилию</b> для регистрации:",
+            reply_markup=get_registration_keyboard(),
+            parse_mode="HTML"
+        )
+        await state.set_state(RegistrationStates.waiting_name)
     else:
         await message.answer(
             "👋 Добро пожаловать в <b>ParkingBot</b>!\n\n"
@@ -93,6 +154,38 @@ async def cmd_start(message: Message, state: FSMContext):
         await state.set_state(RegistrationStates.waiting_name)
 
 
+@router.message(RegistrationStates.waiting_name, F.contact)
+async def process_registration_contact(message: Message, state: FSMContext):
+    # Номер подтверждён, только если это контакт самого отправителя, а не из адресной книги
+    if message.contact.user_id != message.from_user.id:
+        await message.answer("❌ Отправьте свой номер кнопкой «📱 Поделиться номером».")
+        return
+    
+    is_valid, phone = validate_phone(message.contact.phone_number)
+    user = await db.write(db.link_imported_resident, message.from_user.id, message.from_user.username, phone) if is_valid else None
+    if user is None:
+        await message.answer(
+            "🔍 Этого номера нет в списке жильцов.\n\n"
+            "📝 Зарегистрируйтесь: введите ваше <b>имя и фамилию</b>:",
+            reply_markup=get_cancel_keyboard(),
+            parse_mode="HTML"
+        )
+        return
+    
+    await state.clear()
+    await message.answer(
+        f"✅ <b>Профиль подключён!</b>\n\n"
+        f"👤 Имя: {user['full_name']}\n"
+        f"📞 Телефон: {user['phone']}\n"
+        f"💳 Карта: {mask_card(user['card_number'])}\n"
+        f"🏦 Банк: {user['bank']}\n"
+        f"🏠 Мест: {db.get_user_spots_count(user['id'])}\n\n"
+        "Добавьте свободное время в «🏠 Мои места», чтобы сдавать место соседям.",
+        reply_markup=get_main_menu_keyboard(user['role'] == 'admin'),
+        parse_mode="HTML"
+    )
+
+
 @router.message(RegistrationStates.waiting_name)
 async def process_registration_name(message: Message, state: FSMContext):
     if message.text == "❌ Отмена":
@@ -159,7 +252,7 @@ async def process_registration_bank(callback: CallbackQuery, state: FSMContext):
     bank = callback.data.replace("bank_", "")
     data = await state.get_data()
     
-    user_id = db.create_user(
+    user_id = await db.write(db.create_user,
         telegram_id=callback.from_user.id,
         username=callback.from_user.username,
         full_name=data['full_name'],
@@ -187,16 +280,17 @@ async def process_registration_bank(callback: CallbackQuery, state: FSMContext):
         parse_mode="HTML"
     )
     
-    await notify_admins_new_user(callback.bot, data['full_name'], data['phone'])
+    await events.publish(callback.bot, events.UserRegistered(user_id, data['full_name'], data['phone']))
 
 
-async def notify_admins_new_user(bot, full_name: str, phone: str):
+@events.subscriber(events.UserRegistered)
+async def notify_admins_new_user(bot, event: events.UserRegistered):
     admins = db.get_admins()
     for admin in admins:
         try:
             await bot.send_message(
                 admin['telegram_id'],
-                f"👤 <b>Новый пользователь!</b>\n\nИмя: {full_name}\nТелефон: {phone}",
+                f"👤 <b>Новый пользователь!</b>\n\nИмя: {event.full_name}\nТелефон: {event.phone}",
                 parse_mode="HTML"
             )
         except Exception as e:
@@ -448,7 +542,18 @@ async def process_end_time_manual(message: Message, state: FSMContext):
 async def process_partial(callback: CallbackQuery, state: FSMContext):
     is_partial = callback.data == "partial_yes"
     await state.update_data(is_partial_allowed=is_partial)
-    await callback.message.edit_text("💰 Введите <b>цену за час</b> в рублях (от 1 до 10000):", parse_mode="HTML")
+    
+    data = await state.get_data()
+    hint = ""
+    # Карта ЖК при промахе кэша - год истории и NumPy: в потоке, а не в цикле событий
+    suggestion = await asyncio.to_thread(occupancy.suggest_price,
+                                         parse_datetime(data['start_date'], data['start_time']),
+                                         parse_datetime(data['end_date'], data['end_time']))
+    if suggestion:
+        hint = (f"\n\n💡 В эти часы занято {suggestion['slot_share'] * 100:.0f}% мест "
+                f"(в среднем {suggestion['average_share'] * 100:.0f}%). "
+                f"Рекомендуемая цена: <b>{suggestion['price']}₽/час</b>")
+    await callback.message.edit_text(f"💰 Введите <b>цену за час</b> в рублях (от 1 до 10000):{hint}", parse_mode="HTML")
     await state.set_state(AddSpotStates.waiting_price)
 
 
@@ -492,7 +597,7 @@ async def confirm_spot(callback: CallbackQuery, state: FSMContext):
     
     data = await state.get_data()
     
-    spot_id = db.create_parking_spot(
+    spot_id = await db.write(db.create_parking_spot,
         supplier_id=data['supplier_id'],
         spot_number=data['spot_number'],
         price_per_hour=data['price_per_hour'],
@@ -501,7 +606,7 @@ async def confirm_spot(callback: CallbackQuery, state: FSMContext):
     
     start_dt = parse_datetime(data['start_date'], data['start_time'])
     end_dt = parse_datetime(data['end_date'], data['end_time'])
-    db.create_spot_availability(spot_id, start_dt, end_dt)
+    slot_id = await db.write(db.create_spot_availability, spot_id, start_dt, end_dt)
     
     await state.clear()
     user = db.get_user_by_telegram_id(callback.from_user.id)
@@ -515,24 +620,7 @@ async def confirm_spot(callback: CallbackQuery, state: FSMContext):
         parse_mode="HTML"
     )
     await callback.message.answer("Выберите действие:", reply_markup=get_main_menu_keyboard(is_admin))
-    await check_and_send_notifications(callback.bot, spot_id, start_dt, end_dt, data)
-
-
-async def check_and_send_notifications(bot, spot_id: int, start_dt: datetime, end_dt: datetime, spot_data: dict):
-    notifications = db.get_matching_notifications(spot_id, start_dt, end_dt)
-    for notif in notifications:
-        try:
-            await bot.send_message(
-                notif['telegram_id'],
-                f"🔔 <b>Появилось свободное место!</b>\n\n"
-                f"🏠 Место: {spot_data['spot_number']}\n"
-                f"📅 Время: {spot_data['start_date']} {spot_data['start_time']} - {spot_data['end_date']} {spot_data['end_time']}\n"
-                f"💰 Цена: {spot_data['price_per_hour']}₽/час",
-                parse_mode="HTML"
-            )
-            db.deactivate_notification(notif['id'])
-        except Exception as e:
-            logger.error(f"Failed to send notification: {e}")
+    await events.publish(callback.bot, events.SpotCreated(spot_id, data['supplier_id'], data['spot_number'], [slot_id]))
 
 
 # ==================== SEARCH & BOOKING ====================
@@ -544,7 +632,7 @@ async def search_start(message: Message, state: FSMContext):
         await message.answer("❌ Сначала зарегистрируйтесь: /start")
         return
     
-    await state.update_data(user_id=user['id'])
+    await state.update_data(user_id=user['id'], search_window=None, search_max_price=None, search_sort='time')
     await message.answer("🔍 <b>Поиск парковочного места</b>\n\nВыберите дату:", reply_markup=get_dates_keyboard("search_date"), parse_mode="HTML")
     await state.set_state(SearchStates.waiting_date)
 
@@ -564,7 +652,7 @@ async def process_search_date(callback: CallbackQuery, state: FSMContext):
         return
     
     await state.update_data(search_date=date_value)
-    await show_available_slots(callback, state, date_value)
+    await show_available_slots(callback, state)
 
 
 @router.message(SearchStates.waiting_date_manual)
@@ -579,37 +667,166 @@ async def process_search_date_manual(message: Message, state: FSMContext):
         return
     
     await state.update_data(search_date=message.text)
-    date_obj = datetime.strptime(message.text, "%d.%m.%Y")
-    date_str = date_obj.strftime("%Y-%m-%d")
-    slots = db.get_available_slots(date_str)
+    text, markup = await build_slots_page(message.bot, await state.get_data())
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+    await state.set_state(SearchStates.selecting_slot)
+
+
+async def build_slots_page(bot, data: Dict[str, Any], after: tuple = None, before: tuple = None):
+    """Текст и клавиатура страницы результатов поиска по данным FSM"""
+    day = datetime.strptime(data['search_date'], "%d.%m.%Y")
+    date_str = day.strftime("%Y-%m-%d")
+    window = data.get('search_window')
+    max_price = data.get('search_max_price')
+    sort = data.get('search_sort', 'time')
+    
+    start_time = end_time = None
+    if window:
+        start_time = f"{date_str} {window[0]}:00"
+        end_time = f"{date_str} {window[1]}:00"
+    # Ожидание считаем от момента, когда место нужно, но не раньше текущей минуты
+    # (с точностью до минуты - чтобы выдача 'wait' попадала в кэш)
+    wait_from = max(start_time or f"{date_str} 00:00:00", datetime.now().strftime("%Y-%m-%d %H:%M:00"))
+    
+    # Слоты по расписаниям на дату за горизонтом фоновой задачи создаются при первом поиске;
+    # как и созданные фоновой задачей, они уходят очереди подписчиков
+    created = await db.ensure_rule_slots(date_str)
+    if created:
+        await events.publish(bot, events.SlotsAdded([slot['id'] for slot in created]))
+    
+    # Лишний слот сверх страницы показывает, есть ли что листать дальше
+    slots = search_cache.get_available_slots(
+        date_str, start_time, end_time, limit=SLOTS_PER_PAGE + 1, after=after, before=before,
+        max_price=max_price, sort=sort, wait_from=wait_from
+    )
+    has_more = len(slots) > SLOTS_PER_PAGE
+    if before:
+        slots = slots[-SLOTS_PER_PAGE:]
+        has_prev, has_next = has_more, True
+    else:
+        slots = slots[:SLOTS_PER_PAGE]
+        has_prev, has_next = after is not None, has_more
+    
+    if not slots and (after or before):
+        # Страница опустела (слоты забронировали) - начинаем сначала
+        return await build_slots_page(bot, data)
     
     if not slots:
-        await message.answer(
-            "😔 На эту дату нет свободных мест.",
-            reply_markup=get_no_slots_keyboard()
-        )
-    else:
-        await message.answer(
-            f"🏠 <b>Найдено {len(slots)} слотов</b>\n\nВыберите место:",
-            reply_markup=get_available_slots_keyboard(slots),
-            parse_mode="HTML"
-        )
+        # Спрос без предложения - для аналитики; ответ не ждёт записи
+        db.submit_write(db.record_empty_search, date_str)
+    
+    filtered = bool(window or max_price)
+    if not slots and not filtered:
+        return "😔 На эту дату нет свободных мест.", get_no_slots_keyboard()
+    
+    conditions = []
+    if window:
+        conditions.append(f"⏰ {window[0]}–{window[1]}")
+    if max_price:
+        conditions.append(f"💰 до {max_price:g}₽/ч")
+    text = f"🏠 <b>Найдено {search_cache.count_available_slots(date_str, start_time, end_time, max_price)} слотов</b>"
+    if conditions:
+        text += "\n" + " | ".join(conditions)
+    text += "\n\nВыберите место:" if slots else "\n\n😔 Под эти условия мест нет."
+    
+    def cursor(slot):
+        return format_slot_cursor(db.slot_sort_key(slot, sort, wait_from))
+    
+    return text, get_available_slots_keyboard(
+        slots, prev_cursor=cursor(slots[0]) if has_prev else None,
+        next_cursor=cursor(slots[-1]) if has_next else None,
+        sort=sort, filtered=filtered
+    )
+
+
+async def show_available_slots(callback: CallbackQuery, state: FSMContext,
+                               after: tuple = None, before: tuple = None):
+    text, markup = await build_slots_page(callback.bot, await state.get_data(), after=after, before=before)
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
     await state.set_state(SearchStates.selecting_slot)
 
 
-async def show_available_slots(callback: CallbackQuery, state: FSMContext, date_value: str):
-    date_obj = datetime.strptime(date_value, "%d.%m.%Y")
-    date_str = date_obj.strftime("%Y-%m-%d")
-    slots = db.get_available_slots(date_str)
+@router.callback_query(SearchStates.selecting_slot, F.data.startswith("slots_"))
+async def paginate_slots(callback: CallbackQuery, state: FSMContext):
+    _, direction, cursor_value = callback.data.split("_", 2)
+    cursor = parse_slot_cursor(cursor_value)
+    data = await state.get_data()
     
-    if not slots:
-        await callback.message.edit_text("😔 На эту дату нет свободных мест.", reply_markup=get_no_slots_keyboard())
+    if not cursor or 'search_date' not in data:
+        await callback.answer("❌ Поиск устарел, начните заново", show_alert=True)
+        return
+    
+    if direction == "next":
+        await show_available_slots(callback, state, after=cursor)
     else:
-        await callback.message.edit_text(
-            f"🏠 <b>Найдено {len(slots)} слотов</b>\n\nВыберите место:",
-            reply_markup=get_available_slots_keyboard(slots),
-            parse_mode="HTML"
-        )
+        await show_available_slots(callback, state, before=cursor)
+    await callback.answer()
+
+
+@router.callback_query(SearchStates.selecting_slot, F.data.startswith("search_sort_"))
+async def change_search_sort(callback: CallbackQuery, state: FSMContext):
+    sort = callback.data.replace("search_sort_", "")
+    if sort not in db.SLOT_SORTS:
+        await callback.answer()
+        return
+    
+    await state.update_data(search_sort=sort)
+    await show_available_slots(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(SearchStates.selecting_slot, F.data == "search_filters")
+async def search_filters_start(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_text(
+        "⏰ Введите нужное время в формате <b>ЧЧ:ММ-ЧЧ:ММ</b> (например 08:00-19:00)\n"
+        "или «-», чтобы искать на весь день:",
+        parse_mode="HTML"
+    )
+    await state.set_state(SearchStates.waiting_window)
+    await callback.answer()
+
+
+@router.callback_query(SearchStates.selecting_slot, F.data == "search_filters_reset")
+async def search_filters_reset(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(search_window=None, search_max_price=None)
+    await show_available_slots(callback, state)
+    await callback.answer()
+
+
+@router.message(SearchStates.waiting_window)
+async def process_search_window(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+    
+    window = None
+    if message.text.strip() != "-":
+        is_valid, window = validate_time_window(message.text)
+        if not is_valid:
+            await message.answer("❌ Неверный формат. Введите время как ЧЧ:ММ-ЧЧ:ММ, например 08:00-19:00")
+            return
+    
+    await state.update_data(search_window=window)
+    await message.answer("💰 Максимальная цена за час (₽) или «-» без ограничения:")
+    await state.set_state(SearchStates.waiting_max_price)
+
+
+@router.message(SearchStates.waiting_max_price)
+async def process_search_max_price(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+    
+    max_price = None
+    if message.text.strip() != "-":
+        is_valid, max_price = validate_price(message.text)
+        if not is_valid:
+            await message.answer("❌ Неверная цена. Введите число от 1 до 10000 или «-»")
+            return
+    
+    await state.update_data(search_max_price=max_price)
+    text, markup = await build_slots_page(message.bot, await state.get_data())
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
     await state.set_state(SearchStates.selecting_slot)
 
 
@@ -618,12 +835,12 @@ async def select_slot(callback: CallbackQuery, state: FSMContext):
     slot_id = int(callback.data.replace("slot_", ""))
     slot = db.get_availability_by_id(slot_id)
     
-    if not slot:
+    data = await state.get_data()
+    
+    if not slot or slot['is_booked'] or slot['held_by'] not in (None, data['user_id']):
         await callback.answer("❌ Слот больше не доступен", show_alert=True)
         return
     
-    data = await state.get_data()
-    
     if slot['supplier_id'] == data['user_id']:
         await callback.answer("❌ Вы не можете забронировать своё место", show_alert=True)
         return
@@ -633,6 +850,12 @@ async def select_slot(callback: CallbackQuery, state: FSMContext):
         await callback.answer(f"❌ Лимит {MAX_ACTIVE_BOOKINGS} бронирований", show_alert=True)
         return
     
+    await show_booking_confirmation(callback, state, slot)
+
+
+async def show_booking_confirmation(callback: CallbackQuery, state: FSMContext, slot: Dict[str, Any]):
+    """Стоимость выбранного слота и кнопки подтверждения брони"""
+    slot_id = slot['id']
     start_dt = datetime.fromisoformat(slot['start_time'])
     end_dt = datetime.fromisoformat(slot['end_time'])
     total_price = calculate_price(slot['price_per_hour'], start_dt, end_dt)
@@ -670,7 +893,7 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext):
     
     data = await state.get_data()
     
-    booking_id = db.create_booking(
+    booking_id = await db.write(db.create_booking,
         customer_id=data['user_id'], spot_id=data['spot_id'],
         availability_id=data['selected_slot_id'],
         start_time=data['start_time'], end_time=data['end_time'],
@@ -681,6 +904,11 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext):
     user = db.get_user_by_telegram_id(callback.from_user.id)
     is_admin = user and user['role'] == 'admin'
     
+    if booking_id is None:
+        await callback.message.edit_text("❌ Слот уже забронирован или придержан для другого жильца.")
+        await callback.message.answer("Выберите действие:", reply_markup=get_main_menu_keyboard(is_admin))
+        return
+    
     await callback.message.edit_text(
         f"✅ <b>Бронирование #{booking_id} создано!</b>\n\n"
         f"🏠 Место: {data['spot_number']}\n"
@@ -693,14 +921,23 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext):
         parse_mode="HTML"
     )
     await callback.message.answer("Выберите действие:", reply_markup=get_main_menu_keyboard(is_admin))
-    
+    await events.publish(callback.bot, events.BookingCreated(
+        booking_id, data['user_id'], data['supplier_telegram_id'], data['spot_number'],
+        data['start_time'].strftime("%Y-%m-%d %H:%M:%S"), data['end_time'].strftime("%Y-%m-%d %H:%M:%S"),
+        data['total_price']
+    ))
+
+
+@events.subscriber(events.BookingCreated)
+async def notify_supplier_new_booking(bot, event: events.BookingCreated):
     try:
-        await callback.bot.send_message(
-            data['supplier_telegram_id'],
+        await bot.send_message(
+            event.supplier_telegram_id,
             f"🎉 <b>Новое бронирование!</b>\n\n"
-            f"🏠 Место: {data['spot_number']}\n"
-            f"📅 Время: {format_datetime(data['start_time'])} - {format_datetime(data['end_time'])}\n"
-            f"💰 Сумма: {data['total_price']}₽",
+            f"🏠 Место: {event.spot_number}\n"
+            f"📅 Время: {format_datetime(datetime.fromisoformat(event.start_time))} - "
+            f"{format_datetime(datetime.fromisoformat(event.end_time))}\n"
+            f"💰 Сумма: {event.total_price}₽",
             parse_mode="HTML"
         )
     except Exception as e:
@@ -724,7 +961,7 @@ async def notify_available_start(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(NotifyStates.selecting_option, F.data == "notify_any")
 async def notify_any(callback: CallbackQuery, state: FSMContext):
     user = db.get_user_by_telegram_id(callback.from_user.id)
-    db.create_spot_notification(user_id=user['id'], notify_any=True)
+    await db.write(db.create_spot_notification, user_id=user['id'], notify_any=True)
     await state.clear()
     is_admin = user['role'] == 'admin'
     await callback.message.edit_text("✅ <b>Подписка оформлена!</b>\n\nВы получите уведомление при появлении любого места.", parse_mode="HTML")
@@ -750,7 +987,7 @@ async def process_notify_date(callback: CallbackQuery, state: FSMContext):
     date_obj = datetime.strptime(date_value, "%d.%m.%Y")
     date_str = date_obj.strftime("%Y-%m-%d")
     
-    db.create_spot_notification(user_id=user['id'], desired_date=date_str, notify_any=False)
+    await db.write(db.create_spot_notification, user_id=user['id'], desired_date=date_str, notify_any=False)
     await state.clear()
     is_admin = user['role'] == 'admin'
     await callback.message.edit_text(f"✅ <b>Подписка оформлена!</b>\n\nУведомим при появлении места на {date_value}.", parse_mode="HTML")
@@ -770,7 +1007,7 @@ async def process_notify_date_manual(message: Message, state: FSMContext):
     
     user = db.get_user_by_telegram_id(message.from_user.id)
     date_str = parsed_date.strftime("%Y-%m-%d")
-    db.create_spot_notification(user_id=user['id'], desired_date=date_str, notify_any=False)
+    await db.write(db.create_spot_notification, user_id=user['id'], desired_date=date_str, notify_any=False)
     await state.clear()
     is_admin = user['role'] == 'admin'
     await message.answer(f"✅ <b>Подписка оформлена!</b>\n\nУведомим при появлении места на {message.text}.", reply_markup=get_main_menu_keyboard(is_admin), parse_mode="HTML")
@@ -798,7 +1035,7 @@ async def show_notifications(message: Message, state: FSMContext):
 @router.callback_query(F.data.startswith("del_notif_"))
 async def delete_notification(callback: CallbackQuery, state: FSMContext):
     notif_id = int(callback.data.replace("del_notif_", ""))
-    db.deactivate_notification(notif_id)
+    await db.write(db.deactivate_notification, notif_id)
     
     user = db.get_user_by_telegram_id(callback.from_user.id)
     notifications = db.get_user_notifications(user['id'])
@@ -813,8 +1050,111 @@ async def delete_notification(callback: CallbackQuery, state: FSMContext):
         )
 
 
+# ==================== WAITLIST ====================
+
+def format_offer(offer: Dict[str, Any]) -> str:
+    """Текст предложения слота подписчику"""
+    expires_at = datetime.fromisoformat(offer['expires_at'])
+    return (
+        f"🔔 <b>Появилось свободное место!</b>\n\n"
+        f"🏠 Место: {offer['spot_number']}\n"
+        f"📅 Время: {format_datetime(datetime.fromisoformat(offer['start_time']))} - "
+        f"{format_datetime(datetime.fromisoformat(offer['end_time']))}\n"
+        f"💰 Цена: {offer['price_per_hour']}₽/час\n\n"
+        f"⏳ Место придержано для вас до {expires_at.strftime('%H:%M')}, "
+        f"потом его получит следующий в очереди."
+    )
+
+
+async def send_offers(bot, offers: List[Dict[str, Any]]):
+    """Разослать предложения слотов; недоставленное сразу уходит следующему в очереди"""
+    while offers:
+        undelivered = []
+        for offer in offers:
+            try:
+                await bot.send_message(offer['telegram_id'], format_offer(offer),
+                                       reply_markup=get_offer_keyboard(offer['id']), parse_mode="HTML")
+            except Exception as e:
+                logger.error(f"Failed to send slot offer: {e}")
+                undelivered.append(offer)
+        offers = []
+        for offer in undelivered:
+            offers += await db.write(db.decline_offer, offer['id'], offer['user_id']) or []
+
+
+# Повтор безопасен: offer_slots предлагает только свободный непридержанный слот
+# и не предлагает его жильцу дважды
+@events.subscriber(events.SpotCreated, events.SlotsAdded, events.SlotFreed, replay=True)
+async def offer_slots_to_waitlist(bot, event):
+    """Новые и освободившиеся слоты - очереди подписчиков"""
+    slot_ids = [event.slot_id] if isinstance(event, events.SlotFreed) else event.slot_ids
+    await send_offers(bot, await db.write(db.offer_slots, slot_ids))
+
+
+async def _get_own_offer(callback: CallbackQuery, prefix: str):
+    """Действующее предложение автора нажатия и сам автор (иначе - ответ и None)"""
+    offer = db.get_slot_offer(int(callback.data.replace(prefix, "")))
+    user = db.get_user_by_telegram_id(callback.from_user.id)
+    if not offer or not user or offer['user_id'] != user['id']:
+        await callback.answer("❌ Предложение не найдено", show_alert=True)
+        return None, None
+    if offer['status'] != 'offered':
+        text = "✅ Место уже забронировано" if offer['status'] == 'accepted' else "⌛ Предложение закрыто"
+        await callback.answer(text, show_alert=True)
+        return None, None
+    return offer, user
+
+
+@router.callback_query(F.data.startswith("offer_book_"))
+async def offer_book(callback: CallbackQuery, state: FSMContext):
+    offer, user = await _get_own_offer(callback, "offer_book_")
+    if not offer:
+        return
+    
+    slot = db.get_availability_by_id(offer['availability_id'])
+    if not slot or slot['is_booked']:
+        await callback.answer("❌ Слот больше не доступен", show_alert=True)
+        return
+    if db.get_active_bookings_count(user['id']) >= MAX_ACTIVE_BOOKINGS:
+        await callback.answer(f"❌ Лимит {MAX_ACTIVE_BOOKINGS} бронирований", show_alert=True)
+        return
+    
+    await state.clear()
+    await state.update_data(user_id=user['id'])
+    await show_booking_confirmation(callback, state, slot)
+
+
+@router.callback_query(F.data.startswith("offer_decline_"))
+async def offer_decline(callback: CallbackQuery, state: FSMContext):
+    offer, user = await _get_own_offer(callback, "offer_decline_")
+    if not offer:
+        return
+    
+    offers = await db.write(db.decline_offer, offer['id'], user['id'])
+    if offers is None:
+        await callback.answer("⌛ Предложение закрыто", show_alert=True)
+        return
+    await callback.message.edit_text("👌 Место передано следующему в очереди. Подписка остаётся активной.")
+    await send_offers(callback.bot, offers)
+
+
 # ==================== MY SPOTS ====================
 
+def is_own_spot(spot: Optional[Dict[str, Any]], telegram_id: int) -> bool:
+    """Место существует, не скрыто и принадлежит жильцу с этим telegram_id"""
+    user = db.get_user_by_telegram_id(telegram_id)
+    return bool(spot and spot['is_available'] and user and spot['supplier_id'] == user['id'])
+
+
+async def get_own_spot(callback: CallbackQuery, spot_id: int) -> Optional[Dict[str, Any]]:
+    """Место из callback_data, если оно принадлежит нажавшему"""
+    spot = db.get_spot_by_id(spot_id)
+    if not is_own_spot(spot, callback.from_user.id):
+        await callback.answer("❌ Место не найдено", show_alert=True)
+        return None
+    return spot
+
+
 @router.message(F.text == "🏠 Мои места")
 async def show_my_spots(message: Message, state: FSMContext):
     user = db.get_user_by_telegram_id(message.from_user.id)
@@ -869,7 +1209,7 @@ async def show_spot_details(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("delete_spot_"))
 async def delete_spot(callback: CallbackQuery, state: FSMContext):
     spot_id = int(callback.data.replace("delete_spot_", ""))
-    db.delete_spot(spot_id)
+    await db.write(db.delete_spot, spot_id)
     await callback.answer("✅ Место удалено")
     
     user = db.get_user_by_telegram_id(callback.from_user.id)
@@ -881,6 +1221,19 @@ async def delete_spot(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_text(f"🏠 <b>Мои места</b>\n\nВсего: {len(spots)}", reply_markup=get_user_spots_keyboard(spots), parse_mode="HTML")
 
 
+@router.callback_query(F.data == "my_heatmap")
+async def show_my_heatmap(callback: CallbackQuery, state: FSMContext):
+    user = db.get_user_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Сначала зарегистрируйтесь: /start", show_alert=True)
+        return
+    # Чтение истории и расчёт - в потоке; to_thread переносит контекст с ЖК апдейта
+    text = await asyncio.to_thread(occupancy.heatmap_report, "Загрузка моих мест",
+                                   *occupancy.recent_period(), supplier_id=user['id'])
+    await callback.message.answer(text, parse_mode="HTML")
+    await callback.answer()
+
+
 @router.callback_query(F.data == "my_spots")
 async def back_to_my_spots(callback: CallbackQuery, state: FSMContext):
     user = db.get_user_by_telegram_id(callback.from_user.id)
@@ -935,16 +1288,29 @@ async def show_booking_details(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("cancel_booking_"))
 async def cancel_booking_handler(callback: CallbackQuery, state: FSMContext):
     booking_id = int(callback.data.replace("cancel_booking_", ""))
-    db.cancel_booking(booking_id)
-    await callback.answer("✅ Бронирование отменено")
-    
     user = db.get_user_by_telegram_id(callback.from_user.id)
+    booking = db.get_booking_by_id(booking_id)
+    if not user or not booking or booking['customer_id'] != user['id']:
+        await callback.answer("❌ Бронирование не найдено", show_alert=True)
+        return
+    
+    booking = await db.write(db.cancel_booking, booking_id)
+    if booking:
+        await callback.answer("✅ Бронирование отменено")
+    else:
+        await callback.answer("❌ Бронирование уже не действует", show_alert=True)
+    
     bookings = db.get_user_bookings(user['id'])
     
     if not bookings:
         await callback.message.edit_text("📋 <b>Мои бронирования</b>\n\nНет бронирований.", parse_mode="HTML")
     else:
         await callback.message.edit_text(f"📋 <b>Мои бронирования</b>\n\nВсего: {len(bookings)}", reply_markup=get_user_bookings_keyboard(bookings), parse_mode="HTML")
+    
+    if booking:
+        await events.publish(callback.bot, events.BookingCancelled(
+            booking['id'], booking['customer_id'], booking['spot_id'], booking['availability_id'], 'customer'))
+        await events.publish(callback.bot, events.SlotFreed(booking['availability_id']))
 
 
 @router.callback_query(F.data == "my_bookings")
@@ -1019,7 +1385,7 @@ async def process_edit_name(message: Message, state: FSMContext):
         return
     
     user = db.get_user_by_telegram_id(message.from_user.id)
-    db.update_user(user['id'], full_name=result)
+    await db.write(db.update_user, user['id'], full_name=result)
     
     await state.clear()
     await message.answer(f"✅ Имя изменено на: <b>{result}</b>", parse_mode="HTML")
@@ -1044,7 +1410,7 @@ async def process_edit_phone(message: Message, state: FSMContext):
         return
     
     user = db.get_user_by_telegram_id(message.from_user.id)
-    db.update_user(user['id'], phone=result)
+    await db.write(db.update_user, user['id'], phone=result)
     
     await state.clear()
     await message.answer(f"✅ Телефон изменён на: <b>{result}</b>", parse_mode="HTML")
@@ -1082,7 +1448,7 @@ async def process_edit_bank(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     
     user = db.get_user_by_telegram_id(callback.from_user.id)
-    db.update_user(user['id'], card_number=data['new_card'], bank=bank)
+    await db.write(db.update_user, user['id'], card_number=data['new_card'], bank=bank)
     
     await state.clear()
     await callback.message.edit_text(f"✅ Карта изменена!\n\n💳 {mask_card(data['new_card'])}\n🏦 {bank}", parse_mode="HTML")
@@ -1259,7 +1625,7 @@ async def process_slot_end_time(callback: CallbackQuery, state: FSMContext):
         return
     
     # Создаём слот
-    db.create_spot_availability(data['spot_id'], start_dt, end_dt)
+    slot_id = await db.write(db.create_spot_availability, data['spot_id'], start_dt, end_dt)
     
     spot = db.get_spot_by_id(data['spot_id'])
     
@@ -1271,16 +1637,7 @@ async def process_slot_end_time(callback: CallbackQuery, state: FSMContext):
         parse_mode="HTML"
     )
     
-    # Проверяем уведомления
-    spot_data = {
-        'spot_number': spot['spot_number'],
-        'start_date': data['start_date'],
-        'start_time': data['start_time'],
-        'end_date': data['end_date'],
-        'end_time': time_value,
-        'price_per_hour': spot['price_per_hour']
-    }
-    await check_and_send_notifications(callback.bot, data['spot_id'], start_dt, end_dt, spot_data)
+    await events.publish(callback.bot, events.SlotsAdded([slot_id]))
     
     user = db.get_user_by_telegram_id(callback.from_user.id)
     is_admin = user and user['role'] == 'admin'
@@ -1306,7 +1663,7 @@ async def process_slot_end_time_manual(message: Message, state: FSMContext):
         await message.answer("❌ Время окончания должно быть позже")
         return
     
-    db.create_spot_availability(data['spot_id'], start_dt, end_dt)
+    slot_id = await db.write(db.create_spot_availability, data['spot_id'], start_dt, end_dt)
     spot = db.get_spot_by_id(data['spot_id'])
     
     await state.clear()
@@ -1317,21 +1674,366 @@ async def process_slot_end_time_manual(message: Message, state: FSMContext):
         parse_mode="HTML"
     )
     
-    spot_data = {
-        'spot_number': spot['spot_number'],
-        'start_date': data['start_date'],
-        'start_time': data['start_time'],
-        'end_date': data['end_date'],
-        'end_time': result,
-        'price_per_hour': spot['price_per_hour']
-    }
-    await check_and_send_notifications(message.bot, data['spot_id'], start_dt, end_dt, spot_data)
+    await events.publish(message.bot, events.SlotsAdded([slot_id]))
     
     user = db.get_user_by_telegram_id(message.from_user.id)
     is_admin = user and user['role'] == 'admin'
     await message.answer("Выберите действие:", reply_markup=get_main_menu_keyboard(is_admin))
 
 
+# ==================== BULK SLOTS ====================
+
+class BulkSlotStates(StatesGroup):
+    waiting_intervals = State()
+
+
+@router.callback_query(F.data.startswith("bulk_slots_"))
+async def bulk_slots_start(callback: CallbackQuery, state: FSMContext):
+    spot = await get_own_spot(callback, int(callback.data.replace("bulk_slots_", "")))
+    if not spot:
+        return
+    await state.update_data(spot_id=spot['id'])
+    await callback.message.edit_text(
+        "🗂 <b>Несколько слотов</b>\n\n"
+        "Отправьте интервалы, по одному на строку:\n"
+        "<code>ДД.ММ.ГГГГ ЧЧ:ММ-ЧЧ:ММ</code> - окончание раньше начала означает следующий день\n"
+        "<code>ДД.ММ.ГГГГ ЧЧ:ММ - ДД.ММ.ГГГГ ЧЧ:ММ</code>\n\n"
+        f"Не больше {MAX_BULK_SLOTS} строк. Пересекающиеся интервалы будут объединены.",
+        parse_mode="HTML"
+    )
+    await state.set_state(BulkSlotStates.waiting_intervals)
+    await callback.answer()
+
+
+@router.message(BulkSlotStates.waiting_intervals)
+async def process_bulk_slots(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+
+    intervals, errors = parse_intervals(message.text or "")
+    if errors:
+        shown = "\n".join(html.escape(line) for line in errors[:5])
+        more = f"\n… и ещё {len(errors) - 5}" if len(errors) > 5 else ""
+        await message.answer(
+            f"❌ Не удалось разобрать строки (или интервал уже прошёл):\n{shown}{more}\n\n"
+            f"Исправьте и отправьте список целиком.",
+            parse_mode="HTML"
+        )
+        return
+    if not intervals:
+        await message.answer("❌ Список пуст")
+        return
+    if len(intervals) > MAX_BULK_SLOTS:
+        await message.answer(f"❌ Слишком много интервалов: {len(intervals)} (не больше {MAX_BULK_SLOTS})")
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    spot = db.get_spot_by_id(data.get('spot_id', 0))
+    # Место могли скрыть, пока жилец вводил интервалы
+    if not is_own_spot(spot, message.from_user.id):
+        await message.answer("❌ Место не найдено")
+        return
+    result = await db.write(db.create_spot_availabilities, spot['id'], intervals)
+
+    text = f"✅ <b>Слотов добавлено: {len(result['slots'])}</b>\n\n🏠 Место: {spot['spot_number']}"
+    for slot in result['slots'][:10]:
+        start, end = datetime.fromisoformat(slot['start_time']), datetime.fromisoformat(slot['end_time'])
+        text += f"\n🟢 {format_datetime(start)} - {format_datetime(end)}"
+    if len(result['slots']) > 10:
+        text += f"\n… и ещё {len(result['slots']) - 10}"
+    if result['merged']:
+        text += f"\n\n🔗 Объединено пересекающихся интервалов: {result['merged']}"
+    if result['existing']:
+        text += f"\n♻️ Уже были добавлены: {result['existing']}"
+    await message.answer(text, parse_mode="HTML")
+
+    if result['slots']:
+        await events.publish(message.bot, events.SlotsAdded([slot['id'] for slot in result['slots']]))
+
+    user = db.get_user_by_telegram_id(message.from_user.id)
+    is_admin = user and user['role'] == 'admin'
+    await message.answer("Выберите действие:", reply_markup=get_main_menu_keyboard(is_admin))
+
+
+# ==================== SCHEDULES ====================
+
+class ScheduleStates(StatesGroup):
+    waiting_days = State()
+    waiting_start_time = State()
+    waiting_end_time = State()
+    waiting_until = State()
+    waiting_exception = State()
+
+
+def format_rule(rule: Dict[str, Any]) -> str:
+    """Строка расписания: дни, время, срок и ближайшие исключения"""
+    end = rule['end_time'] + (" (след. день)" if rule['end_time'] <= rule['start_time'] else "")
+    text = f"{format_weekdays(rule['weekdays'])} {rule['start_time']}–{end}"
+    if rule['valid_until']:
+        text += f", до {datetime.strptime(rule['valid_until'], '%Y-%m-%d').strftime('%d.%m.%Y')}"
+    if rule.get('exceptions'):
+        days = [datetime.strptime(day, '%Y-%m-%d').strftime('%d.%m') for day in rule['exceptions'][:5]]
+        text += f"\n    🚫 кроме {', '.join(days)}" + (" …" if len(rule['exceptions']) > 5 else "")
+    return text
+
+
+def build_rules_page(spot: Dict[str, Any]):
+    """Текст и клавиатура расписаний места"""
+    rules = db.get_spot_rules(spot['id'])
+    text = f"🔁 <b>Расписание места {spot['spot_number']}</b>\n\n"
+    if rules:
+        text += "\n".join(f"{i}. {format_rule(rule)}" for i, rule in enumerate(rules, 1))
+        text += f"\n\nСлоты создаются автоматически на {RULE_HORIZON_DAYS} дней вперёд."
+    else:
+        text += "Расписаний нет. Добавьте, если место свободно регулярно - например, по будням 08:00–19:00."
+    return text, get_spot_rules_keyboard(spot['id'], rules, can_add=len(rules) < MAX_RULES_PER_SPOT)
+
+
+async def get_own_rule(callback: CallbackQuery, prefix: str) -> Optional[Dict[str, Any]]:
+    """Расписание из callback_data, если оно принадлежит нажавшему"""
+    rule = db.get_availability_rule(int(callback.data.replace(prefix, "")))
+    user = db.get_user_by_telegram_id(callback.from_user.id)
+    if not rule or not rule['is_active'] or not user or rule['supplier_id'] != user['id']:
+        await callback.answer("❌ Расписание не найдено", show_alert=True)
+        return None
+    return rule
+
+
+@router.callback_query(F.data.startswith("rules_"))
+async def show_spot_rules(callback: CallbackQuery, state: FSMContext):
+    spot = await get_own_spot(callback, int(callback.data.replace("rules_", "")))
+    if not spot:
+        return
+    text, markup = build_rules_page(spot)
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("rule_new_"))
+async def rule_new_start(callback: CallbackQuery, state: FSMContext):
+    spot = await get_own_spot(callback, int(callback.data.replace("rule_new_", "")))
+    if not spot:
+        return
+    if len(db.get_spot_rules(spot['id'])) >= MAX_RULES_PER_SPOT:
+        await callback.answer(f"❌ Не больше {MAX_RULES_PER_SPOT} расписаний на место", show_alert=True)
+        return
+
+    await state.update_data(spot_id=spot['id'], rule_days=WORKDAYS)
+    await callback.message.edit_text(
+        "🔁 <b>Новое расписание</b>\n\nВыберите дни недели, когда место свободно:",
+        reply_markup=get_rule_weekdays_keyboard(WORKDAYS),
+        parse_mode="HTML"
+    )
+    await state.set_state(ScheduleStates.waiting_days)
+
+
+@router.callback_query(ScheduleStates.waiting_days, F.data.startswith("rule_day"))
+async def process_rule_days(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    mask = data['rule_days']
+
+    if callback.data == "rule_days_done":
+        if not mask:
+            await callback.answer("❌ Выберите хотя бы один день", show_alert=True)
+            return
+        await callback.message.edit_text(
+            f"📅 {format_weekdays(mask)}\n\n⏰ Выберите время начала:",
+            reply_markup=get_time_slots_keyboard("rule_start_time")
+        )
+        await state.set_state(ScheduleStates.waiting_start_time)
+        return
+
+    if callback.data.startswith("rule_days_"):
+        new_mask = int(callback.data.replace("rule_days_", ""))
+    else:
+        new_mask = mask ^ (1 << int(callback.data.replace("rule_day_", "")))
+    await state.update_data(rule_days=new_mask)
+    if new_mask != mask:
+        await callback.message.edit_reply_markup(reply_markup=get_rule_weekdays_keyboard(new_mask))
+    await callback.answer()
+
+
+async def ask_rule_end_time(message: Message, state: FSMContext, start_time: str, edit: bool = False):
+    await state.update_data(rule_start_time=start_time)
+    text = f"⏰ Начало: {start_time}\n\nВыберите время окончания (раньше начала - на следующий день):"
+    markup = get_time_slots_keyboard("rule_end_time")
+    if edit:
+        await message.edit_text(text, reply_markup=markup)
+    else:
+        await message.answer(text, reply_markup=markup)
+    await state.set_state(ScheduleStates.waiting_end_time)
+
+
+async def ask_rule_until(message: Message, state: FSMContext, end_time: str, edit: bool = False):
+    data = await state.get_data()
+    if end_time == data['rule_start_time']:
+        await message.answer("❌ Время окончания должно отличаться от времени начала")
+        return
+    await state.update_data(rule_end_time=end_time)
+    text = "📅 До какой даты действует расписание?\n\nВведите дату в формате <b>ДД.ММ.ГГГГ</b> или нажмите кнопку:"
+    if edit:
+        await message.edit_text(text, reply_markup=get_rule_until_keyboard(), parse_mode="HTML")
+    else:
+        await message.answer(text, reply_markup=get_rule_until_keyboard(), parse_mode="HTML")
+    await state.set_state(ScheduleStates.waiting_until)
+
+
+@router.callback_query(ScheduleStates.waiting_start_time, F.data.startswith("rule_start_time_"))
+async def process_rule_start_time(callback: CallbackQuery, state: FSMContext):
+    time_value = callback.data.replace("rule_start_time_", "")
+    if time_value == "manual":
+        await callback.message.edit_text("⏰ Введите время в формате <b>ЧЧ:ММ</b>:", parse_mode="HTML")
+        return
+    await ask_rule_end_time(callback.message, state, time_value, edit=True)
+
+
+@router.message(ScheduleStates.waiting_start_time)
+async def process_rule_start_time_manual(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+
+    is_valid, result = validate_time(message.text or "")
+    if not is_valid:
+        await message.answer("❌ Неверный формат")
+        return
+    await ask_rule_end_time(message, state, result)
+
+
+@router.callback_query(ScheduleStates.waiting_end_time, F.data.startswith("rule_end_time_"))
+async def process_rule_end_time(callback: CallbackQuery, state: FSMContext):
+    time_value = callback.data.replace("rule_end_time_", "")
+    if time_value == "manual":
+        await callback.message.edit_text("⏰ Введите время в формате <b>ЧЧ:ММ</b>:", parse_mode="HTML")
+        return
+    await ask_rule_until(callback.message, state, time_value, edit=True)
+    await callback.answer()
+
+
+@router.message(ScheduleStates.waiting_end_time)
+async def process_rule_end_time_manual(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+
+    is_valid, result = validate_time(message.text or "")
+    if not is_valid:
+        await message.answer("❌ Неверный формат")
+        return
+    await ask_rule_until(message, state, result)
+
+
+async def create_rule(message: Message, state: FSMContext, valid_until: str = None):
+    """Сохранить расписание из данных FSM и сразу создать слоты на горизонт"""
+    data = await state.get_data()
+    await state.clear()
+    if not is_own_spot(db.get_spot_by_id(data.get('spot_id', 0)), message.chat.id):
+        await message.answer("❌ Место не найдено")
+        return
+
+    today = datetime.now()
+    rule_id = await db.write(db.create_availability_rule,
+        data['spot_id'], data['rule_days'], data['rule_start_time'], data['rule_end_time'],
+        today.strftime("%Y-%m-%d"), valid_until
+    )
+    horizon = (today + timedelta(days=RULE_HORIZON_DAYS)).strftime("%Y-%m-%d")
+    slots = await db.write(db.materialize_rules, horizon, rule_id=rule_id)
+    rule = db.get_availability_rule(rule_id)
+
+    await message.answer(
+        f"✅ <b>Расписание добавлено!</b>\n\n"
+        f"🏠 Место: {rule['spot_number']}\n"
+        f"🔁 {format_rule(rule)}\n\n"
+        f"Слотов на ближайшие {RULE_HORIZON_DAYS} дней: {len(slots)}. Дальше они появляются автоматически.",
+        parse_mode="HTML"
+    )
+    if slots:
+        await events.publish(message.bot, events.SlotsAdded([slot['id'] for slot in slots]))
+
+    user = db.get_user_by_telegram_id(message.chat.id)
+    is_admin = user and user['role'] == 'admin'
+    await message.answer("Выберите действие:", reply_markup=get_main_menu_keyboard(is_admin))
+
+
+@router.callback_query(ScheduleStates.waiting_until, F.data == "rule_until_none")
+async def process_rule_until_none(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await create_rule(callback.message, state)
+    await callback.answer()
+
+
+@router.message(ScheduleStates.waiting_until)
+async def process_rule_until(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+
+    is_valid, parsed = validate_date(message.text or "")
+    if not is_valid:
+        await message.answer("❌ Неверная дата (ДД.ММ.ГГГГ, не раньше сегодняшней)")
+        return
+    await create_rule(message, state, parsed.strftime("%Y-%m-%d"))
+
+
+@router.callback_query(F.data.startswith("rule_skip_"))
+async def rule_exception_start(callback: CallbackQuery, state: FSMContext):
+    rule = await get_own_rule(callback, "rule_skip_")
+    if not rule:
+        return
+    await state.update_data(rule_id=rule['id'])
+    await callback.message.edit_text(
+        f"🚫 <b>Исключение из расписания</b>\n{format_rule(rule)}\n\n"
+        f"Введите дату, когда место будет занято, в формате <b>ДД.ММ.ГГГГ</b> "
+        f"(можно несколько через запятую):",
+        parse_mode="HTML"
+    )
+    await state.set_state(ScheduleStates.waiting_exception)
+    await callback.answer()
+
+
+@router.message(ScheduleStates.waiting_exception)
+async def process_rule_exception(message: Message, state: FSMContext):
+    if message.text in ["❌ Отмена", "🔙 Главное меню"]:
+        await cancel_action(message, state)
+        return
+
+    days = []
+    for part in (message.text or "").replace(";", ",").split(","):
+        is_valid, parsed = validate_date(part.strip())
+        if not is_valid:
+            await message.answer(f"❌ Неверная дата: {part.strip() or '—'} (ДД.ММ.ГГГГ, не раньше сегодняшней)")
+            return
+        days.append(parsed)
+
+    data = await state.get_data()
+    await state.clear()
+    booked = []
+    for day in days:
+        result = await db.write(db.add_rule_exception, data['rule_id'], day.strftime("%Y-%m-%d"))
+        if result['booked']:
+            booked.append(day.strftime("%d.%m.%Y"))
+
+    text = "✅ Исключения добавлены: " + ", ".join(day.strftime("%d.%m.%Y") for day in days)
+    if booked:
+        text += f"\n\n⚠️ На {', '.join(booked)} место уже забронировано - бронь остаётся в силе."
+    user = db.get_user_by_telegram_id(message.from_user.id)
+    is_admin = user and user['role'] == 'admin'
+    await message.answer(text, reply_markup=get_main_menu_keyboard(is_admin))
+
+
+@router.callback_query(F.data.startswith("rule_del_"))
+async def delete_rule(callback: CallbackQuery, state: FSMContext):
+    rule = await get_own_rule(callback, "rule_del_")
+    if not rule:
+        return
+    removed = await db.write(db.delete_availability_rule, rule['id'])
+    await callback.answer(f"✅ Расписание удалено, свободных слотов снято: {removed}")
+
+    text, markup = build_rules_page(db.get_spot_by_id(rule['spot_id']))
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+
 # ==================== SPOT BOOKINGS (for supplier) ====================
 
 @router.callback_query(F.data.startswith("spot_bookings_"))
@@ -1344,17 +2046,7 @@ async def show_spot_bookings(callback: CallbackQuery, state: FSMContext):
         return
     
     # Получаем бронирования этого места
-    bookings = []
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT b.*, u.full_name as customer_name, u.phone as customer_phone
-            FROM bookings b
-            JOIN users u ON b.customer_id = u.id
-            WHERE b.spot_id = ? AND b.status IN ('pending', 'confirmed')
-            ORDER BY b.start_time ASC
-        ''', (spot_id,))
-        bookings = [dict(row) for row in cursor.fetchall()]
+    bookings = db.get_spot_active_bookings(spot_id)
     
     if not bookings:
         await callback.message.edit_text(
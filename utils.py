@@ -3,13 +3,20 @@
 """
 import re
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 # Регулярные выражения для валидации
 PHONE_REGEX = r'^(\+7|7|8)?[\s\-]?\(?[489][0-9]{2}\)?[\s\-]?[0-9]{3}[\s\-]?[0-9]{2}[\s\-]?[0-9]{2}$'
 CARD_REGEX = r'^[0-9]{16}$'
 DATE_REGEX = r'^(0[1-9]|[12][0-9]|3[01])\.(0[1-9]|1[0-2])\.(20[2-9][0-9])$'
 TIME_REGEX = r'^([01][0-9]|2[0-3]):([0-5][0-9])$'
+# Интервал списка слотов: "ДД.ММ.ГГГГ ЧЧ:ММ-ЧЧ:ММ" или "ДД.ММ.ГГГГ ЧЧ:ММ - ДД.ММ.ГГГГ ЧЧ:ММ"
+INTERVAL_REGEX = r'^(\d{2}\.\d{2}\.\d{4})\s+(\d{1,2}:\d{2})\s*[-–—]\s*(?:(\d{2}\.\d{2}\.\d{4})\s+)?(\d{1,2}:\d{2})$'
+
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+# Маски дней недели расписаний (бит 0 - понедельник)
+EVERY_DAY = 0b1111111
+WORKDAYS = 0b0011111
 
 
 def validate_name(name: str) -> Tuple[bool, str]:
@@ -142,6 +149,72 @@ def parse_datetime(date_str: str, time_str: str) -> Optional[datetime]:
         return None
 
 
+def parse_intervals(text: str) -> Tuple[List[Tuple[datetime, datetime]], List[str]]:
+    """Список интервалов по строкам -> (интервалы, строки с ошибкой)
+    
+    Без даты окончания слот заканчивается в тот же день, а если время
+    окончания не позже начала - на следующий. Прошедшие интервалы - ошибка.
+    """
+    intervals, errors = [], []
+    now = datetime.now()
+    for line in re.split(r'[\n;]', text):
+        line = line.strip()
+        if not line:
+            continue
+        match = re.match(INTERVAL_REGEX, line)
+        try:
+            start_date, start_time, end_date, end_time = match.groups()
+            start = datetime.strptime(f"{start_date} {start_time}", "%d.%m.%Y %H:%M")
+            end = datetime.strptime(f"{end_date or start_date} {end_time}", "%d.%m.%Y %H:%M")
+        except (AttributeError, ValueError):
+            errors.append(line)
+            continue
+        if end_date is None and end <= start:
+            end += timedelta(days=1)
+        if end <= start or end <= now:
+            errors.append(line)
+            continue
+        intervals.append((start, end))
+    return intervals, errors
+
+
+def validate_time_window(window_str: str) -> Tuple[bool, Optional[Tuple[str, str]]]:
+    """Валидация окна времени ЧЧ:ММ-ЧЧ:ММ"""
+    parts = [part.strip() for part in re.split(r'[-–—]', window_str.strip())]
+    if len(parts) != 2 or not all(re.match(TIME_REGEX, part) for part in parts):
+        return False, None
+    if parts[0] >= parts[1]:
+        return False, None
+    return True, (parts[0], parts[1])
+
+
+def format_slot_cursor(key: tuple) -> str:
+    """Курсор страницы поиска для callback_data из database.slot_sort_key"""
+    parts = []
+    for value in key:
+        if isinstance(value, str):
+            # Время 'YYYY-MM-DD HH:MM:SS' -> YYYYmmddHHMMSS: callback_data не длиннее 64 байт
+            value = datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime("%Y%m%d%H%M%S")
+        parts.append(str(value))
+    return '_'.join(parts)
+
+
+def parse_slot_cursor(cursor: str) -> Optional[tuple]:
+    """Разбор курсора обратно в ключ сортировки для get_available_slots"""
+    key = []
+    try:
+        for part in cursor.split('_'):
+            if len(part) == 14 and part.isdigit():
+                key.append(datetime.strptime(part, "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S"))
+            elif '.' in part:
+                key.append(float(part))
+            else:
+                key.append(int(part))
+    except ValueError:
+        return None
+    return tuple(key)
+
+
 def get_next_days(count: int = 6) -> list:
     """Получить список ближайших дней"""
     today = datetime.now()
@@ -177,5 +250,25 @@ def mask_card(card_number: str) -> str:
 
 def get_weekday_name(dt: datetime) -> str:
     """Получить название дня недели"""
-    days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    return days[dt.weekday()]
+    return WEEKDAY_NAMES[dt.weekday()]
+
+
+def format_weekdays(mask: int) -> str:
+    """Маска дней недели -> 'ежедневно', 'Пн–Пт', 'Пн, Ср–Пт'"""
+    if mask == EVERY_DAY:
+        return "ежедневно"
+    runs = []
+    day = 0
+    while day < 7:
+        if mask >> day & 1:
+            end = day
+            while end + 1 < 7 and mask >> (end + 1) & 1:
+                end += 1
+            # Два соседних дня - через запятую, от трёх - диапазоном
+            if end - day >= 2:
+                runs.append(f"{WEEKDAY_NAMES[day]}–{WEEKDAY_NAMES[end]}")
+            else:
+                runs.extend(WEEKDAY_NAMES[day:end + 1])
+            day = end
+        day += 1
+    return ", ".join(runs)
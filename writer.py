@@ -0,0 +1,131 @@
+"""
+Поток записи ParkingBot: одна очередь и одно соединение на файл базы
+
+SQLite пускает в базу одного писателя, поэтому все записи database.py идут
+через поток записи этой базы. Поток забирает из очереди всё, что накопилось
+(до WRITE_BATCH_MAX операций), и выполняет пачкой в одной транзакции: каждая
+операция - в своём SAVEPOINT, чтобы её ошибка не откатывала соседние, и один
+COMMIT на пачку (group commit). Пока идёт COMMIT, очередь набирает следующую
+пачку. Результат или исключение операции вызывающий получает через Future -
+только после COMMIT, когда запись уже видна читающим соединениям.
+"""
+import contextvars
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+import metrics
+from config import METRICS_ENABLED, WRITE_BATCH_MAX
+
+logger = logging.getLogger(__name__)
+
+# Соединение пачки, которую сейчас выполняет поток записи
+_state = threading.local()
+
+
+def current_connection() -> Optional[sqlite3.Connection]:
+    """Соединение транзакции записи, если код выполняется внутри операции записи"""
+    return getattr(_state, 'conn', None)
+
+
+class WriteOp:
+    """Операция в очереди: функция с аргументами, контекст вызывающего и Future"""
+
+    __slots__ = ('func', 'args', 'kwargs', 'context', 'future')
+
+    def __init__(self, func: Callable[..., Any], args: tuple, kwargs: dict):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        # contextvars вызывающего (текущий ЖК) - операция выполняется в нём
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+
+
+class GroupCommitWriter:
+    """Поток записи одной базы"""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], name: str,
+                 max_batch: int = WRITE_BATCH_MAX):
+        self.connect = connect
+        self.name = name
+        self.max_batch = max_batch
+        self.batches = 0
+        self.ops = 0
+        self._queue: "queue.SimpleQueue[Optional[WriteOp]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=f"writer-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Поставить операцию в очередь; Future завершится после COMMIT её пачки"""
+        op = WriteOp(func, args, kwargs)
+        self._queue.put(op)
+        return op.future
+
+    def stop(self, timeout: float = None):
+        """Дописать очередь и остановить поток"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        conn = self.connect()
+        # Транзакции открывает и закрывает сам поток, а не модуль sqlite3
+        conn.isolation_level = None
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                batch = [op for op in batch if op is not None and op.future.set_running_or_notify_cancel()]
+                if batch:
+                    self._commit(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[WriteOp]):
+        outcomes = []
+        _state.conn = conn
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for op in batch:
+                conn.execute('SAVEPOINT op')
+                try:
+                    result = op.context.run(op.func, *op.args, **op.kwargs)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO op')
+                    conn.execute('RELEASE op')
+                    logger.error(f"Database error: {e}")
+                    outcomes.append((op, False, e))
+                else:
+                    conn.execute('RELEASE op')
+                    outcomes.append((op, True, result))
+            conn.execute('COMMIT')
+        except Exception as e:
+            # Не удалось начать или закончить транзакцию - не записана вся пачка
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logger.error(f"Write batch of {len(batch)} failed ({self.name}): {e}")
+            for op in batch:
+                op.future.set_exception(e)
+            return
+        finally:
+            _state.conn = None
+
+        self.batches += 1
+        self.ops += len(batch)
+        if METRICS_ENABLED:
+            metrics.write_batch.observe((self.name,), len(batch))
+        for op, ok, value in outcomes:
+            if ok:
+                op.future.set_result(value)
+            else:
+                op.future.set_exception(value)